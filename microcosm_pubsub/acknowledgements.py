@@ -0,0 +1,228 @@
+"""
+Buffered message acknowledgements.
+
+SQS accepts up to ten entries per `DeleteMessageBatch` and `ChangeMessageVisibilityBatch`
+call. Rather than deleting (or changing the visibility of) each message as soon as it is
+handled, acknowledgements can be buffered for the duration of a batch and flushed in as
+few requests as possible.
+
+Buffered acknowledgements are flushed when:
+ -  the buffer holds a full batch of entries
+ -  the oldest buffered entry has waited for the configured flush timeout
+ -  the buffer is closed (e.g. at the end of `SQSMessageDispatcher.handle_batch`)
+
+"""
+from logging import Logger
+from threading import RLock, Timer
+
+from microcosm_logging.decorators import logger
+
+
+# SQS will not accept more than ten entries per batch request
+MAX_BATCH_ENTRIES = 10
+
+
+@logger
+class AcknowledgementBuffer:
+    """
+    Collect acknowledgements and flush them using SQS batch operations.
+
+    Entries that could not be sent are recorded in `failures` by receipt handle.
+
+    """
+    logger: Logger
+
+    def __init__(self, consumer, flush_timeout_seconds=None, max_attempts=1):
+        self.consumer = consumer
+        self.flush_timeout_seconds = flush_timeout_seconds
+        self.max_attempts = max(max_attempts, 1)
+        self.acks = []
+        self.nacks = []
+        self.failures = dict()
+        self.lock = RLock()
+        self.timer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def ack(self, message):
+        """
+        Buffer a message deletion.
+
+        """
+        with self.lock:
+            self.acks.append(message)
+            if len(self.acks) < MAX_BATCH_ENTRIES:
+                self.start_timer()
+                return
+            acks, self.acks = self.acks, []
+            if not self.nacks:
+                self.cancel_timer()
+
+        self.delete_messages(acks)
+
+    def nack(self, message, visibility_timeout_seconds):
+        """
+        Buffer a message visibility change.
+
+        :param visibility_timeout_seconds: the timeout computed by the backoff policy
+
+        """
+        with self.lock:
+            self.nacks.append((message, visibility_timeout_seconds))
+            if len(self.nacks) < MAX_BATCH_ENTRIES:
+                self.start_timer()
+                return
+            nacks, self.nacks = self.nacks, []
+            if not self.acks:
+                self.cancel_timer()
+
+        self.change_message_visibilities(nacks)
+
+    def flush(self):
+        """
+        Send all buffered acknowledgements.
+
+        """
+        with self.lock:
+            self.cancel_timer()
+            acks, self.acks = self.acks, []
+            nacks, self.nacks = self.nacks, []
+
+        self.delete_messages(acks)
+        self.change_message_visibilities(nacks)
+
+    def failure_for(self, message):
+        """
+        Return the error code of a message's failed acknowledgement, if any.
+
+        """
+        failure = self.failures.get(message.receipt_handle)
+        if failure is None:
+            return None
+        return failure.get("Code", "Unknown")
+
+    def close(self):
+        self.flush()
+
+    def start_timer(self):
+        """
+        Bound the time that the oldest buffered acknowledgement may wait.
+
+        Must be called while holding the lock.
+
+        """
+        if self.timer is not None or not self.flush_timeout_seconds:
+            return
+
+        self.timer = Timer(self.flush_timeout_seconds, self.flush)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def cancel_timer(self):
+        """
+        Must be called while holding the lock.
+
+        """
+        if self.timer is None:
+            return
+
+        self.timer.cancel()
+        self.timer = None
+
+    def delete_messages(self, messages):
+        for offset in range(0, len(messages), MAX_BATCH_ENTRIES):
+            chunk = messages[offset:offset + MAX_BATCH_ENTRIES]
+            self.send_batch(
+                operation=self.consumer.sqs_client.delete_message_batch,
+                entries={
+                    str(index): (
+                        message,
+                        dict(
+                            Id=str(index),
+                            ReceiptHandle=message.receipt_handle,
+                        ),
+                    )
+                    for index, message in enumerate(chunk)
+                },
+            )
+
+    def change_message_visibilities(self, nacks):
+        for offset in range(0, len(nacks), MAX_BATCH_ENTRIES):
+            chunk = nacks[offset:offset + MAX_BATCH_ENTRIES]
+            self.send_batch(
+                operation=self.consumer.sqs_client.change_message_visibility_batch,
+                entries={
+                    str(index): (
+                        message,
+                        dict(
+                            Id=str(index),
+                            ReceiptHandle=message.receipt_handle,
+                            VisibilityTimeout=visibility_timeout_seconds,
+                        ),
+                    )
+                    for index, (message, visibility_timeout_seconds) in enumerate(chunk)
+                },
+            )
+
+    def send_batch(self, operation, entries):
+        """
+        Send a batch request, retrying entries that failed without a sender fault.
+
+        :param operation: an SQS batch operation
+        :param entries: a mapping from entry id to a (message, entry) tuple
+        :returns: a mapping from entry id to a (message, failure) tuple for entries that were not sent
+
+        """
+        failures = dict()
+        pending = entries
+
+        for _ in range(self.max_attempts):
+            try:
+                response = operation(
+                    QueueUrl=self.consumer.sqs_queue_url,
+                    Entries=[entry for _, entry in pending.values()],
+                )
+            except Exception as error:
+                failures.update({
+                    entry_id: (message, dict(Id=entry_id, Code=type(error).__name__, Message=str(error)))
+                    for entry_id, (message, _) in pending.items()
+                })
+                continue
+
+            failed = {
+                failure["Id"]: failure
+                for failure in response.get("Failed", [])
+                if failure.get("Id") in pending
+            }
+            retryable = dict()
+            for entry_id, (message, entry) in pending.items():
+                if entry_id not in failed:
+                    # succeeded, possibly after an earlier attempt failed
+                    failures.pop(entry_id, None)
+                    continue
+
+                failures[entry_id] = (message, failed[entry_id])
+                if not failed[entry_id].get("SenderFault"):
+                    retryable[entry_id] = (message, entry)
+
+            pending = retryable
+            if not pending:
+                break
+
+        for message, failure in failures.values():
+            with self.lock:
+                self.failures[message.receipt_handle] = failure
+            self.logger.warning(
+                "Failed to acknowledge message: {code}",
+                extra=dict(
+                    code=failure.get("Code"),
+                    message_id=message.message_id,
+                    reason=failure.get("Message"),
+                ),
+            )
+
+        return failures
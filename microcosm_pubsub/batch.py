@@ -3,6 +3,7 @@ from marshmallow import Schema, fields
 from microcosm_pubsub.codecs import PubSubMessageSchema
 from microcosm_pubsub.conventions import created
 from microcosm_pubsub.decorators import schema
+from microcosm_pubsub.serialization import dumps
 
 
 class BatchedMessageSchema(Schema):
@@ -27,3 +28,56 @@ class MessageBatchSchema(PubSubMessageSchema):
     MEDIA_TYPE = created("batch_message")
 
     messages = fields.List(fields.Nested(BatchedMessageSchema), required=True)
+
+
+@schema
+class CompactMessageBatchSchema(PubSubMessageSchema):
+    """
+    A message indicating that a batch of messages needs to be published, in a compact format.
+
+    Each entry embeds its message as JSON (instead of as an escaped string) and carries only
+    the opaque data that is not shared by the whole batch:
+
+        {
+            "mediaType": "...",
+            "topicArn": "...",
+            "message": {...},
+            "opaqueData": {...},         # optional
+            "messageAttributes": {...},  # optional; defaults to the media type attribute
+        }
+
+    Entries are not validated on decode.
+
+    """
+    MEDIA_TYPE = created("compact_batch_message")
+
+    messages = fields.Raw(required=True)
+    sharedOpaqueData = fields.Dict(
+        attribute="shared_opaque_data",
+        required=False,
+    )
+
+
+def hoist_opaque_data(opaque_datas):
+    """
+    Compute the opaque data shared by all of the given opaque data dictionaries.
+
+    """
+    opaque_datas = iter(opaque_datas)
+    shared = dict(next(opaque_datas, {}))
+    for opaque_data in opaque_datas:
+        shared = {
+            key: value
+            for key, value in shared.items()
+            if key in opaque_data and opaque_data[key] == value
+        }
+    return shared
+
+
+def splice_raw_json(encoded: str, key: str, raw: str) -> str:
+    """
+    Add an already encoded JSON value to an encoded JSON object (without re-encoding either).
+
+    """
+    separator = "," if encoded != "{}" else ""
+    return f"{encoded[:-1]}{separator}{dumps(key)}:{raw}}}"
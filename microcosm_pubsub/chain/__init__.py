@@ -1,5 +1,6 @@
 from microcosm_pubsub.chain.chain import Chain  # noqa: F401
 from microcosm_pubsub.chain.decorators import binds, extracts  # noqa: F401
+from microcosm_pubsub.chain.parallel import ParallelChain  # noqa: F401
 from microcosm_pubsub.chain.statements import (  # noqa: F401
     assign,
     assign_constant,
@@ -1,6 +1,9 @@
+from functools import partial
+
 from microcosm_pubsub.chain.context import SafeContext
 from microcosm_pubsub.chain.context_decorators import (
     DEFAULT_ASSIGNED,
+    LinkPlan,
     get_from_context,
     save_to_context,
     save_to_context_by_func_name,
@@ -20,6 +23,8 @@ class Chain:
 
         """
         self.links = list(args)
+        self.compiled_links = None
+        self.plans = None
 
     @property
     def context_decorators(self):
@@ -63,17 +68,56 @@ class Chain:
         context = context or self.new_context_type()
         context.update(kwargs)
 
+        return self.run(context)
+
+    def run(self, context):
+        """
+        Resolve the links (in order) against a context
+
+        """
         res = None
 
-        for link in self.links:
-            func = self.apply_decorators(context, link)
-            res = func()
+        for plan in self.compile():
+            res = plan(context)
 
         return res
 
     def __len__(self):
         return len(self.links)
 
+    def compile(self):
+        """
+        Compile each link into a callable that takes the context.
+
+        Links are compiled into `LinkPlan`s once (and again if the links change). Chains that
+        customize their context decorators apply them to every link on every call instead.
+
+        """
+        links = self.links
+        if self.plans is not None and len(links) == len(self.compiled_links) and all(
+            link is compiled_link for link, compiled_link in zip(links, self.compiled_links)
+        ):
+            return self.plans
+
+        if self.uses_default_context_decorators:
+            plans = [LinkPlan(link) for link in links]
+        else:
+            plans = [partial(self.call_decorated, link) for link in links]
+
+        self.compiled_links, self.plans = list(links), plans
+        return plans
+
+    @property
+    def uses_default_context_decorators(self):
+        cls = type(self)
+        return (
+            cls.context_decorators is Chain.context_decorators and
+            cls.context_decorators_assigned is Chain.context_decorators_assigned
+        )
+
+    def call_decorated(self, link, context):
+        return self.apply_decorators(context, link)()
+
     def apply_decorators(self, context, link):
         decorated_link = link
         for decorator in self.context_decorators:
@@ -1,9 +1,13 @@
 from collections.abc import MutableMapping
 from itertools import chain
+from threading import Lock
 
 
 CONTEXT = "context"
 
+# Scopes and snapshots copy at most this many of their parent's own writes (see `FlatSafeContext`)
+MAX_OVERLAY_SIZE = 8
+
 
 class SafeContext(MutableMapping):
     """
@@ -87,3 +91,108 @@ class ScopedSafeContext(SafeContext):
 
     def __len__(self):
         return len(self.store) + len(self.parent)
+
+
+class FlatSafeContext(MutableMapping):
+    """
+    SafeContext that looks up every visible key in at most two dictionaries.
+
+    Keys live in a base dictionary, which is shared with scopes (see `local`) and snapshots and is
+    never written to once shared, and in a small overlay of the context's own writes. Scopes copy
+    only their parent's overlay (a large overlay is first folded into a new base), so creating a
+    scope takes constant (amortized) time and lookups take constant time however deeply scopes
+    are nested.
+
+    Unlike `ScopedSafeContext`, a scope sees its parent as of the scope's creation.
+
+    Writes hold a lock, so concurrent links (see `ParallelChain`) may write to the same context.
+
+    """
+    __slots__ = ("base", "overlay", "lock")
+
+    def __init__(self, *args, **kwargs):
+        self.base = dict()
+        self.overlay = dict(*args, **kwargs)
+        self.lock = Lock()
+
+    def __getitem__(self, key):
+        # enable context self-references
+        if key == CONTEXT:
+            return self
+
+        try:
+            return self.overlay[key]
+        except KeyError:
+            return self.base[key]
+
+    def __setitem__(self, key, value):
+        # do not allow overwrite of context self-references
+        if key == CONTEXT:
+            raise ValueError("May not reassign 'context' key")
+
+        with self.lock:
+            if key in self.overlay or key in self.base:
+                raise ValueError(f"Key '{key}' already set")
+
+            self.overlay[key] = value
+
+    def assign(self, key, value):
+        # do not allow overwrite of context self-references
+        if key == CONTEXT:
+            raise ValueError("May not reassign 'context' key")
+
+        # Skip validation
+        with self.lock:
+            self.overlay[key] = value
+        return self
+
+    def __delitem__(self, key):
+        with self.lock:
+            if key in self.base:
+                # the base may be shared; fold into a copy of it first
+                self.fold()
+                del self.base[key]
+            else:
+                del self.overlay[key]
+
+    def __iter__(self):
+        return iter(dict(self.base, **self.overlay))
+
+    def __len__(self):
+        return len(self.base) + sum(1 for key in self.overlay if key not in self.base)
+
+    def __getattr__(self, key):
+        return self[key]
+
+    def fold(self):
+        """
+        Fold the overlay into a new base.
+
+        Must be called while holding the lock.
+
+        """
+        # NB: readers that miss in the (old) overlay fall back to the (new) base
+        self.base = dict(self.base, **self.overlay)
+        self.overlay = dict()
+
+    def snapshot(self):
+        """
+        Create a copy of the context without copying its base.
+
+        """
+        snapshot = type(self)()
+        with self.lock:
+            if len(self.overlay) > MAX_OVERLAY_SIZE:
+                self.fold()
+            snapshot.base = self.base
+            snapshot.overlay = dict(self.overlay)
+        return snapshot
+
+    def local(self, *args, **kwargs):
+        """
+        Create a locally scoped child context.
+
+        """
+        scope = self.snapshot()
+        scope.overlay.update(*args, **kwargs)
+        return scope
@@ -116,3 +116,72 @@ def temporarily_replace_context_keys(context, func, assigned=DEFAULT_ASSIGNED):
             for old_key, new_key in binds.items():
                 context[old_key] = context.pop(new_key)
     return decorate
+
+
+class LinkPlan:
+    """
+    A chain link with the work of the context decorators precomputed.
+
+    Calling a plan with a context is equivalent to applying `get_from_context`,
+    `temporarily_replace_context_keys`, `save_to_context`, and `save_to_context_by_func_name`
+    to the link and calling the result, but the link is only inspected once.
+
+    """
+    __slots__ = ("func", "positional_args", "binds", "extracts", "extract_name")
+
+    def __init__(self, func):
+        self.func = func
+        # (name, required, default) for each argument taken from the context
+        self.positional_args = tuple(
+            (arg_name, default is Signature.empty, default)
+            for arg_name, default in get_positional_args(func)
+        )
+        self.binds = getattr(func, BINDS, None) or None
+        self.extracts = getattr(func, EXTRACTS, None) or None
+
+        name = getattr(func, "__name__", None)
+        if not hasattr(func, EXTRACTS) and name is not None and name.startswith(EXTRACT_PREFIX):
+            self.extract_name = name[len(EXTRACT_PREFIX):]
+        else:
+            self.extract_name = None
+
+    def __call__(self, context):
+        if self.binds:
+            value = self.call_with_binds(context)
+        else:
+            value = self.call(context)
+
+        if self.extracts:
+            if len(self.extracts) == 1:
+                value = [value]
+            for index, name in enumerate(self.extracts):
+                context[name] = value[index]
+        elif self.extract_name is not None:
+            context[self.extract_name] = value
+
+        return value
+
+    def call(self, context):
+        try:
+            context_kwargs = {
+                arg_name: (context[arg_name] if required else context.get(arg_name, default))
+                for arg_name, required, default in self.positional_args
+            }
+        except KeyError as error:
+            raise ContextKeyNotFound(error, self.func)
+
+        return self.func(**context_kwargs)
+
+    def call_with_binds(self, context):
+        for old_key, new_key in self.binds.items():
+            if old_key not in context:
+                raise KeyError(f"Variable '{old_key}'' not set")
+            if new_key in context:
+                raise ValueError(f"Variable '{new_key}'' already set")
+        try:
+            for old_key, new_key in self.binds.items():
+                context[new_key] = context.pop(old_key)
+            return self.call(context)
+        finally:
+            for old_key, new_key in self.binds.items():
+                context[old_key] = context.pop(new_key)
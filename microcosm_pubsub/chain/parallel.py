@@ -0,0 +1,168 @@
+"""
+Dataflow-parallel chain execution.
+
+Chain links declare their inputs through their argument names and their outputs through
+`@extracts` (or the `extract_` prefix), so the dependencies between links are known statically.
+A `ParallelChain` runs links that do not depend on each other concurrently on a thread pool.
+
+Links that take the whole `context` or that use `@binds` may read or write anything; they
+wait for every earlier link and every later link waits for them.
+
+"""
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextvars import copy_context
+from threading import Lock
+
+from microcosm_pubsub.chain.chain import Chain
+from microcosm_pubsub.chain.context import CONTEXT
+from microcosm_pubsub.chain.context_decorators import LinkPlan
+
+
+DEFAULT_MAX_WORKERS = 4
+
+
+def is_barrier(plan):
+    return (
+        not isinstance(plan, LinkPlan) or
+        plan.binds is not None or
+        any(arg_name == CONTEXT for arg_name, _, _ in plan.positional_args)
+    )
+
+
+def get_writes(plan):
+    if plan.extracts:
+        return plan.extracts
+    if plan.extract_name is not None:
+        return (plan.extract_name,)
+    return ()
+
+
+def compute_dependencies(plans):
+    """
+    Compute the indexes of the links that each link must wait for.
+
+    A link waits for the last earlier link that writes each key it reads. A link that writes a key
+    waits for the earlier links that write or read that key, so that a conflicting write fails
+    (and an optional argument resolves) exactly as it would when running in order.
+
+    """
+    dependencies = []
+    last_barrier = None
+    writers = dict()
+    readers = dict()
+
+    for index, plan in enumerate(plans):
+        if is_barrier(plan):
+            dependencies.append(set(range(index)))
+            last_barrier = index
+            writers.clear()
+            readers.clear()
+            continue
+
+        link_dependencies = set() if last_barrier is None else {last_barrier}
+
+        for arg_name, _, _ in plan.positional_args:
+            if arg_name in writers:
+                link_dependencies.add(writers[arg_name])
+            readers.setdefault(arg_name, []).append(index)
+
+        for key in get_writes(plan):
+            if key in writers:
+                link_dependencies.add(writers[key])
+            link_dependencies.update(readers.pop(key, ()))
+            link_dependencies.discard(index)
+            writers[key] = index
+
+        dependencies.append(link_dependencies)
+
+    return dependencies
+
+
+class ParallelChain(Chain):
+    """
+    Chain that runs independent links concurrently.
+
+    The result is the result of the last link. If links fail, the error raised is the one the chain
+    would have raised when running in order: once a link fails, only earlier links are started and
+    the error of the earliest failed link is raised.
+
+    Chains that customize their context decorators run in order.
+
+    """
+    def __init__(self, *args, max_workers=DEFAULT_MAX_WORKERS):
+        super().__init__(*args)
+        self.max_workers = max_workers
+        self.executor = None
+        self.lock = Lock()
+        self.dependencies = None
+        self.dependencies_plans = None
+
+    def get_executor(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="parallel-chain",
+                )
+            return self.executor
+
+    def get_dependencies(self, plans):
+        if self.dependencies_plans is not plans:
+            self.dependencies = compute_dependencies(plans)
+            self.dependencies_plans = plans
+        return self.dependencies
+
+    def run(self, context):
+        plans = self.compile()
+        if len(plans) < 2 or not self.uses_default_context_decorators:
+            return super().run(context)
+
+        dependencies = self.get_dependencies(plans)
+        dependents = [[] for _ in plans]
+        remaining = [len(link_dependencies) for link_dependencies in dependencies]
+        for index, link_dependencies in enumerate(dependencies):
+            for dependency in link_dependencies:
+                dependents[dependency].append(index)
+
+        results = [None] * len(plans)
+        errors = dict()
+        cutoff = len(plans)
+        running = dict()
+        ready = [index for index, count in enumerate(remaining) if count == 0]
+
+        def complete(index, call):
+            nonlocal cutoff
+            try:
+                results[index] = call()
+            except Exception as error:
+                errors[index] = error
+                cutoff = min(cutoff, index)
+                return
+            for dependent in dependents[index]:
+                remaining[dependent] -= 1
+                if remaining[dependent] == 0:
+                    ready.append(dependent)
+
+        while ready or running:
+            startable = sorted(index for index in ready if index < cutoff)
+            ready.clear()
+
+            if len(startable) == 1 and not running:
+                # nothing to overlap with; avoid the hop to the pool
+                index, = startable
+                complete(index, lambda: plans[index](context))
+                continue
+
+            for index in startable:
+                future = self.get_executor().submit(copy_context().run, plans[index], context)
+                running[future] = index
+
+            if running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in sorted(done, key=running.get):
+                    complete(running.pop(future), future.result)
+
+        if errors:
+            raise errors[cutoff]
+
+        return results[-1]
@@ -3,7 +3,6 @@ Syntactic sugar using existing primitives defined
 
 """
 from microcosm_pubsub.chain import Chain
-from microcosm_pubsub.chain.context import ScopedSafeContext
 
 
 class LocalCallWrapper:
@@ -50,7 +49,7 @@ class LocalCallWrapper:
 
     def __call__(self, context):
         local_kwargs = self._build_local_kwargs(context)
-        self.local_context = ScopedSafeContext(context, **local_kwargs)
+        self.local_context = context.local(**local_kwargs)
         result = self.chain(self.local_context)
         context[self.result_name] = result
         return result
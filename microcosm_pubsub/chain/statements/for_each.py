@@ -1,10 +1,28 @@
 """
 for_each("item").in_("items").do(...)
 
+for_each("item").in_("items").do(...).concurrently(max_workers=8)
+
+for_each("item").in_("items").do(...).reduce(operator.add, 0)
+
+for_each("item").in_("items").do(...).into(sink).in_chunks(500)
+
 """
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from contextvars import copy_context
+from itertools import islice
+from threading import Lock
+
 from microcosm_pubsub.chain import Chain
 
 
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_CHUNK_SIZE = 100
+
+# Marks a reduction without an initial value
+NO_INITIAL = object()
+
+
 def yes(value):
     return True
 
@@ -20,6 +38,14 @@ class ForEachStatement:
         self.chain = None
         self.list_key = list_key or f"{self.key}_list"
         self.filter_func = yes
+        self.max_workers = None
+        self.fail_fast = True
+        self.executor = None
+        self.lock = Lock()
+        self.reducer = None
+        self.initial = NO_INITIAL
+        self.sink = None
+        self.chunk_size = DEFAULT_CHUNK_SIZE
 
     def __str__(self):
         return f"for_{self.key}"
@@ -43,15 +69,125 @@ class ForEachStatement:
         self.chain = Chain.make(*args, **kwargs)
         return self
 
-    def __call__(self, context):
-        values = [
-            self.chain(context.local(**{
-                self.key: item,
-            }))
-            for item in context[self.items]
+    def concurrently(self, max_workers=DEFAULT_MAX_WORKERS, fail_fast=True):
+        """
+        Run the chain for up to `max_workers` items at a time.
+
+        :param fail_fast: once an item fails, do not start the items that are still waiting
+
+        """
+        self.max_workers = max_workers
+        self.fail_fast = fail_fast
+        return self
+
+    def reduce(self, reducer, initial=NO_INITIAL):
+        """
+        Stream the results into `reducer(accumulator, value)` and save only the reduced value.
+
+        As with `functools.reduce`, the first value is the initial accumulator if no initial value
+        is given; without either, the reduced value is None.
+
+        """
+        self.reducer = reducer
+        self.initial = initial
+        return self
+
+    def into(self, sink):
+        """
+        Stream the results (a chunk at a time) into `sink(values)` and save only their count.
+
+        """
+        self.sink = sink
+        return self
+
+    def in_chunks(self, chunk_size):
+        """
+        When streaming, consume this many items at a time.
+
+        """
+        self.chunk_size = chunk_size
+        return self
+
+    def get_executor(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix=str(self),
+                )
+            return self.executor
+
+    def run_concurrently(self, scopes):
+        """
+        Run the chain in each scope on the pool and return the results in order.
+
+        If items fail, the error of the first failed item (in order) is raised once the items
+        that already started have finished.
+
+        """
+        executor = self.get_executor()
+        futures = [
+            executor.submit(copy_context().run, self.chain, scope)
+            for scope in scopes
         ]
 
-        filtered_values = list(filter(self.filter_func, values))
+        if self.fail_fast:
+            _, not_done = wait(futures, return_when=FIRST_EXCEPTION)
+            for future in not_done:
+                future.cancel()
+
+        wait(futures)
+        for future in futures:
+            if not future.cancelled() and future.exception() is not None:
+                raise future.exception()
+
+        return [future.result() for future in futures]
+
+    def run(self, context, items):
+        scopes = (
+            context.local(**{
+                self.key: item,
+            })
+            for item in items
+        )
+
+        if self.max_workers is None:
+            values = [self.chain(scope) for scope in scopes]
+        else:
+            values = self.run_concurrently(list(scopes))
+
+        return list(filter(self.filter_func, values))
+
+    def stream(self, context):
+        """
+        Consume the items a chunk at a time, so that only one chunk of results is held at once.
+
+        """
+        items = iter(context[self.items])
+        result = self.initial if self.sink is None else 0
+
+        while True:
+            chunk = list(islice(items, self.chunk_size))
+            if not chunk:
+                return None if result is NO_INITIAL else result
+
+            values = self.run(context, chunk)
+            if self.sink is not None:
+                if values:
+                    self.sink(values)
+                result += len(values)
+            else:
+                for value in values:
+                    if result is NO_INITIAL:
+                        result = value
+                    else:
+                        result = self.reducer(result, value)
+
+    def __call__(self, context):
+        if self.reducer is None and self.sink is None:
+            filtered_values = self.run(context, context[self.items])
+        else:
+            filtered_values = self.stream(context)
 
         # Set the responses in the context
         context[self.list_key] = filtered_values
@@ -2,7 +2,6 @@
 Message encoding and decoding.
 
 """
-from json import dumps, loads
 from typing import Any, Dict, Optional
 
 from marshmallow import (
@@ -12,6 +11,8 @@ from marshmallow import (
     fields,
 )
 
+from microcosm_pubsub.serialization import dumps, loads
+
 
 DEFAULT_MEDIA_TYPE = "application/json"
 
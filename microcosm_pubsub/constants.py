@@ -12,3 +12,6 @@ URI_KEY = "uri"
 RECEIPT_HANDLE_KEY = "receipt_handle"
 AWS_SNS = "SNS"
 AWS_SQS = "SQS"
+# SNS accepts at most ten entries and 256 KiB (in aggregate) per PublishBatch request
+MAX_PUBLISH_BATCH_ENTRIES = 10
+MAX_PUBLISH_BATCH_BYTES = 256 * 1024
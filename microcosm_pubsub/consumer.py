@@ -2,15 +2,20 @@
 Message consumer.
 
 """
+from contextlib import contextmanager
 from os.path import exists
 from urllib.parse import urlparse
 
 from boto3.session import Session
 from microcosm.api import defaults, typed
+from microcosm.config.types import boolean
 from microcosm_logging.decorators import logger
 
+from microcosm_pubsub.acknowledgements import AcknowledgementBuffer
 from microcosm_pubsub.backoff import BackoffPolicy
+from microcosm_pubsub.prefetch import SQSPrefetcher
 from microcosm_pubsub.reader import SQSFileReader, SQSJsonReader, SQSStdInReader
+from microcosm_pubsub.stages import create_stage_timer
 
 
 STDIN = "STDIN"
@@ -37,6 +42,14 @@ class SQSConsumer:
         limit,
         wait_seconds,
         backoff_policy,
+        batch_acknowledgements=False,
+        acknowledgement_flush_seconds=None,
+        acknowledgement_max_attempts=1,
+        prefetch_batches=0,
+        prefetch_handling_seconds=0,
+        skip_unparseable_messages=False,
+        visibility_timeout_seconds=None,
+        stage_timings=False,
     ):
         self.sqs_client = sqs_client
         self.sqs_envelope = sqs_envelope
@@ -44,6 +57,26 @@ class SQSConsumer:
         self.limit = limit
         self.wait_seconds = wait_seconds
         self.backoff_policy = backoff_policy
+        self.batch_acknowledgements = batch_acknowledgements
+        self.acknowledgement_flush_seconds = acknowledgement_flush_seconds
+        self.acknowledgement_max_attempts = acknowledgement_max_attempts
+        self.acknowledgements = None
+        self.stage_timings = stage_timings
+        self.skip_unparseable_messages = skip_unparseable_messages
+        self.prefetcher = SQSPrefetcher(
+            consumer=self,
+            max_batches=prefetch_batches,
+            visibility_timeout_seconds=visibility_timeout_seconds,
+            handling_seconds=prefetch_handling_seconds,
+        ) if prefetch_batches > 0 else None
+
+    def close(self):
+        """
+        Stop prefetching (if enabled) and return unstarted messages to the queue.
+
+        """
+        if self.prefetcher is not None:
+            self.prefetcher.stop()
 
     def consume(self):
         """
@@ -51,17 +84,85 @@ class SQSConsumer:
 
         :returns: a list of `SQSMessage`
         """
-        return [
-            self.sqs_envelope.parse_raw_message(self, raw_message)
-            for raw_message in self.sqs_client.receive_message(
-                AttributeNames=[
-                    "ApproximateReceiveCount",
-                ],
-                MaxNumberOfMessages=self.limit,
-                QueueUrl=self.sqs_queue_url,
-                WaitTimeSeconds=self.wait_seconds,
-            ).get("Messages", [])
-        ]
+        if self.prefetcher is not None:
+            return self.prefetcher.take()
+
+        return self.receive()
+
+    def receive(self):
+        """
+        Receive (and parse) a batch of messages from SQS.
+
+        :returns: a list of `SQSMessage`
+        """
+        timer = create_stage_timer(self.stage_timings)
+        raw_messages = self.sqs_client.receive_message(
+            AttributeNames=[
+                "ApproximateReceiveCount",
+            ],
+            MaxNumberOfMessages=self.limit,
+            QueueUrl=self.sqs_queue_url,
+            WaitTimeSeconds=self.wait_seconds,
+        ).get("Messages", [])
+        timer.mark("receive")
+
+        messages = []
+        for raw_message in raw_messages:
+            try:
+                messages.append(self.sqs_envelope.parse_raw_message(self, raw_message))
+            except Exception as error:
+                if not self.skip_unparseable_messages:
+                    raise
+                self.skip_unparseable_message(raw_message, error)
+
+        if timer.timings is not None:
+            for message in messages:
+                message.stage_timings = dict(timer.timings, **(message.stage_timings or {}))
+        return messages
+
+    def skip_unparseable_message(self, raw_message, error):
+        """
+        Log a message that could not be parsed instead of failing the whole batch.
+
+        The message is neither acked nor nacked.
+
+        """
+        try:
+            message_id = self.sqs_envelope.parse_message_id(raw_message)
+        except Exception:
+            # without an id, the message cannot be told apart from the rest of the batch
+            raise error
+
+        self.logger.warning(
+            "Skipping message that could not be parsed: {error}",
+            extra=dict(
+                error=str(error),
+                message_id=message_id,
+            ),
+        )
+
+    @contextmanager
+    def buffered_acknowledgements(self):
+        """
+        Buffer acknowledgements within a block and flush them using batch requests.
+
+        Does nothing unless batch acknowledgements are enabled.
+
+        """
+        if not self.batch_acknowledgements or self.acknowledgements is not None:
+            yield self.acknowledgements
+            return
+
+        self.acknowledgements = AcknowledgementBuffer(
+            consumer=self,
+            flush_timeout_seconds=self.acknowledgement_flush_seconds,
+            max_attempts=self.acknowledgement_max_attempts,
+        )
+        try:
+            with self.acknowledgements as acknowledgements:
+                yield acknowledgements
+        finally:
+            self.acknowledgements = None
 
     def ack(self, message):
         """
@@ -70,6 +171,10 @@ class SQSConsumer:
         Deletes the message from the queue.
 
         """
+        if self.acknowledgements is not None:
+            self.acknowledgements.ack(message)
+            return
+
         self.sqs_client.delete_message(
             QueueUrl=self.sqs_queue_url,
             ReceiptHandle=message.receipt_handle,
@@ -98,10 +203,15 @@ class SQSConsumer:
              We choose the latter under the assumption that 30s is too long to reprocess most messages
              as a default and that long-running handlers will be configured accordingly (see: 2a).
 
-        Therefore: we always invoke `change_message_visibility`
+        Therefore: we always invoke `change_message_visibility` (or buffer the computed timeout
+        for `change_message_visibility_batch` when acknowledgements are buffered)
 
         """
         timeout = self.backoff_policy.compute_backoff_timeout(message, visibility_timeout_seconds)
+        if self.acknowledgements is not None:
+            self.acknowledgements.nack(message, timeout)
+            return
+
         self.sqs_client.change_message_visibility(
             QueueUrl=self.sqs_queue_url,
             ReceiptHandle=message.receipt_handle,
@@ -133,6 +243,21 @@ def configure_sqs_client(graph):
     wait_seconds=typed(int, default_value=1),
     # On error, change the visibility timeout when nacking
     message_retry_visibility_timeout_seconds=typed(int, default_value=5),
+    # Buffer acks and nacks within a batch and send them using batch requests
+    batch_acknowledgements=typed(boolean, default_value=False),
+    # Flush buffered acknowledgements after waiting at most this long
+    acknowledgement_flush_seconds=typed(float, default_value=1.0),
+    # Number of attempts for acknowledgements that fail within a batch request
+    acknowledgement_max_attempts=typed(int, default_value=3),
+    # Number of batches to receive ahead of the dispatcher from SQS queues (0 disables prefetching)
+    prefetch_batches=typed(int, default_value=0),
+    # Expected time to handle a batch; prefetched batches are returned unless this much visibility remains
+    # (prefetching is disabled if the visibility timeout is no longer than this)
+    prefetch_handling_seconds=typed(int, default_value=10),
+    # The queue's visibility timeout; looked up from the queue when prefetching if not set
+    visibility_timeout_seconds=typed(int, default_value=None),
+    # Record how long each stage of receiving and handling a message takes
+    stage_timings=typed(boolean, default_value=False),
 )
 def configure_sqs_consumer(graph):
     """
@@ -142,6 +267,9 @@ def configure_sqs_consumer(graph):
     sqs_queue_url = graph.config.sqs_consumer.sqs_queue_url
     sqs_event = graph.config.sqs_consumer.sqs_event
 
+    # Only prefetch from actual queues; readers replay a finite set of messages
+    prefetch_batches = 0
+
     if graph.metadata.testing or sqs_queue_url == "test":
         from unittest.mock import MagicMock
         sqs_client = MagicMock()
@@ -153,6 +281,10 @@ def configure_sqs_consumer(graph):
         sqs_client = SQSFileReader(sqs_queue_url)
     else:
         sqs_client = configure_sqs_client(graph)
+        prefetch_batches = graph.config.sqs_consumer.prefetch_batches
+
+    # Lambda reports unhandled records as partial batch failures, so one bad record need not fail the rest
+    skip_unparseable_messages = bool(sqs_event)
 
     backoff_policy_class = BackoffPolicy.choose_backoff_policy(
         graph.config.sqs_consumer.backoff_policy,
@@ -163,10 +295,18 @@ def configure_sqs_consumer(graph):
     )
 
     return SQSConsumer(
+        acknowledgement_flush_seconds=graph.config.sqs_consumer.acknowledgement_flush_seconds,
+        acknowledgement_max_attempts=graph.config.sqs_consumer.acknowledgement_max_attempts,
         backoff_policy=backoff_policy,
+        batch_acknowledgements=graph.config.sqs_consumer.batch_acknowledgements,
         limit=graph.config.sqs_consumer.limit,
+        prefetch_batches=prefetch_batches,
+        prefetch_handling_seconds=graph.config.sqs_consumer.prefetch_handling_seconds,
+        skip_unparseable_messages=skip_unparseable_messages,
         sqs_client=sqs_client,
         sqs_envelope=graph.sqs_envelope,
         sqs_queue_url=sqs_queue_url,
+        stage_timings=graph.config.sqs_consumer.stage_timings,
+        visibility_timeout_seconds=graph.config.sqs_consumer.visibility_timeout_seconds,
         wait_seconds=graph.config.sqs_consumer.wait_seconds,
     )
@@ -2,12 +2,148 @@
 Consume Daemon main.
 
 """
+from collections import deque
+from gc import collect, freeze
+from logging import getLogger
+from os import WNOHANG, _exit, fork, kill, waitpid, waitstatus_to_exitcode
+from signal import SIG_DFL, SIGINT, SIGTERM, signal
+from sys import exit
+from time import monotonic, sleep
+
 from microcosm.loaders import load_each, load_from_dict
 from microcosm_daemon.api import SleepNow
 from microcosm_daemon.daemon import Daemon
 
 from microcosm_pubsub.consumer import STDIN
 from microcosm_pubsub.envelope import LambdaSQSEnvelope, NaiveSQSEnvelope, SQSEnvelope
+from microcosm_pubsub.producer import SNSProducer
+from microcosm_pubsub.reader import SQSJsonReader
+
+
+logger = getLogger("daemon.prefork_supervisor")
+
+
+# Delay before replacing a crashed worker, to avoid tight crash loops
+RESTART_DELAY_SECONDS = 1
+
+# How often the supervisor checks for exited workers while a restart is pending
+POLL_INTERVAL_SECONDS = 0.1
+
+
+class PreforkSupervisor:
+    """
+    Run a daemon in pre-forked worker processes.
+
+    The object graph is built once, in the supervisor, and then frozen so that forked
+    workers share its memory copy-on-write. Crashed workers are replaced after a delay (workers
+    that exit cleanly are not); SIGINT/SIGTERM are forwarded to all workers so that each drains
+    its current batch before exiting, and cancel pending replacements.
+
+    """
+    def __init__(self, target, workers):
+        self.target = target
+        self.workers = workers
+        self.children = set()
+        self.restarts = deque()
+        self.stopping = False
+
+    def run(self):
+        self.target.initialize()
+        self.target.graph.logger.info(f"Starting supervisor for daemon {self.target.name}")
+
+        # move everything allocated so far out of the collector's reach so that
+        # collections in the workers do not touch (and thereby copy) shared pages
+        collect()
+        freeze()
+
+        self.init_signal_handlers()
+
+        for _ in range(self.workers):
+            self.spawn()
+
+        self.supervise()
+        exit(0)
+
+    def supervise(self):
+        """
+        Reap exited workers, and replace crashed ones, until all workers have exited.
+
+        Workers are not replaced by sleeping in between reaps, so that other workers' exits are
+        still reaped (and termination still cancels the replacement) during the restart delay.
+
+        """
+        while True:
+            self.restart_due_workers()
+
+            if self.restarts:
+                pid, status = waitpid(-1, WNOHANG) if self.children else (0, 0)
+                if pid == 0:
+                    sleep(POLL_INTERVAL_SECONDS)
+                    continue
+            elif self.children:
+                pid, status = waitpid(-1, 0)
+            else:
+                return
+
+            self.on_exit(pid, waitstatus_to_exitcode(status))
+
+    def restart_due_workers(self):
+        now = monotonic()
+        while self.restarts and self.restarts[0] <= now:
+            self.restarts.popleft()
+            self.spawn()
+
+    def init_signal_handlers(self):
+        for signum in (SIGINT, SIGTERM):
+            signal(signum, self.on_terminate)
+
+    def spawn(self):
+        if self.stopping:
+            return None
+
+        pid = fork()
+        if pid == 0:
+            self.run_worker()
+        self.children.add(pid)
+
+        if self.stopping:
+            # terminated while forking; the new worker missed the forwarded signal
+            kill(pid, SIGTERM)
+        return pid
+
+    def run_worker(self):
+        """
+        Run the daemon's state machine in a (forked) worker; never returns.
+
+        """
+        for signum in (SIGINT, SIGTERM):
+            signal(signum, SIG_DFL)
+
+        if self.stopping:
+            # a forwarded signal was handled before the default handlers were restored
+            _exit(0)
+
+        try:
+            self.target.run_state_machine()
+        except BaseException as error:
+            logger.error("Worker exited with error: %s", error)
+            _exit(1)
+        _exit(0)
+
+    def on_exit(self, pid, exit_code):
+        self.children.discard(pid)
+
+        if self.stopping or exit_code == 0:
+            return
+
+        logger.warning("Worker %s exited with code %s; restarting", pid, exit_code)
+        self.restarts.append(monotonic() + RESTART_DELAY_SECONDS)
+
+    def on_terminate(self, signum, frame):
+        self.stopping = True
+        self.restarts.clear()
+        for pid in self.children:
+            kill(pid, SIGTERM)
 
 
 class ConsumerDaemon(Daemon):
@@ -21,12 +157,37 @@ class ConsumerDaemon(Daemon):
         parser = super().make_arg_parser()
         parser.add_argument("--stdin", action="store_true")
         parser.add_argument("--sqs-queue-url")
+        parser.add_argument(
+            "--prefork-workers",
+            type=int,
+            default=0,
+            help="Build the object graph once and fork this many consumer processes",
+        )
         parser.add_argument("--envelope", choices=[
             envelope_cls.__name__
             for envelope_cls in SQSEnvelope.__subclasses__()
         ])
         return parser
 
+    def run(self):
+        """
+        Run the daemon, under a pre-fork supervisor if so configured.
+
+        The supervisor replaces the daemon's own process runner, so it cannot be combined with
+        `--processes` or with health checks.
+
+        """
+        parser = self.make_arg_parser()
+        args = parser.parse_args()
+        if args.prefork_workers < 1:
+            super().run()
+            return
+
+        if args.processes != 1 or args.heartbeat_threshold_seconds >= 0:
+            parser.error("--prefork-workers cannot be combined with --processes or --heartbeat-threshold-seconds")
+
+        PreforkSupervisor(self, args.prefork_workers).run()
+
     def create_object_graph_components(self, graph):
         super().create_object_graph_components(graph)
         self.bound_handlers = graph.sqs_message_handler_registry.compute_bound_handlers(
@@ -40,33 +201,105 @@ class ConsumerDaemon(Daemon):
                 handler.__name__,
             ))
 
-        super().run_state_machine()
+        self.graph.sqs_message_dispatcher.start_process_pool(self)
+        outbox_relay = self.graph.get("pubsub_outbox_relay")
+        if outbox_relay is not None:
+            outbox_relay.start()
+        try:
+            super().run_state_machine()
+        finally:
+            self.graph.sqs_consumer.close()
+            self.graph.sqs_message_dispatcher.close()
+            if outbox_relay is not None:
+                outbox_relay.stop()
+            sns_producer = self.graph.get("sns_producer")
+            if isinstance(sns_producer, SNSProducer):
+                sns_producer.close()
+            metrics_aggregator = self.graph.get("pubsub_metrics_aggregator")
+            if metrics_aggregator is not None and metrics_aggregator.enabled:
+                metrics_aggregator.close()
 
     def process(self):
         """
-        Lambda Function method that runs only once
+        Lambda Function method that handles the current event
+
+        The object graph is only initialized on first use.
+
+        :returns: the handling results, or None if the batch could not be handled
         """
-        self.initialize()
+        if self.graph is None:
+            self.initialize()
         self.graph.logger.info("Local starting daemon {}".format(self.name))
+        results = None
         with self.graph.error_policy:
-            self.graph.sqs_message_dispatcher.handle_batch(self.bound_handlers)
+            results = self.graph.sqs_message_dispatcher.handle_batch(self.bound_handlers)
+        return results
+
+    @staticmethod
+    def make_batch_item_failures(records, results):
+        """
+        Build a Lambda partial batch response from handling results.
+
+        Records fail if their result should be retried or if they have no result (e.g. because
+        they could not be parsed); if no results were returned, the whole batch failed.
+
+        """
+        if results is None:
+            failed_records = records
+        else:
+            results_by_message_id = {
+                result.message_id: result
+                for result in results
+            }
+            failed_records = [
+                record
+                for record in records
+                if record["messageId"] not in results_by_message_id
+                or results_by_message_id[record["messageId"]].result.retry
+            ]
+
+        return dict(
+            batchItemFailures=[
+                dict(itemIdentifier=record["messageId"])
+                for record in failed_records
+            ],
+        )
+
+    def use_event(self, event):
+        """
+        Swap in a new Lambda event without rebuilding the object graph.
+
+        """
+        self.sqs_event = event
+        if self.graph is not None:
+            self.graph.sqs_consumer.sqs_client = SQSJsonReader(event)
 
     @classmethod
     def make_lambda_handler(cls):
+        # the daemon (and its object graph) is kept warm across invocations
+        daemon = None
+
         def handler(event, context):
             """
             AWS Lambda function handler.
             """
+            nonlocal daemon
+
             # this is for the warmup event.
             # just return something and don't continue
             if "warm" in event:
                 return "warming up"
 
-            # we configure SQS Queue to use batches of 1,
-            # so received event contains
-            # another stringified json with actual message inside
-            daemon = cls(event=event["Records"][0])
-            daemon.process()
+            # every record contains another stringified json with actual message inside;
+            # records that should be retried are reported as partial batch failures
+            # (requires `ReportBatchItemFailures` on the event source mapping)
+            records = event["Records"]
+            if daemon is None:
+                daemon = cls(event=records)
+            else:
+                daemon.use_event(records)
+            results = daemon.process()
+            return daemon.make_batch_item_failures(records, results)
         return handler
 
     @property
@@ -122,6 +355,7 @@ class ConsumerDaemon(Daemon):
     def components(self):
         return super().components + [
             "opaque",
+            "pubsub_json_backend",
             "pubsub_message_schema_registry",
             "sqs_message_handler_registry",
             "sqs_consumer",
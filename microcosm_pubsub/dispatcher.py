@@ -27,6 +27,9 @@ Flow diagram:
                                                                     for future reprocessing.
 
 """
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextvars import copy_context
 from logging import Logger
 from time import time
 from typing import List
@@ -39,13 +42,19 @@ from microcosm_logging.timing import elapsed_time
 from microcosm_pubsub.constants import PUBLISHED_KEY, TTL_KEY
 from microcosm_pubsub.errors import IgnoreMessage, SkipMessage, TTLExpired
 from microcosm_pubsub.result import MessageHandlingResult, MessageHandlingResultType
+from microcosm_pubsub.stages import create_stage_timer
 from microcosm_pubsub.tracing import trace_incoming_message_process
+from microcosm_pubsub.workers import create_process_pool, handle_in_worker, to_message_dict
 
 
 @logger
 @defaults(
     # Number of failed attempts after which the message stops being processed
     message_max_processing_attempts=typed(int, default_value=None),
+    # Number of messages within a batch to handle concurrently
+    concurrency=typed(int, default_value=1),
+    # Number of worker processes to handle messages in (0 handles messages in this process)
+    processes=typed(int, default_value=0),
 )
 class SQSMessageDispatcher:
     """
@@ -63,6 +72,39 @@ class SQSMessageDispatcher:
         self.send_batch_metrics = graph.pubsub_send_batch_metrics
         self.max_processing_attempts = graph.config.sqs_message_dispatcher.message_max_processing_attempts
         self.sentry_config = graph.sentry_logging_pubsub
+        self.concurrency = graph.config.sqs_message_dispatcher.concurrency
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.concurrency,
+            thread_name_prefix="sqs-message-dispatcher",
+        ) if self.concurrency > 1 else None
+        self.processes = graph.config.sqs_message_dispatcher.processes
+        self.process_pool = None
+        self.process_pool_daemon = None
+
+    def start_process_pool(self, daemon):
+        """
+        Start worker processes for a daemon, if so configured.
+
+        """
+        if self.processes < 1 or self.process_pool is not None:
+            return
+
+        self.process_pool_daemon = daemon
+        self.process_pool = create_process_pool(daemon, self.processes)
+
+    def restart_process_pool(self):
+        """
+        Replace a process pool that broke because a worker died.
+
+        """
+        self.logger.warning("Restarting worker processes after a worker exited unexpectedly")
+        self.process_pool.shutdown(wait=False)
+        self.process_pool = create_process_pool(self.process_pool_daemon, self.processes)
+
+    def close(self):
+        if self.process_pool is not None:
+            self.process_pool.shutdown()
+            self.process_pool = None
 
     def handle_batch(self, bound_handlers) -> List[MessageHandlingResult]:
         """
@@ -71,10 +113,13 @@ class SQSMessageDispatcher:
         """
         start_time = time()
 
-        instances = [
-            self.handle_message(message, bound_handlers)
-            for message in self.sqs_consumer.consume()
-        ]
+        messages = self.sqs_consumer.consume()
+        with self.sqs_consumer.buffered_acknowledgements() as acknowledgements:
+            instances = self.handle_messages(messages, bound_handlers)
+
+        if acknowledgements is not None:
+            for message, instance in zip(messages, instances):
+                instance.resolution_failure = acknowledgements.failure_for(message)
 
         batch_elapsed_time = (time() - start_time) * 1000
 
@@ -94,15 +139,84 @@ class SQSMessageDispatcher:
         self.send_batch_metrics(batch_elapsed_time, message_batch_size)
 
         for instance in instances:
+            timer = create_stage_timer(instance.stage_timings is not None, instance.stage_timings)
             self.send_metrics(instance)
+            if timer.timings is not None:
+                # NB: sending metrics can only be timed (and its timing sent) afterwards
+                timer.mark("metrics")
+                self.send_metrics.send_stage_timings(instance, ["metrics"])
+
+        return instances
+
+    def handle_messages(self, messages, bound_handlers) -> List[MessageHandlingResult]:
+        """
+        Handle messages, concurrently if so configured.
+
+        Each message is handled within a copy of the current context so that opaque
+        data initialized for one message is never visible to another.
+
+        """
+        if self.process_pool is not None:
+            return self.handle_messages_in_processes(messages)
+
+        if self.executor is None or len(messages) < 2:
+            return [
+                self.handle_message(message, bound_handlers)
+                for message in messages
+            ]
+
+        futures = [
+            self.executor.submit(copy_context().run, self.handle_message, message, bound_handlers)
+            for message in messages
+        ]
+        return [
+            future.result()
+            for future in futures
+        ]
+
+    def handle_messages_in_processes(self, messages) -> List[MessageHandlingResult]:
+        """
+        Handle messages in worker processes and resolve them here.
+
+        If a worker dies, the messages in flight in its pool fail and the pool is restarted.
+
+        """
+        futures = [
+            self.submit_to_process_pool(message)
+            for message in messages
+        ]
+
+        instances = []
+        for message, future in zip(messages, futures):
+            try:
+                instance = future.result()
+            except Exception as error:
+                # the worker failed outside of message handling (e.g. it crashed)
+                with self.opaque.initialize(self.sqs_message_context, message):
+                    instance = MessageHandlingResult.from_error(message=message, error=error)
+                    instance.message_id = message.message_id
+                    instance.log(logger=self.logger, opaque=self.opaque)
+            instance.resolve(message)
+            instances.append(instance)
 
         return instances
 
-    def handle_message(self, message, bound_handlers) -> MessageHandlingResult:
+    def submit_to_process_pool(self, message):
+        try:
+            return self.process_pool.submit(handle_in_worker, to_message_dict(message))
+        except BrokenProcessPool:
+            self.restart_process_pool()
+            return self.process_pool.submit(handle_in_worker, to_message_dict(message))
+
+    def handle_message(self, message, bound_handlers, resolve=True) -> MessageHandlingResult:
         """
         Handle a message.
 
+        :param resolve: whether to ack or nack the message once handled
+
         """
+        timer = create_stage_timer(self.sqs_consumer.stage_timings, dict(message.stage_timings or {}))
+
         with self.opaque.initialize(self.sqs_message_context, message):
             handler = None
             start_handle_time = time()
@@ -110,9 +224,12 @@ class SQSMessageDispatcher:
             queue_url = self.sqs_consumer.sqs_queue_url
             with trace_incoming_message_process(self.opaque, message, queue_url), \
                     elapsed_time(self.opaque):
+                timer.mark("initialize")
                 try:
                     self.validate_message(message)
+                    timer.mark("validate")
                     handler = self.find_handler(message, bound_handlers)
+                    timer.mark("find_handler")
                     instance = MessageHandlingResult.invoke(
                         handler=self.wrap_handler(handler),
                         message=message,
@@ -122,8 +239,11 @@ class SQSMessageDispatcher:
                         message=message,
                         error=error,
                     )
+                timer.mark("handle")
 
+            instance.message_id = message.message_id
             instance.elapsed_time = self.opaque["elapsed_time"]
+            instance.stage_timings = timer.timings
             published_time = self.opaque.get(PUBLISHED_KEY)
             if published_time:
                 instance.handle_start_time = start_handle_time - float(published_time)
@@ -131,11 +251,15 @@ class SQSMessageDispatcher:
                 logger=self.choose_logger(handler),
                 opaque=self.opaque,
             )
+            timer.mark("log")
             instance.error_reporting(
                 sentry_config=self.sentry_config,
                 opaque=self.opaque,
             )
-            instance.resolve(message)
+            timer.mark("error_reporting")
+            if resolve:
+                instance.resolve(message)
+                timer.mark("resolve")
             return instance
 
     def validate_message(self, message):
@@ -8,14 +8,14 @@ process this envelope, depending on the degree of validation and metadata desire
 """
 from abc import ABCMeta, abstractmethod
 from hashlib import md5
-from json import loads
 from uuid import uuid4
 
 from marshmallow import ValidationError
 from microcosm.api import defaults
 
-from microcosm_pubsub.codecs import MediaTypeSchema, PubSubMessageCodec
 from microcosm_pubsub.message import SQSMessage
+from microcosm_pubsub.serialization import loads
+from microcosm_pubsub.stages import create_stage_timer
 
 
 class MessageBodyParser(metaclass=ABCMeta):
@@ -102,18 +102,34 @@ class CodecMediaTypeAndContentParser(MediaTypeAndContentParser):
 
     def __init__(self, graph):
         super(CodecMediaTypeAndContentParser, self).__init__(graph)
-        self.media_type_codec = PubSubMessageCodec(MediaTypeSchema())
         self.pubsub_message_schema_registry = graph.pubsub_message_schema_registry
 
+    def parse_media_type(self, message_dict):
+        """
+        Extract the media type from a parsed message.
+
+        Validates the media type the same way that `MediaTypeSchema` would.
+
+        """
+        try:
+            media_type = message_dict["mediaType"]
+        except (KeyError, TypeError):
+            raise ValidationError(dict(mediaType=["Missing data for required field."]))
+
+        if not isinstance(media_type, str):
+            raise ValidationError(dict(mediaType=["Not a valid string."]))
+
+        return media_type
+
     def parse_media_type_and_content(self, message):
         """
-        Decode the message once to extract its media type and then again with the correct codec.
+        Parse the message once, then look up its media type and decode it with the correct codec.
 
         """
-        base_message = self.media_type_codec.decode(message)
-        media_type = base_message["mediaType"]
+        message_dict = message if isinstance(message, dict) else loads(message)
+        media_type = self.parse_media_type(message_dict)
         try:
-            content = self.pubsub_message_schema_registry.find(media_type).decode(message)
+            content = self.pubsub_message_schema_registry.find(media_type).decode(message_dict)
         except KeyError:
             return media_type, None
         else:
@@ -133,20 +149,26 @@ class SQSEnvelope(MessageBodyParser, MediaTypeAndContentParser):
         Create an `SQSMessage` from SQS data.
 
         """
+        timer = create_stage_timer(getattr(consumer, "stage_timings", False))
+
         message_id = self.parse_message_id(raw_message)
         receipt_handle = self.parse_receipt_handle(raw_message)
         attributes = raw_message.get("Attributes", {})
         approximate_receive_count = int(attributes.get("ApproximateReceiveCount", 1))
 
         body = self.parse_body(raw_message)
+        timer.mark("parse_body")
 
         if self.should_validate_md5:
             self.validate_md5(raw_message, body)
+            timer.mark("validate_md5")
 
         message = self.parse_message(body)
+        timer.mark("parse_message")
         media_type, content = self.parse_media_type_and_content(message)
+        timer.mark("parse_content")
 
-        return SQSMessage(
+        sqs_message = SQSMessage(
             consumer=consumer,
             content=content,
             media_type=media_type,
@@ -154,6 +176,8 @@ class SQSEnvelope(MessageBodyParser, MediaTypeAndContentParser):
             receipt_handle=receipt_handle,
             approximate_receive_count=approximate_receive_count,
         )
+        sqs_message.stage_timings = timer.timings
+        return sqs_message
 
     def parse_message_id(self, raw_message):
         return raw_message["MessageId"]
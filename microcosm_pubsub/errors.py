@@ -65,3 +65,31 @@ class TTLExpired(Exception):
     def __init__(self, reason=None, extra=None):
         super().__init__(reason)
         self.extra = extra or dict()
+
+
+class PublishBatchError(Exception):
+    """
+    Some messages in a batch could not be published.
+
+    """
+    def __init__(self, reason, message_ids, failures):
+        super().__init__(reason)
+        # message ids of the batch, in order; None for messages that were not published
+        self.message_ids = message_ids
+        self.failures = failures
+
+
+class MessageTooLargeError(Exception):
+    """
+    A message is larger than SNS accepts.
+
+    """
+    pass
+
+
+class PublishQueueFullError(Exception):
+    """
+    A message could not be queued for asynchronous publishing.
+
+    """
+    pass
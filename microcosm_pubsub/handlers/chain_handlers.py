@@ -8,13 +8,23 @@ class ChainHandler(metaclass=ABCMeta):
     """
     Resolve a chain on call. Pass to the chain the message to the chain.
 
+    The chain is built (by `get_chain`) on the first call and reused afterwards.
+
     """
+    _chain = None
+
     @abstractmethod
     def get_chain(self):
         pass
 
+    @property
+    def chain(self):
+        if self._chain is None:
+            self._chain = Chain(self.get_chain())
+        return self._chain
+
     def __call__(self, message):
-        return Chain(self.get_chain())(message=message)
+        return self.chain(message=message)
 
 
 class ChainURIHandler(URIHandler, metaclass=ABCMeta):
@@ -23,11 +33,21 @@ class ChainURIHandler(URIHandler, metaclass=ABCMeta):
     Resolve a chain on handle.
     Pass to the chain the message and the fetched resource.
 
+    The chain is built (by `get_chain`) on the first call and reused afterwards.
+
     """
+    _chain = None
+
     @abstractmethod
     def get_chain(self):
         pass
 
+    @property
+    def chain(self):
+        if self._chain is None:
+            self._chain = self.get_chain()
+        return self._chain
+
     @property
     def resource_name(self):
         return "resource"
@@ -38,7 +58,6 @@ class ChainURIHandler(URIHandler, metaclass=ABCMeta):
             uri=uri,
         )
         kwargs[self.resource_name] = resource
-        chain = self.get_chain()
-        chain(**kwargs)
+        self.chain(**kwargs)
 
         return True
@@ -2,34 +2,157 @@
 PublishBatchMessage handler.
 
 """
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
 
-from microcosm.api import binding
+from microcosm.api import binding, defaults, typed
+from microcosm.errors import LockedGraphError, NotBoundError
 from microcosm_logging.decorators import logger
 
+from microcosm_pubsub.batch import CompactMessageBatchSchema
 from microcosm_pubsub.conventions import created
 from microcosm_pubsub.decorators import handles
+from microcosm_pubsub.errors import PublishBatchError
 from microcosm_pubsub.producer import PubsubMessage, SNSProducer
+from microcosm_pubsub.serialization import dumps
+
+
+class LocalProgressCache:
+    """
+    An in-process (bounded) cache of batch progress, used when no resource cache is bound.
+
+    """
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self.values = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key):
+        with self.lock:
+            return self.values.get(key)
+
+    def set(self, key, value, ttl=None):
+        with self.lock:
+            self.values[key] = value
+            self.values.move_to_end(key)
+            while len(self.values) > self.max_size:
+                self.values.popitem(last=False)
 
 
 @binding("publish_message_batch")
+@defaults(
+    # number of PublishBatch requests to make at once
+    concurrency=typed(int, default_value=4),
+    # how long to remember which entries of a batch message were published
+    progress_ttl=typed(int, default_value=24 * 60 * 60),
+)
 @handles(created("BatchMessage"))
+@handles(CompactMessageBatchSchema)
 @logger
 class PublishBatchMessage:
+    """
+    Republish the messages of a batch message.
+
+    Entries are grouped by topic and published with PublishBatch, several requests at a time.
+    The entries that were published are recorded by (SQS) message id so that a redelivered
+    batch message only publishes the rest. Progress is shared between consumers if a resource
+    cache is bound and is otherwise local to the process.
 
+    """
     def __init__(self, graph):
         self.sns_producer: SNSProducer = graph.sns_producer
+        self.opaque = graph.opaque
+        self.progress_ttl = graph.config.publish_message_batch.progress_ttl
+        self.progress_cache = self.get_progress_cache(graph)
+
+        concurrency = graph.config.publish_message_batch.concurrency
+        self.executor = ThreadPoolExecutor(max_workers=concurrency) if concurrency > 1 else None
+
+    def get_progress_cache(self, graph):
+        try:
+            resource_cache = graph.resource_cache
+        except (LockedGraphError, NotBoundError):
+            resource_cache = None
+
+        # Nb. the resource cache may be bound but disabled
+        return resource_cache if resource_cache is not None else LocalProgressCache()
 
     def __call__(self, message):
-        messages = message["messages"]
-        for message in messages:
-            pubsub_message = PubsubMessage(
+        if message["media_type"] == CompactMessageBatchSchema.MEDIA_TYPE:
+            pubsub_messages = self.decode_compact_batch(message)
+        else:
+            pubsub_messages = self.decode_batch(message)
+
+        message_id = self.opaque.get("message_id")
+        progress_key = f"publish_message_batch:{message_id}" if message_id else None
+        published = set(self.progress_cache.get(progress_key) or ()) if progress_key else set()
+        if published:
+            self.logger.info(
+                "Skipping {count} messages that were already published",
+                extra=dict(count=len(published)),
+            )
+
+        entries = [
+            (index, pubsub_message)
+            for index, pubsub_message in enumerate(pubsub_messages)
+            if index not in published
+        ]
+        try:
+            self.publish(entries, published)
+        finally:
+            if progress_key and published:
+                self.progress_cache.set(progress_key, sorted(published), ttl=self.progress_ttl)
+
+        return True
+
+    def publish(self, entries, published):
+        """
+        Publish (index, message) entries, adding the indexes of published entries to `published`.
+
+        """
+        indexes = [index for index, _ in entries]
+        try:
+            self.sns_producer.publish_batch(
+                [pubsub_message for _, pubsub_message in entries],
+                executor=self.executor,
+            )
+        except PublishBatchError as error:
+            published.update(
+                index
+                for index, message_id in zip(indexes, error.message_ids)
+                if message_id is not None
+            )
+            raise
+
+        published.update(indexes)
+
+    def decode_batch(self, message):
+        return [
+            PubsubMessage(
                 media_type=message["media_type"],
                 message=message["message"],
                 message_attributes=message["message_attributes"],
                 opaque_data=message["opaque_data"],
                 topic_arn=message["topic_arn"],
             )
+            for message in message["messages"]
+        ]
 
-            self.sns_producer.publish_message(pubsub_message)
-
-        return True
+    def decode_compact_batch(self, message):
+        shared_opaque_data = message.get("shared_opaque_data") or dict()
+        return [
+            PubsubMessage(
+                media_type=entry["mediaType"],
+                message=dumps(entry["message"]),
+                message_attributes=(
+                    entry.get("messageAttributes") or self.sns_producer.choose_message_attributes(entry["mediaType"])
+                ),
+                opaque_data={
+                    **shared_opaque_data,
+                    **entry.get("opaqueData", {}),
+                },
+                topic_arn=entry["topicArn"],
+            )
+            for entry in message["messages"]
+        ]
@@ -27,6 +27,8 @@ class SQSMessage:
         self.topic_arn = topic_arn
         self.approximate_receive_count = approximate_receive_count
         self.handler = handler
+        # stage durations (in milliseconds), if enabled
+        self.stage_timings = None
 
     def ack(self):
         """
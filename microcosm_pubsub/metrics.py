@@ -1,3 +1,5 @@
+from threading import Lock
+
 from microcosm.api import defaults, typed
 from microcosm.config.types import boolean
 from microcosm.errors import NotBoundError
@@ -5,6 +7,128 @@ from microcosm.errors import NotBoundError
 from microcosm_pubsub.result import MessageHandlingResult, MessageHandlingResultType
 
 
+# Tags whose values are replaced once the aggregator tracks too many tag sets
+COLLAPSIBLE_TAG_KEYS = ("media-type", "media_type")
+
+
+@defaults(
+    enabled=typed(boolean, default_value=False),
+    # flush this often...
+    flush_interval_seconds=typed(float, default_value=10.0),
+    # ... and after this many message batches (if positive)
+    flush_every_batches=typed(int, default_value=0),
+    # keep a uniform sample of at most this many histogram values per tag set and flush
+    max_samples_per_tag_set=typed(int, default_value=100),
+    # beyond this many tag sets, media type tags are collapsed to "other"
+    max_tag_sets=typed(int, default_value=500),
+)
+class PubSubMetricsAggregator:
+    """
+    Aggregate metrics in process and send them periodically.
+
+    Sending one statsd packet per message gets expensive at high throughput. When enabled, the
+    statsd client aggregates in process: counters are summed per tag set and histograms keep a
+    bounded, uniform sample of values per tag set along with how many values were recorded. On
+    flush, sampled values are sent (in shared packets) with a sample rate that lets the statsd
+    agent recover the exact counts. The work and memory per flush are therefore bounded by the
+    number of tag sets, however many messages are handled.
+
+    NB: aggregation is enabled on the (shared) statsd client, so it applies to every metric sent
+    through the client.
+
+    """
+
+    def __init__(self, graph):
+        self.metrics = self.get_metrics(graph)
+        self.enabled = bool(self.metrics and graph.config.pubsub_metrics_aggregator.enabled)
+        self.flush_interval_seconds = graph.config.pubsub_metrics_aggregator.flush_interval_seconds
+        self.flush_every_batches = graph.config.pubsub_metrics_aggregator.flush_every_batches
+        self.max_samples_per_tag_set = graph.config.pubsub_metrics_aggregator.max_samples_per_tag_set
+        self.max_tag_sets = graph.config.pubsub_metrics_aggregator.max_tag_sets
+
+        self.lock = Lock()
+        self.tag_sets = set()
+        self.batches = 0
+
+        if self.enabled:
+            # the client flushes on its own timer (which is restarted in forked processes)
+            self.metrics.enable_aggregation(
+                flush_interval=self.flush_interval_seconds,
+                max_samples_per_context=self.max_samples_per_tag_set,
+            )
+            self.metrics.disable_buffering = False
+
+    def get_metrics(self, graph):
+        """
+        Fetch the metrics client from the graph.
+
+        Metrics will be disabled if the not configured.
+
+        """
+        try:
+            return graph.metrics
+        except NotBoundError:
+            return None
+
+    def histogram(self, metrics, name, value, tags):
+        """
+        Record a histogram value with the given client, capping the number of tag sets if enabled.
+
+        """
+        if self.enabled:
+            tags = self.cap_tags(name, tags)
+        metrics.histogram(name, value, tags=tags)
+
+    def cap_tags(self, name, tags):
+        key = (name, tuple(tags))
+        with self.lock:
+            if key in self.tag_sets:
+                return tags
+            if len(self.tag_sets) < self.max_tag_sets:
+                self.tag_sets.add(key)
+                return tags
+
+        return [
+            f"{tag.split(':', 1)[0]}:other" if tag.split(":", 1)[0] in COLLAPSIBLE_TAG_KEYS else tag
+            for tag in tags
+        ]
+
+    def batch_completed(self):
+        """
+        Count a handled batch of messages, flushing every `flush_every_batches` batches.
+
+        """
+        if not self.enabled or self.flush_every_batches <= 0:
+            return
+
+        with self.lock:
+            self.batches += 1
+            should_flush = self.batches >= self.flush_every_batches
+            if should_flush:
+                self.batches = 0
+
+        if should_flush:
+            self.flush()
+
+    def close(self):
+        """
+        Send everything that is still aggregated.
+
+        """
+        self.flush()
+
+    def flush(self):
+        """
+        Send everything recorded since the last flush.
+
+        """
+        if not self.enabled:
+            return
+
+        self.metrics.flush_aggregated_metrics()
+        self.metrics.flush()
+
+
 @defaults(
     enabled=typed(boolean, default_value=True)
 )
@@ -16,6 +140,7 @@ class PubSubSendMetrics:
 
     def __init__(self, graph):
         self.metrics = self.get_metrics(graph)
+        self.aggregator = graph.pubsub_metrics_aggregator
         self.enabled = bool(
             self.metrics
             and self.metrics.host != "localhost"
@@ -45,24 +170,52 @@ class PubSubSendMetrics:
         if result.result == MessageHandlingResultType.IGNORED:
             return
 
-        tags = [
-            "source:microcosm-pubsub",
-            f"result:{result.result}",
-            f"media-type:{result.media_type}",
-        ]
-        self.metrics.histogram(
+        tags = self.make_tags(result)
+        self.aggregator.histogram(
+            self.metrics,
             "message",
             result.elapsed_time,
             tags=tags,
         )
 
         if result.handle_start_time:
-            self.metrics.histogram(
+            self.aggregator.histogram(
+                self.metrics,
                 "message_handle_start",
                 result.handle_start_time,
                 tags=tags,
             )
 
+        self.send_stage_timings(result, list(result.stage_timings or {}))
+
+    def send_stage_timings(self, result: MessageHandlingResult, stages):
+        """
+        Send the timings of some stages, if enabled.
+
+        """
+        if not self.enabled:
+            return
+
+        if result.result == MessageHandlingResultType.IGNORED:
+            return
+
+        stage_timings = result.stage_timings or {}
+        tags = self.make_tags(result)
+        for stage in stages:
+            self.aggregator.histogram(
+                self.metrics,
+                "message_stage",
+                stage_timings[stage],
+                tags=tags + [f"stage:{stage}"],
+            )
+
+    def make_tags(self, result: MessageHandlingResult):
+        return [
+            "source:microcosm-pubsub",
+            f"result:{result.result}",
+            f"media-type:{result.media_type}",
+        ]
+
 
 @defaults(
     enabled=typed(boolean, default_value=True)
@@ -75,6 +228,7 @@ class PubSubSendBatchMetrics:
 
     def __init__(self, graph):
         self.metrics = self.get_metrics(graph)
+        self.aggregator = graph.pubsub_metrics_aggregator
         self.enabled = bool(
             self.metrics
             and self.metrics.host != "localhost"
@@ -102,24 +256,26 @@ class PubSubSendBatchMetrics:
         if not self.enabled:
             return
 
-        if not message_batch_size > 0:
-            return
+        if message_batch_size > 0:
+            tags = [
+                "source:microcosm-pubsub",
+            ]
 
-        tags = [
-            "source:microcosm-pubsub",
-        ]
+            self.aggregator.histogram(
+                self.metrics,
+                "message_batch",
+                elapsed_time,
+                tags=tags,
+            )
 
-        self.metrics.histogram(
-            "message_batch",
-            elapsed_time,
-            tags=tags,
-        )
+            self.aggregator.histogram(
+                self.metrics,
+                "message_batch_size",
+                message_batch_size,
+                tags=tags,
+            )
 
-        self.metrics.histogram(
-            "message_batch_size",
-            message_batch_size,
-            tags=tags,
-        )
+        self.aggregator.batch_completed()
 
 
 @defaults(
@@ -133,6 +289,7 @@ class PubSubProducerMetrics:
 
     def __init__(self, graph):
         self.metrics = self.get_metrics(graph)
+        self.aggregator = graph.pubsub_metrics_aggregator
         self.enabled = bool(
             self.metrics
             and self.metrics.host != "localhost"
@@ -165,7 +322,8 @@ class PubSubProducerMetrics:
             f"media_type:{kwargs['media_type']}",
         ]
 
-        self.metrics.histogram(
+        self.aggregator.histogram(
+            self.metrics,
             "sns_producer",
             elapsed_time,
             tags=tags,
@@ -0,0 +1,407 @@
+"""
+Transactional outbox.
+
+`DeferredProducer` publishes when its block exits; if the process dies first, messages are lost.
+An `OutboxProducer` instead appends messages to a durable store when its block exits and an
+`OutboxRelay` publishes stored messages in batches, recording which ones were delivered.
+
+Messages are only as safe as the append:
+ -  given a connection, the append takes part in that connection's open transaction, so the
+    messages are committed together with the rest of the handler's work (or not at all)
+ -  otherwise, the append is a transaction of its own, made when the block exits; if the process
+    dies after the handler's work was committed but before then, messages are still lost
+
+The default store is a local SQLite database; bind a different `pubsub_outbox_store` to use
+another `OutboxStore` (e.g. one backed by the service's own database).
+
+Relays claim the messages they publish for a while, so several processes may relay from the same
+store. Delivery is at least once: a message is published again if a relay stops between publishing
+a batch and recording its delivery (or holds its claim for too long). `ConsumerDaemon` runs a relay
+alongside the consumer if `pubsub_outbox_relay` is one of its components.
+
+"""
+import sqlite3
+from abc import ABCMeta, abstractmethod
+from functools import wraps
+from logging import Logger
+from os import getpid
+from threading import Event, Lock, Thread
+from time import time
+from typing import List, Optional, Tuple
+
+from microcosm.api import defaults, typed
+from microcosm_logging.decorators import logger
+
+from microcosm_pubsub.errors import PublishBatchError
+from microcosm_pubsub.producer import DeferredProducer, PubsubMessage
+from microcosm_pubsub.serialization import dumps, loads
+
+
+# How often the relay deletes delivered messages that are past their retention
+PURGE_INTERVAL_SECONDS = 60
+
+
+class OutboxStore(metaclass=ABCMeta):
+    """
+    A durable store of messages to publish.
+
+    """
+    @abstractmethod
+    def append(self, pubsub_messages: List[PubsubMessage], connection=None) -> None:
+        """
+        Append messages atomically.
+
+        :param connection: a connection to the store's database with an open transaction to append
+                           within; the caller commits it
+
+        """
+        pass
+
+    @abstractmethod
+    def claim(self, limit: int, max_attempts: int, lease_seconds: float) -> List[Tuple[int, int, PubsubMessage]]:
+        """
+        Claim the oldest messages that were not delivered, may still be attempted, and are not
+        claimed by another relay.
+
+        :returns: (id, attempts, message) tuples; claims expire after `lease_seconds`
+
+        """
+        pass
+
+    @abstractmethod
+    def mark_delivered(self, ids: List[int]) -> None:
+        pass
+
+    @abstractmethod
+    def mark_failed(self, ids: List[int]) -> None:
+        """
+        Record a failed attempt and release the claim.
+
+        """
+        pass
+
+    @abstractmethod
+    def purge(self, delivered_before: float) -> int:
+        """
+        Delete messages that were delivered before a point in time.
+
+        :returns: the number of deleted messages
+
+        """
+        pass
+
+
+class SQLiteOutboxStore(OutboxStore):
+    """
+    Store messages in a local SQLite database.
+
+    Each process uses its own connection (so that forked workers do not share one).
+
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = Lock()
+        self.connection = None
+        self.pid = None
+
+    def connect(self):
+        if self.connection is None or self.pid != getpid():
+            self.connection = sqlite3.connect(self.path, check_same_thread=False)
+            self.pid = getpid()
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            with self.connection:
+                self.connection.execute("""
+                    CREATE TABLE IF NOT EXISTS pubsub_outbox (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        media_type TEXT NOT NULL,
+                        topic_arn TEXT NOT NULL,
+                        message TEXT NOT NULL,
+                        message_attributes TEXT NOT NULL,
+                        opaque_data TEXT NOT NULL,
+                        created_at REAL NOT NULL,
+                        delivered_at REAL,
+                        claimed_until REAL,
+                        attempts INTEGER NOT NULL DEFAULT 0
+                    )
+                """)
+                self.connection.execute("""
+                    CREATE INDEX IF NOT EXISTS pubsub_outbox_pending
+                    ON pubsub_outbox (id) WHERE delivered_at IS NULL
+                """)
+        return self.connection
+
+    def append(self, pubsub_messages, connection=None):
+        if connection is not None:
+            with self.lock:
+                # make sure that the table exists
+                self.connect()
+            self.insert(connection, pubsub_messages)
+            return
+
+        with self.lock, self.connect() as connection:
+            self.insert(connection, pubsub_messages)
+
+    def insert(self, connection, pubsub_messages):
+        created_at = time()
+        connection.executemany(
+            """
+            INSERT INTO pubsub_outbox (
+                media_type, topic_arn, message, message_attributes, opaque_data, created_at
+            ) VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            [
+                (
+                    pubsub_message.media_type,
+                    pubsub_message.topic_arn,
+                    pubsub_message.message,
+                    dumps(pubsub_message.message_attributes),
+                    dumps(dict(pubsub_message.opaque_data)),
+                    created_at,
+                )
+                for pubsub_message in pubsub_messages
+            ],
+        )
+
+    def claim(self, limit, max_attempts, lease_seconds):
+        now = time()
+        with self.lock:
+            connection = self.connect()
+            # take the database's write lock up front so that concurrent relays claim distinct rows
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                rows = connection.execute(
+                    """
+                    SELECT id, attempts, media_type, topic_arn, message, message_attributes, opaque_data
+                    FROM pubsub_outbox
+                    WHERE delivered_at IS NULL AND attempts < ? AND (claimed_until IS NULL OR claimed_until < ?)
+                    ORDER BY id
+                    LIMIT ?
+                    """,
+                    (max_attempts, now, limit),
+                ).fetchall()
+                connection.executemany(
+                    "UPDATE pubsub_outbox SET claimed_until = ? WHERE id = ?",
+                    [(now + lease_seconds, row[0]) for row in rows],
+                )
+            except Exception:
+                connection.rollback()
+                raise
+            connection.commit()
+
+        return [
+            (
+                id,
+                attempts,
+                PubsubMessage(
+                    media_type=media_type,
+                    message=message,
+                    message_attributes=loads(message_attributes),
+                    opaque_data=loads(opaque_data),
+                    topic_arn=topic_arn,
+                ),
+            )
+            for id, attempts, media_type, topic_arn, message, message_attributes, opaque_data in rows
+        ]
+
+    def mark_delivered(self, ids):
+        delivered_at = time()
+        with self.lock, self.connect() as connection:
+            connection.executemany(
+                "UPDATE pubsub_outbox SET delivered_at = ?, attempts = attempts + 1 WHERE id = ?",
+                [(delivered_at, id) for id in ids],
+            )
+
+    def mark_failed(self, ids):
+        with self.lock, self.connect() as connection:
+            connection.executemany(
+                "UPDATE pubsub_outbox SET attempts = attempts + 1, claimed_until = NULL WHERE id = ?",
+                [(id,) for id in ids],
+            )
+
+    def purge(self, delivered_before):
+        with self.lock, self.connect() as connection:
+            return connection.execute(
+                "DELETE FROM pubsub_outbox WHERE delivered_at < ?",
+                (delivered_before,),
+            ).rowcount
+
+
+@defaults(
+    path="pubsub-outbox.sqlite3",
+)
+def configure_outbox_store(graph):
+    """
+    Configure the outbox store.
+
+    Tests use an in-memory database.
+
+    """
+    path = ":memory:" if graph.metadata.testing else graph.config.pubsub_outbox_store.path
+    return SQLiteOutboxStore(path)
+
+
+class OutboxProducer(DeferredProducer):
+    """
+    A context manager to defer message production until the end of a block and then
+    append the messages to an outbox.
+
+    Pass the connection that the block's work uses (and exit the block before committing it)
+    to append within the same transaction.
+
+    """
+    def __init__(self, producer, outbox_store, connection=None):
+        super().__init__(producer)
+        self.outbox_store = outbox_store
+        self.connection = connection
+
+    def __exit__(self, type, value, traceback):
+        if type is not None:
+            return
+
+        if self.messages:
+            self.outbox_store.append(self.messages, connection=self.connection)
+
+
+def outbox(component, key="sns_producer"):
+    """
+    A decorator to append messages to the outbox after the decorated function has completed
+
+    The append is not part of any transaction of the decorated function; use an `OutboxProducer`
+    with a connection for that.
+
+    """
+    graph = component.graph
+    sns_producer = getattr(graph, key)
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            try:
+                outbox_producer = OutboxProducer(sns_producer, graph.pubsub_outbox_store)
+                setattr(component, key, outbox_producer)
+                with outbox_producer:
+                    return func(*args, **kwargs)
+            finally:
+                setattr(component, key, sns_producer)
+        return wrapper
+    return decorator
+
+
+@defaults(
+    batch_size=typed(int, default_value=100),
+    # how long to wait before checking for new messages once the outbox is drained
+    interval_seconds=typed(float, default_value=1.0),
+    # how long a relay may hold claimed messages before other relays may publish them
+    lease_seconds=typed(float, default_value=60.0),
+    # messages that fail this many times are left in the outbox (and no longer attempted)
+    max_attempts=typed(int, default_value=10),
+    # how long to keep delivered messages
+    retention_seconds=typed(int, default_value=24 * 60 * 60),
+)
+@logger
+class OutboxRelay:
+    """
+    Publish messages from the outbox in batches, on a background thread.
+
+    """
+    logger: Logger
+
+    def __init__(self, graph):
+        self.outbox_store = graph.pubsub_outbox_store
+        self.sns_producer = graph.sns_producer
+        self.batch_size = graph.config.pubsub_outbox_relay.batch_size
+        self.interval_seconds = graph.config.pubsub_outbox_relay.interval_seconds
+        self.lease_seconds = graph.config.pubsub_outbox_relay.lease_seconds
+        self.max_attempts = graph.config.pubsub_outbox_relay.max_attempts
+        self.retention_seconds = graph.config.pubsub_outbox_relay.retention_seconds
+        self.stopped = Event()
+        self.lock = Lock()
+        self.thread = None
+
+    def start(self):
+        with self.lock:
+            if self.thread is not None:
+                return
+
+            self.stopped.clear()
+            self.thread = Thread(target=self.run, name="pubsub-outbox-relay", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        """
+        Stop relaying (after the current batch).
+
+        """
+        with self.lock:
+            thread, self.thread = self.thread, None
+
+        if thread is None:
+            return
+
+        self.stopped.set()
+        thread.join()
+
+    def run(self):
+        last_purge_time = 0.0
+        while not self.stopped.is_set():
+            try:
+                count = self.relay()
+                if time() - last_purge_time > PURGE_INTERVAL_SECONDS:
+                    self.outbox_store.purge(time() - self.retention_seconds)
+                    last_purge_time = time()
+            except Exception:
+                self.logger.warning("Could not relay messages from the outbox", exc_info=True)
+                count = 0
+
+            if count < self.batch_size:
+                # the outbox is drained (or failing); wait for more messages
+                self.stopped.wait(self.interval_seconds)
+
+    def relay(self) -> int:
+        """
+        Publish a batch of pending messages.
+
+        :returns: the number of messages that were attempted
+
+        """
+        pending = self.outbox_store.claim(self.batch_size, self.max_attempts, self.lease_seconds)
+        if not pending:
+            return 0
+
+        message_ids: List[Optional[str]]
+        try:
+            message_ids = self.sns_producer.publish_batch([pubsub_message for _, _, pubsub_message in pending])
+        except PublishBatchError as error:
+            self.logger.warning(str(error))
+            message_ids = error.message_ids
+        except Exception:
+            self.logger.warning("Could not publish messages from the outbox", exc_info=True)
+            message_ids = [None] * len(pending)
+
+        delivered: List[int] = []
+        failed: List[int] = []
+        for (id, attempts, pubsub_message), message_id in zip(pending, message_ids):
+            if message_id is not None:
+                delivered.append(id)
+                continue
+
+            failed.append(id)
+            if attempts + 1 >= self.max_attempts:
+                self.logger.error(
+                    "Giving up on outbox message with media type {media_type} after {attempts} attempts",
+                    extra=dict(
+                        attempts=attempts + 1,
+                        id=id,
+                        media_type=pubsub_message.media_type,
+                        topic_arn=pubsub_message.topic_arn,
+                    ),
+                )
+
+        self.outbox_store.mark_delivered(delivered)
+        self.outbox_store.mark_failed(failed)
+
+        self.logger.debug(
+            "Relayed {delivered} messages from the outbox ({failed} failed)",
+            extra=dict(delivered=len(delivered), failed=len(failed)),
+        )
+        return len(pending)
@@ -0,0 +1,209 @@
+"""
+Prefetch batches of messages.
+
+By default, `SQSMessageDispatcher.handle_batch` receives a batch from SQS and then handles it,
+so the daemon idles for the duration of every (long) poll. A prefetcher receives (and parses)
+batches on a background thread while the current batch is being handled.
+
+Prefetched messages are already invisible to other consumers, so:
+ -  the buffer is bounded to a small number of batches
+ -  batches that could no longer be handled before their visibility timeout expires are returned
+    to the queue; a batch is handled in time if it is taken before the queue's visibility timeout
+    less the expected handling time has elapsed since it was received
+ -  batches that were never handled are returned to the queue when the prefetcher stops
+ -  prefetching is disabled (and batches are received on demand) if the visibility timeout
+    leaves no time to handle a prefetched batch
+
+"""
+from logging import Logger
+from queue import Empty, Full, Queue
+from threading import Event, Lock, Thread
+from time import time
+
+from microcosm_logging.decorators import logger
+
+from microcosm_pubsub.acknowledgements import AcknowledgementBuffer
+
+
+# How often the background thread checks whether it was stopped while the buffer is full
+POLL_INTERVAL_SECONDS = 1
+
+# SQS's default visibility timeout, assumed if the queue's own cannot be looked up
+DEFAULT_VISIBILITY_TIMEOUT_SECONDS = 30
+
+
+@logger
+class SQSPrefetcher:
+    """
+    Receive batches of messages on a background thread.
+
+    """
+    logger: Logger
+
+    def __init__(self, consumer, max_batches, visibility_timeout_seconds=None, handling_seconds=0):
+        """
+        :param visibility_timeout_seconds: the queue's visibility timeout; looked up if not given
+        :param handling_seconds: the expected time needed to handle a batch once it is taken
+
+        """
+        self.consumer = consumer
+        self.visibility_timeout_seconds = visibility_timeout_seconds
+        self.handling_seconds = handling_seconds
+        self.max_age_seconds = None
+        self.batches = Queue(maxsize=max_batches)
+        self.stopped = Event()
+        self.lock = Lock()
+        self.thread = None
+
+    def start(self):
+        with self.lock:
+            if self.thread is not None:
+                return
+
+            if self.max_age_seconds is None:
+                self.max_age_seconds = self.compute_max_age_seconds()
+
+            if not self.enabled:
+                return
+
+            self.stopped.clear()
+            self.thread = Thread(target=self.run, name="sqs-prefetcher", daemon=True)
+            self.thread.start()
+
+    def compute_max_age_seconds(self):
+        """
+        Compute how long a batch may wait so that it can still be handled before it becomes visible.
+
+        """
+        visibility_timeout_seconds = self.visibility_timeout_seconds
+        if visibility_timeout_seconds is None:
+            visibility_timeout_seconds = self.lookup_visibility_timeout_seconds()
+
+        max_age_seconds = visibility_timeout_seconds - self.handling_seconds
+        if max_age_seconds <= 0:
+            self.logger.warning(
+                "Visibility timeout of {visibility_timeout} seconds leaves no time to prefetch batches "
+                "that take {handling} seconds to handle; prefetching is disabled",
+                extra=dict(
+                    handling=self.handling_seconds,
+                    visibility_timeout=visibility_timeout_seconds,
+                ),
+            )
+        return max_age_seconds
+
+    @property
+    def enabled(self):
+        """
+        Prefetch only if prefetched batches can still be handled before they become visible.
+
+        """
+        return self.max_age_seconds is None or self.max_age_seconds > 0
+
+    def lookup_visibility_timeout_seconds(self):
+        try:
+            response = self.consumer.sqs_client.get_queue_attributes(
+                AttributeNames=["VisibilityTimeout"],
+                QueueUrl=self.consumer.sqs_queue_url,
+            )
+            return int(response["Attributes"]["VisibilityTimeout"])
+        except Exception as error:
+            self.logger.warning(
+                "Unable to look up the queue's visibility timeout; assuming {default} seconds: {error}",
+                extra=dict(
+                    default=DEFAULT_VISIBILITY_TIMEOUT_SECONDS,
+                    error=str(error),
+                ),
+            )
+            return DEFAULT_VISIBILITY_TIMEOUT_SECONDS
+
+    def stop(self):
+        """
+        Stop receiving and return all unstarted messages to the queue.
+
+        """
+        with self.lock:
+            thread, self.thread = self.thread, None
+
+        if thread is None:
+            return
+
+        self.stopped.set()
+        thread.join()
+
+        while True:
+            try:
+                _, messages, _ = self.batches.get_nowait()
+            except Empty:
+                break
+            self.release(messages)
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                batch = (time(), self.consumer.receive(), None)
+            except Exception as error:
+                batch = (time(), [], error)
+            else:
+                if not batch[1]:
+                    if not self.consumer.wait_seconds:
+                        # avoid busy polling when long polling is disabled
+                        self.stopped.wait(POLL_INTERVAL_SECONDS)
+                    continue
+
+            if not self.put(batch):
+                self.release(batch[1])
+
+    def put(self, batch):
+        """
+        Wait for room in the buffer unless stopped.
+
+        """
+        while not self.stopped.is_set():
+            try:
+                self.batches.put(batch, timeout=POLL_INTERVAL_SECONDS)
+                return True
+            except Full:
+                continue
+        return False
+
+    def take(self):
+        """
+        Take the next batch, waiting for at most one poll interval.
+
+        :returns: a list of `SQSMessage`
+
+        """
+        self.start()
+
+        if not self.enabled:
+            return self.consumer.receive()
+
+        while True:
+            try:
+                received_time, messages, error = self.batches.get(
+                    timeout=self.consumer.wait_seconds + POLL_INTERVAL_SECONDS,
+                )
+            except Empty:
+                return []
+
+            if error is not None:
+                raise error
+
+            if time() - received_time > self.max_age_seconds:
+                self.logger.info(
+                    "Returning {count} prefetched messages that were not handled in time",
+                    extra=dict(count=len(messages)),
+                )
+                self.release(messages)
+                continue
+
+            return messages
+
+    def release(self, messages):
+        """
+        Make messages visible again so they can be received without waiting for a timeout.
+
+        """
+        with AcknowledgementBuffer(self.consumer) as buffer:
+            for message in messages:
+                buffer.nack(message, 0)
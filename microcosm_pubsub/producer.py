@@ -2,26 +2,48 @@
 Message producer.
 
 """
+import atexit
 from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import copy_context
 from dataclasses import dataclass
 from distutils.util import strtobool
 from functools import wraps
 from logging import Logger
 from time import time
-from typing import Dict, List
+from typing import (
+    Any,
+    Dict,
+    List,
+    Optional,
+)
 
 from boto3.session import Session
 from botocore.client import Config
 from microcosm.api import defaults, typed
+from microcosm.config.types import boolean
 from microcosm.opaque import NormalizedDict
 from microcosm.errors import NotBoundError
 from microcosm_logging.decorators import logger
 from microcosm_logging.timing import elapsed_time
 
-from microcosm_pubsub.batch import MessageBatchSchema
-from microcosm_pubsub.constants import PUBLISHED_KEY, REQUEST_ID_KEY
+from microcosm_pubsub.batch import (
+    CompactMessageBatchSchema,
+    MessageBatchSchema,
+    hoist_opaque_data,
+    splice_raw_json,
+)
+from microcosm_pubsub.constants import (
+    MAX_PUBLISH_BATCH_BYTES,
+    MAX_PUBLISH_BATCH_ENTRIES,
+    OPAQUE_TAG_KEY,
+    PUBLISHED_KEY,
+    REQUEST_ID_KEY,
+)
 from microcosm_pubsub.conventions.naming import make_media_type
-from microcosm_pubsub.errors import TopicNotDefinedError
+from microcosm_pubsub.errors import MessageTooLargeError, PublishBatchError, TopicNotDefinedError
+from microcosm_pubsub.publisher import BackgroundPublisher
+from microcosm_pubsub.serialization import dumps, loads
 from microcosm_pubsub.tracing import add_trace_to_message, trace_outgoing_message
 
 
@@ -38,6 +60,34 @@ class PubsubMessage:
     opaque_data: dict
     topic_arn: str
 
+    @property
+    def size(self) -> int:
+        """
+        The size of the message as SNS counts it: the body plus attribute names, types, and values.
+
+        """
+        return len(self.message.encode("utf-8")) + sum(
+            len(name.encode("utf-8")) + sum(len(str(value).encode("utf-8")) for value in attribute.values())
+            for name, attribute in self.message_attributes.items()
+        )
+
+
+def iter_publish_batches(entries, max_entries=MAX_PUBLISH_BATCH_ENTRIES, max_bytes=MAX_PUBLISH_BATCH_BYTES):
+    """
+    Split (entry id, message) pairs, in order, into chunks that fit in a single PublishBatch request.
+
+    """
+    batch, batch_size = dict(), 0
+    for entry_id, pubsub_message in entries:
+        size = pubsub_message.size
+        if batch and (len(batch) >= max_entries or batch_size + size > max_bytes):
+            yield batch
+            batch, batch_size = dict(), 0
+        batch[entry_id] = pubsub_message
+        batch_size += size
+    if batch:
+        yield batch
+
 
 @logger
 class SNSProducer:
@@ -55,7 +105,11 @@ class SNSProducer:
         sns_topic_arns,
         skip,
         deferred_batch_size,
-        pubsub_producer_metrics
+        pubsub_producer_metrics,
+        batch_publish=False,
+        publish_batch_max_attempts=1,
+        deferred_batch_max_bytes=None,
+        compact_batches=False,
     ):
         self.opaque = opaque
         self.pubsub_message_schema_registry = pubsub_message_schema_registry
@@ -63,22 +117,40 @@ class SNSProducer:
         self.sns_topic_arns = sns_topic_arns
         self.skip = skip
         self.deferred_batch_size = deferred_batch_size
+        self.deferred_batch_max_bytes = deferred_batch_max_bytes
+        self.compact_batches = compact_batches
         self.pubsub_producer_metrics = pubsub_producer_metrics
+        self.batch_publish = batch_publish
+        self.publish_batch_max_attempts = publish_batch_max_attempts
+        self.background_publisher = None
 
     def produce(self, media_type, dct=None, uri=None, **kwargs):
         """
         Produce a message.
 
-        :returns: the message id
+        :returns: the message id, or a `Future` for the message id when publishing asynchronously
 
         """
 
         if self.skip:
             return
-        pubsub_message = self.create_message(media_type, dct, uri, **kwargs)
-        return self.publish_message(pubsub_message)
 
-    def create_message(self, media_type, dct, uri=None, opaque_data=None, **kwargs) -> PubsubMessage:
+        if self.background_publisher is not None:
+            pubsub_message = self.create_message(media_type, dct, uri, **kwargs)
+            return self.background_publisher.submit(pubsub_message)
+
+        # NB: open the tracer before encoding so that its tag is part of the (single) encode
+        with trace_outgoing_message(self.choose_topic_arn(media_type)) as tracer:
+            pubsub_message = self.create_message(media_type, dct, uri, tracer=tracer, **kwargs)
+            return self.publish_message(pubsub_message, tracer=tracer)
+
+    def create_message(self, media_type, dct, uri=None, opaque_data=None, tracer=None, **kwargs) -> PubsubMessage:
+        """
+        Create (and encode) a message.
+
+        :param tracer: an open outgoing message tracer, if any; its tag is added to the opaque data
+
+        """
         opaque_data = NormalizedDict() if opaque_data is None else NormalizedDict(**opaque_data)
 
         if self.opaque is not None:
@@ -86,6 +158,10 @@ class SNSProducer:
 
         opaque_data[PUBLISHED_KEY] = str(time())
 
+        tag = tracer.outgoing_dynatrace_string_tag if tracer is not None else None
+        if tag:
+            opaque_data[OPAQUE_TAG_KEY] = tag
+
         topic_arn = self.choose_topic_arn(media_type)
 
         message_attributes = self.choose_message_attributes(media_type)
@@ -105,7 +181,30 @@ class SNSProducer:
             topic_arn=topic_arn,
         )
 
-    def publish_message(self, pubsub_message: PubsubMessage):
+    @contextmanager
+    def trace_publish(self, pubsub_message: PubsubMessage, tracer=None):
+        """
+        Use an open tracer or trace the message now.
+
+        Messages that were encoded without a tracer (e.g. deferred messages) have the
+        tracer's tag added after the fact.
+
+        """
+        if tracer is not None:
+            yield tracer
+            return
+
+        with trace_outgoing_message(pubsub_message.topic_arn) as tracer:
+            add_trace_to_message(tracer, pubsub_message)
+            yield tracer
+
+    def publish_message(self, pubsub_message: PubsubMessage, tracer=None):
+        """
+        Publish a message.
+
+        :param tracer: the open outgoing message tracer that the message was created with, if any
+
+        """
         extra = dict(
             media_type=pubsub_message.media_type,
             **pubsub_message.opaque_data
@@ -114,9 +213,8 @@ class SNSProducer:
         publish_result = "SUCCESS"
         publish_exception = None
 
-        with trace_outgoing_message(pubsub_message.topic_arn) as tracer, elapsed_time(extra):
+        with self.trace_publish(pubsub_message, tracer) as tracer, elapsed_time(extra):
             try:
-                add_trace_to_message(tracer, pubsub_message)
                 result = self.sns_client.publish(
                     TopicArn=pubsub_message.topic_arn,
                     Message=pubsub_message.message,
@@ -146,6 +244,130 @@ class SNSProducer:
         # If result is not defined, it will exit with an error here
         return result["MessageId"]
 
+    def publish_batch(self, pubsub_messages: List[PubsubMessage], executor=None) -> List[Optional[str]]:
+        """
+        Publish messages using SNS PublishBatch.
+
+        Messages are grouped by topic and sent in chunks of up to ten entries; entries that
+        fail without a sender fault are retried.
+
+        :param executor: an optional executor used to send several chunks at once
+        :returns: the message ids, in the order of the messages
+
+        """
+        message_ids: List[Optional[str]] = [None] * len(pubsub_messages)
+        failures: List[Dict[str, Any]] = []
+
+        entries_by_topic = defaultdict(list)
+        for index, pubsub_message in enumerate(pubsub_messages):
+            entries_by_topic[pubsub_message.topic_arn].append((str(index), pubsub_message))
+
+        chunks = [
+            (topic_arn, chunk)
+            for topic_arn, entries in entries_by_topic.items()
+            for chunk in iter_publish_batches(entries)
+        ]
+        if executor is not None and len(chunks) > 1:
+            # NB: the context is copied here so that each chunk is published within the caller's (opaque) context
+            futures = [
+                executor.submit(copy_context().run, self.publish_chunk, topic_arn, chunk, message_ids)
+                for topic_arn, chunk in chunks
+            ]
+            results = [future.result() for future in futures]
+        else:
+            results = [
+                self.publish_chunk(topic_arn, chunk, message_ids)
+                for topic_arn, chunk in chunks
+            ]
+
+        for chunk_failures in results:
+            failures.extend(chunk_failures)
+
+        if failures:
+            raise PublishBatchError(
+                f"Could not publish {len(failures)} of {len(pubsub_messages)} messages, "
+                f"SNS producer error: {failures[0]}",
+                message_ids=message_ids,
+                failures=failures,
+            )
+
+        return message_ids
+
+    def publish_chunk(
+        self,
+        topic_arn: str,
+        entries: Dict[str, PubsubMessage],
+        message_ids: List[Optional[str]],
+    ) -> List[Dict[str, Any]]:
+        """
+        Publish a single PublishBatch request (with retries of failed entries).
+
+        :param entries: messages to publish, by entry id; entry ids index into `message_ids`
+        :returns: the failures of entries that could not be published
+
+        """
+        self.logger.debug("Publishing batch of {count} messages", extra=dict(count=len(entries)))
+        failures: Dict[str, Dict[str, Any]] = dict()
+
+        with trace_outgoing_message(topic_arn) as tracer:
+            for pubsub_message in entries.values():
+                add_trace_to_message(tracer, pubsub_message)
+
+            for _ in range(self.publish_batch_max_attempts):
+                extra: Dict[str, Any] = dict()
+                with elapsed_time(extra):
+                    try:
+                        response = self.sns_client.publish_batch(
+                            TopicArn=topic_arn,
+                            PublishBatchRequestEntries=[
+                                dict(
+                                    Id=entry_id,
+                                    Message=pubsub_message.message,
+                                    MessageAttributes=pubsub_message.message_attributes,
+                                )
+                                for entry_id, pubsub_message in entries.items()
+                            ],
+                        )
+                    except Exception as error:
+                        response = dict(Failed=[
+                            dict(Id=entry_id, Code=type(error).__name__, Message=str(error), SenderFault=False)
+                            for entry_id in entries
+                        ])
+
+                for success in response.get("Successful", []):
+                    message_ids[int(success["Id"])] = success["MessageId"]
+                    failures.pop(success["Id"], None)
+                    self.pubsub_producer_metrics(
+                        elapsed_time=extra["elapsed_time"],
+                        publish_result="SUCCESS",
+                        media_type=entries[success["Id"]].media_type,
+                    )
+
+                retries = dict()
+                for failure in response.get("Failed", []):
+                    failures[failure["Id"]] = failure
+                    self.pubsub_producer_metrics(
+                        elapsed_time=extra["elapsed_time"],
+                        publish_result="FAILURE",
+                        media_type=entries[failure["Id"]].media_type,
+                    )
+                    if not failure.get("SenderFault"):
+                        retries[failure["Id"]] = entries[failure["Id"]]
+
+                entries = retries
+                if not entries:
+                    break
+
+        return list(failures.values())
+
+    def close(self):
+        """
+        Publish any messages that are still queued for asynchronous publishing.
+
+        """
+        if self.background_publisher is not None:
+            self.background_publisher.close()
+
     def choose_topic_arn(self, media_type):
         """
         Choose a topic for this type of message.
@@ -199,25 +421,122 @@ class DeferredProducer:
         if type is not None:
             return
 
+        if self.producer.batch_publish and len(self.messages) > 1:
+            self.producer.publish_batch(self.messages)
+            return
+
         for pubsub_message in self.messages:
             self.producer.publish_message(pubsub_message)
 
 
 class DeferredBatchProducer(DeferredProducer):
 
-    def generate_message_batches(self, messages, deferred_batch_size):
-        for i in range(0, len(messages), deferred_batch_size):
-            yield messages[i:i + deferred_batch_size]
+    def produce(self, media_type, dct=None, **kwargs):
+        if self.producer.skip:
+            return
+
+        pubsub_message = self.producer.create_message(media_type, dct, **kwargs)
+        if pubsub_message.size > MAX_PUBLISH_BATCH_BYTES:
+            raise MessageTooLargeError(
+                f"Message with media type {media_type} is {pubsub_message.size} bytes; "
+                f"SNS accepts at most {MAX_PUBLISH_BATCH_BYTES}"
+            )
+        self.messages.append(pubsub_message)
+
+    def generate_message_batches(self, messages, deferred_batch_size, max_bytes=None):
+        """
+        Pack messages into batches by count and (optionally) by encoded size.
+
+        Packing is sequential: a batch is closed as soon as the next message does not fit, so
+        messages are published in the order they were produced. A message that does not fit in
+        the byte budget on its own ends up in a batch by itself (and is published directly).
+
+        """
+        batch, batch_size = [], 0
+        for message in messages:
+            size = self.measure_batch_entry(message) if max_bytes else 0
+            if batch and (len(batch) >= deferred_batch_size or (max_bytes and batch_size + size > max_bytes)):
+                yield batch
+                batch, batch_size = [], 0
+            batch.append(message)
+            batch_size += size
+        if batch:
+            yield batch
+
+    def construct_batch_entry(self, pubsub_message: PubsubMessage):
+        return dict(
+            media_type=pubsub_message.media_type,
+            message=pubsub_message.message,
+            message_attributes=pubsub_message.message_attributes,
+            opaque_data=pubsub_message.opaque_data,
+            topic_arn=pubsub_message.topic_arn,
+        )
+
+    def construct_compact_batch_entry(self, pubsub_message: PubsubMessage, shared_opaque_data) -> str:
+        """
+        Encode a message as an entry of a compact batch message.
+
+        The (already encoded) message is embedded as is.
+
+        """
+        entry: Dict[str, Any] = dict(
+            mediaType=pubsub_message.media_type,
+            topicArn=pubsub_message.topic_arn,
+        )
+        opaque_data = {
+            key: value
+            for key, value in pubsub_message.opaque_data.items()
+            if key not in shared_opaque_data
+        }
+        if opaque_data:
+            entry["opaqueData"] = opaque_data
+        if pubsub_message.message_attributes != self.producer.choose_message_attributes(pubsub_message.media_type):
+            entry["messageAttributes"] = pubsub_message.message_attributes
+
+        return splice_raw_json(dumps(entry), "message", pubsub_message.message)
+
+    def measure_batch_entry(self, pubsub_message: PubsubMessage) -> int:
+        """
+        Measure the encoded size of a message within a batch message (including a separator).
+
+        For compact batches, this is an upper bound because shared opaque data is not hoisted.
+
+        """
+        if self.producer.compact_batches:
+            entry = self.construct_compact_batch_entry(pubsub_message, shared_opaque_data={})
+        else:
+            entry = dumps(self.construct_batch_entry(pubsub_message))
+        return len(entry.encode("utf-8")) + 2
+
+    def produce_compact_batch(self, message_batch: List[PubsubMessage]):
+        """
+        Produce a compact batch message.
+
+        """
+        shared_opaque_data = hoist_opaque_data(pubsub_message.opaque_data for pubsub_message in message_batch)
+        entries = [
+            self.construct_compact_batch_entry(pubsub_message, shared_opaque_data)
+            for pubsub_message in message_batch
+        ]
+
+        media_type = CompactMessageBatchSchema.MEDIA_TYPE
+        with trace_outgoing_message(self.producer.choose_topic_arn(media_type)) as tracer:
+            pubsub_message = self.producer.create_message(
+                media_type,
+                None,
+                messages=[],
+                shared_opaque_data=shared_opaque_data,
+                tracer=tracer,
+            )
+            # NB: encode the (small) batch message normally and splice in the encoded entries
+            batch_message = loads(pubsub_message.message)
+            del batch_message["messages"]
+            pubsub_message.message = splice_raw_json(dumps(batch_message), "messages", f"[{','.join(entries)}]")
+            return self.producer.publish_message(pubsub_message, tracer=tracer)
 
     def construct_batch_pubsub_message(self, message_batch: List[PubsubMessage]):
         return [
-            dict(
-                media_type=pubsub_message.media_type,
-                message=pubsub_message.message,
-                message_attributes=pubsub_message.message_attributes,
-                opaque_data=pubsub_message.opaque_data,
-                topic_arn=pubsub_message.topic_arn,
-            )
+            self.construct_batch_entry(pubsub_message)
             for pubsub_message in message_batch
         ]
 
@@ -225,8 +544,19 @@ class DeferredBatchProducer(DeferredProducer):
         if type is not None:
             return
 
-        for message_batch in self.generate_message_batches(self.messages, self.producer.deferred_batch_size):
-            if len(message_batch) > 1:
+        if self.producer.batch_publish:
+            # publish natively instead of wrapping messages in a batch message
+            return super().__exit__(type, value, traceback)
+
+        message_batches = self.generate_message_batches(
+            self.messages,
+            self.producer.deferred_batch_size,
+            self.producer.deferred_batch_max_bytes,
+        )
+        for message_batch in message_batches:
+            if len(message_batch) > 1 and self.producer.compact_batches:
+                self.produce_compact_batch(message_batch)
+            elif len(message_batch) > 1:
                 self.producer.produce(
                     MessageBatchSchema.MEDIA_TYPE,
                     messages=self.construct_batch_pubsub_message(message_batch),
@@ -330,6 +660,12 @@ def configure_sns_topic_arns(graph):
             media_type = make_media_type(resource_name, lifecycle_change)
             sns_topic_arns[media_type] = topic
 
+    # compact batches use the batch topic unless configured otherwise
+    sns_topic_arns.setdefault(
+        CompactMessageBatchSchema.MEDIA_TYPE,
+        sns_topic_arns.get(MessageBatchSchema.MEDIA_TYPE),
+    )
+
     return sns_topic_arns
 
 
@@ -341,6 +677,20 @@ def configure_sns_topic_arns(graph):
     skip=None,
     # the size used to determine batching in the deferred batch producer
     deferred_batch_size=typed(int, default_value=100),
+    # the encoded size budget for the messages in a deferred batch; the rest of the
+    # SNS limit (256 KiB) is headroom for the batch message itself
+    deferred_batch_max_bytes=typed(int, default_value=240 * 1024),
+    # publish deferred batches in the compact format; consumers must be able to handle it
+    compact_batches=typed(boolean, default_value=False),
+    # publish deferred messages using SNS PublishBatch
+    batch_publish=typed(boolean, default_value=False),
+    publish_batch_max_attempts=typed(int, default_value=3),
+    # publish messages on background threads; `produce` returns a future for the message id
+    async_publish=typed(boolean, default_value=False),
+    async_queue_size=typed(int, default_value=10000),
+    async_flushers=typed(int, default_value=1),
+    # what to do when the queue is full: "block", "drop", or "raise"
+    async_queue_full_policy="block",
     # SNS endpoint timeout configuration
     connect_timeout=typed(int, default_value=60),
     read_timeout=typed(int, default_value=60),
@@ -391,12 +741,27 @@ def configure_sns_producer(graph):
         # If configured explicitly, respect the flag
         skip = strtobool(graph.config.sns_producer.skip)
 
-    return SNSProducer(
+    sns_producer = SNSProducer(
         opaque=opaque,
         pubsub_message_schema_registry=graph.pubsub_message_schema_registry,
         sns_client=sns_client,
         sns_topic_arns=graph.sns_topic_arns,
         skip=skip,
         deferred_batch_size=graph.config.sns_producer.deferred_batch_size,
+        deferred_batch_max_bytes=graph.config.sns_producer.deferred_batch_max_bytes,
+        compact_batches=graph.config.sns_producer.compact_batches,
         pubsub_producer_metrics=graph.pubsub_producer_metrics,
+        batch_publish=graph.config.sns_producer.batch_publish,
+        publish_batch_max_attempts=graph.config.sns_producer.publish_batch_max_attempts,
     )
+
+    if graph.config.sns_producer.async_publish:
+        sns_producer.background_publisher = BackgroundPublisher(
+            producer=sns_producer,
+            max_queue_size=graph.config.sns_producer.async_queue_size,
+            flushers=graph.config.sns_producer.async_flushers,
+            queue_full_policy=graph.config.sns_producer.async_queue_full_policy,
+        )
+        atexit.register(sns_producer.close)
+
+    return sns_producer
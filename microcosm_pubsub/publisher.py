@@ -0,0 +1,145 @@
+"""
+Publish messages on background threads.
+
+By default, `SNSProducer.produce` blocks the caller for a full SNS round trip. In asynchronous
+mode, `produce` encodes the message in the caller's thread (so that opaque data is captured)
+and enqueues it; flusher threads publish queued messages in batches.
+
+The queue is bounded. When it is full, `produce` blocks, drops the message, or raises,
+depending on the configured policy. Queued messages are published when the publisher is closed.
+
+"""
+from concurrent.futures import Future
+from logging import Logger
+from queue import Empty, Full, Queue
+from threading import Lock, Thread
+
+from microcosm_logging.decorators import logger
+
+from microcosm_pubsub.constants import MAX_PUBLISH_BATCH_ENTRIES
+from microcosm_pubsub.errors import PublishBatchError, PublishQueueFullError
+
+
+QUEUE_FULL_POLICIES = ("block", "drop", "raise")
+
+
+@logger
+class BackgroundPublisher:
+    """
+    Publish queued messages on flusher threads.
+
+    """
+    logger: Logger
+
+    def __init__(self, producer, max_queue_size, flushers=1, queue_full_policy="block"):
+        if queue_full_policy not in QUEUE_FULL_POLICIES:
+            raise ValueError(f"Unsupported queue full policy: {queue_full_policy}")
+
+        self.producer = producer
+        self.flushers = flushers
+        self.queue_full_policy = queue_full_policy
+        self.queue = Queue(maxsize=max_queue_size)
+        self.lock = Lock()
+        self.threads = []
+
+    def start(self):
+        with self.lock:
+            if self.threads:
+                return
+
+            self.threads = [
+                Thread(target=self.run, name=f"sns-publisher-{index}", daemon=True)
+                for index in range(self.flushers)
+            ]
+            for thread in self.threads:
+                thread.start()
+
+    def close(self):
+        """
+        Publish all queued messages and stop the flusher threads.
+
+        """
+        with self.lock:
+            threads, self.threads = self.threads, []
+
+        for _ in threads:
+            self.queue.put(None)
+        for thread in threads:
+            thread.join()
+
+    def submit(self, pubsub_message):
+        """
+        Queue a message for publishing.
+
+        :returns: a `Future` for the message id
+        :raises PublishQueueFullError: if the queue is full and the policy is to raise
+
+        """
+        self.start()
+
+        future = Future()
+        try:
+            self.queue.put((pubsub_message, future), block=self.queue_full_policy == "block")
+        except Full:
+            error = PublishQueueFullError(
+                f"Could not queue message with media type {pubsub_message.media_type}: publish queue is full",
+            )
+            if self.queue_full_policy == "raise":
+                raise error
+
+            self.logger.warning(
+                "Dropping message with media type {media_type}: publish queue is full",
+                extra=dict(media_type=pubsub_message.media_type),
+            )
+            future.set_exception(error)
+
+        return future
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+
+            items = [item]
+            while len(items) < MAX_PUBLISH_BATCH_ENTRIES:
+                try:
+                    item = self.queue.get_nowait()
+                except Empty:
+                    break
+                if item is None:
+                    self.publish(items)
+                    return
+                items.append(item)
+
+            self.publish(items)
+
+    def publish(self, items):
+        """
+        Publish queued messages and resolve their futures.
+
+        """
+        pubsub_messages = [pubsub_message for pubsub_message, _ in items]
+        try:
+            if len(pubsub_messages) == 1:
+                message_ids = [self.producer.publish_message(pubsub_messages[0])]
+            else:
+                message_ids = self.producer.publish_batch(pubsub_messages)
+        except PublishBatchError as error:
+            self.logger.warning(str(error))
+            for (_, future), message_id in zip(items, error.message_ids):
+                if message_id is None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(message_id)
+        except Exception as error:
+            self.logger.warning(
+                "Could not publish {count} messages",
+                extra=dict(count=len(items)),
+                exc_info=True,
+            )
+            for _, future in items:
+                future.set_exception(error)
+        else:
+            for (_, future), message_id in zip(items, message_ids):
+                future.set_result(message_id)
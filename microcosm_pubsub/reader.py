@@ -2,11 +2,12 @@
 Implement SQS message reading from other sources.
 
 """
-from json import loads
 from sys import stdin
 
 from microcosm_daemon.error_policy import ExitError
 
+from microcosm_pubsub.serialization import loads
+
 
 class SQSFileReader:
     """
@@ -36,9 +37,15 @@ class SQSFileReader:
     def delete_message(self, *args, **kwargs):
         pass
 
+    def delete_message_batch(self, Entries, **kwargs):
+        return dict(Successful=[dict(Id=entry["Id"]) for entry in Entries], Failed=[])
+
     def change_message_visibility(self, *args, **kwargs):
         pass
 
+    def change_message_visibility_batch(self, Entries, **kwargs):
+        return dict(Successful=[dict(Id=entry["Id"]) for entry in Entries], Failed=[])
+
 
 class SQSStdInReader:
     """
@@ -62,24 +69,42 @@ class SQSStdInReader:
     def delete_message(self, *args, **kwargs):
         pass
 
+    def delete_message_batch(self, Entries, **kwargs):
+        return dict(Successful=[dict(Id=entry["Id"]) for entry in Entries], Failed=[])
+
     def change_message_visibility(self, *args, **kwargs):
         pass
 
+    def change_message_visibility_batch(self, Entries, **kwargs):
+        return dict(Successful=[dict(Id=entry["Id"]) for entry in Entries], Failed=[])
+
 
 class SQSJsonReader:
     """
     Read message data from a JSON string.
-    Accepts single message, but appended to list for backward compatibility
+    Accepts a list of messages (e.g. the records of a Lambda event) or a single message
 
     """
     def __init__(self, message):
         self.message = message
 
+    @property
+    def messages(self):
+        if isinstance(self.message, list):
+            return self.message
+        return [self.message]
+
     def receive_message(self, **kwargs):
-        return dict(Messages=[self.message])
+        return dict(Messages=self.messages)
 
     def delete_message(self, *args, **kwargs):
         pass
 
+    def delete_message_batch(self, Entries, **kwargs):
+        return dict(Successful=[dict(Id=entry["Id"]) for entry in Entries], Failed=[])
+
     def change_message_visibility(self, *args, **kwargs):
         pass
+
+    def change_message_visibility_batch(self, Entries, **kwargs):
+        return dict(Successful=[dict(Id=entry["Id"]) for entry in Entries], Failed=[])
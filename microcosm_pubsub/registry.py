@@ -2,11 +2,12 @@
 Registry of SQS message handlers.
 
 """
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
 from inspect import isclass
+from threading import Lock
 
 from marshmallow import EXCLUDE
-from microcosm.api import defaults
+from microcosm.api import defaults, typed
 from microcosm_logging.decorators import logger
 
 from microcosm_pubsub.codecs import PubSubMessageCodec
@@ -26,13 +27,20 @@ class PubSubMessageSchemaRegistry:
     """
     Keeps track of available message schemas.
 
+    Codecs are cached per media type (up to a bound) because constructing schemas is not cheap.
+
     """
     def __init__(self, graph):
         self._media_types = set()
         self._mappings = dict()
+        self._codecs = OrderedDict()
+        # incremented whenever cached codecs are invalidated
+        self._generation = 0
+        self._lock = Lock()
         self.graph = graph
         self.lifecycle_change = graph.pubsub_lifecycle_change
         self.auto_register = graph.config.pubsub_message_schema_registry.auto_register
+        self.codec_cache_size = graph.config.pubsub_message_schema_registry.codec_cache_size
 
     def register(self, media_type, value):
         """
@@ -41,6 +49,11 @@ class PubSubMessageSchemaRegistry:
         It is an error to register more than one value for the same media type.
 
         """
+        with self._lock:
+            # registration may change which schema (or pattern) matches a media type
+            self._codecs.clear()
+            self._generation += 1
+
         self._media_types.add(media_type)
 
         if isinstance(value, str):
@@ -80,9 +93,34 @@ class PubSubMessageSchemaRegistry:
 
     def find(self, media_type):
         """
-        Create a codec or raise KeyError. If autoregistration is enabled, falls
+        Find a (cached) codec or raise KeyError. If autoregistration is enabled, falls
         back to the URIMessageSchema.
 
+        """
+        with self._lock:
+            codec = self._codecs.get(media_type)
+            if codec is not None:
+                self._codecs.move_to_end(media_type)
+                return codec
+            generation = self._generation
+
+        codec = self.create_codec(media_type)
+
+        if self.codec_cache_size > 0:
+            with self._lock:
+                if generation != self._generation:
+                    # a registration invalidated the cache while the codec was being created
+                    return codec
+                self._codecs[media_type] = codec
+                while len(self._codecs) > self.codec_cache_size:
+                    self._codecs.popitem(last=False)
+
+        return codec
+
+    def create_codec(self, media_type):
+        """
+        Create a codec or raise KeyError.
+
         """
         matching_media_type = self.find_matching_media_type(media_type)
         if matching_media_type is None:
@@ -170,6 +208,8 @@ class SQSMessageHandlerRegistry:
 
 @defaults(
     auto_register=True,
+    # Maximum number of media types with cached codecs (0 disables caching)
+    codec_cache_size=typed(int, default_value=256),
 )
 def configure_schema_registry(graph):
     return PubSubMessageSchemaRegistry(graph)
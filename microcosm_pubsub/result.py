@@ -79,6 +79,12 @@ class MessageHandlingResult:
     elapsed_time: Optional[float] = None
     handle_start_time: Optional[float] = None
     retry_timeout_seconds: Optional[int] = None
+    # Error code if the message could not be (batch) acked or nacked
+    resolution_failure: Optional[str] = None
+    # Duration of each handling stage in milliseconds, if enabled (see `microcosm_pubsub.stages`)
+    stage_timings: Optional[Dict[str, float]] = None
+    # Id of the handled message
+    message_id: Optional[str] = None
 
     @classmethod
     def invoke(cls, handler, message: SQSMessage):
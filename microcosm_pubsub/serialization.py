@@ -0,0 +1,152 @@
+"""
+JSON serialization backends.
+
+JSON encoding and decoding is a large share of per-message CPU. Codecs, envelopes, readers,
+and tracing all go through `dumps` and `loads` here, which delegate to the standard library
+unless a faster backend (orjson or ujson) is configured explicitly.
+
+The faster backends do not decode every message exactly as the standard library does (see
+their docstrings), so they are opt-in.
+
+The backend is process-global: codecs, readers, and tracing have no access to an object graph.
+Configuring a backend by name (via the `pubsub_json_backend` component) replaces it for every
+graph in the process; graphs that do not name a backend leave it unchanged. The name only takes
+effect once a graph uses the component (`ConsumerDaemon` does; producer-only graphs must opt in).
+
+"""
+import json
+from abc import ABCMeta, abstractmethod
+
+from microcosm.api import defaults
+
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+try:
+    import ujson
+    HAS_UJSON = True
+except ImportError:
+    HAS_UJSON = False
+
+
+class JSONBackend(metaclass=ABCMeta):
+
+    @classmethod
+    def is_available(cls):
+        return True
+
+    @abstractmethod
+    def dumps(self, obj) -> str:
+        pass
+
+    @abstractmethod
+    def loads(self, value):
+        pass
+
+    @classmethod
+    def choose_json_backend(cls, name):
+        for subclass in cls.__subclasses__():
+            if subclass.__name__ == name:
+                if not subclass.is_available():
+                    raise Exception("JSON backend is not installed: {}".format(name))
+                return subclass
+        raise Exception("No JSON backend configured with class name: {}".format(name))
+
+
+class StdlibJSONBackend(JSONBackend):
+    """
+    Standard library JSON.
+
+    """
+    def dumps(self, obj):
+        return json.dumps(obj)
+
+    def loads(self, value):
+        return json.loads(value)
+
+
+class OrjsonJSONBackend(JSONBackend):
+    """
+    orjson, falling back to the standard library for values that orjson cannot encode
+    (e.g. integers wider than 64 bits) or decode (e.g. `NaN` and `Infinity`).
+
+    NB: orjson decodes integers wider than 64 bits as floats and encodes `NaN` and `Infinity` as `null`.
+
+    """
+    @classmethod
+    def is_available(cls):
+        return HAS_ORJSON
+
+    def dumps(self, obj):
+        try:
+            return orjson.dumps(obj).decode("utf-8")
+        except TypeError:
+            return json.dumps(obj)
+
+    def loads(self, value):
+        try:
+            return orjson.loads(value)
+        except orjson.JSONDecodeError:
+            return json.loads(value)
+
+
+class UjsonJSONBackend(JSONBackend):
+    """
+    ujson, falling back to the standard library for values that ujson cannot encode or decode
+    (e.g. integers wider than 64 bits, `NaN` and `Infinity`).
+
+    """
+    @classmethod
+    def is_available(cls):
+        return HAS_UJSON
+
+    def dumps(self, obj):
+        try:
+            return ujson.dumps(obj, escape_forward_slashes=False)
+        except (OverflowError, ValueError):
+            return json.dumps(obj)
+
+    def loads(self, value):
+        try:
+            return ujson.loads(value)
+        except ValueError:
+            return json.loads(value)
+
+
+_backend: JSONBackend = StdlibJSONBackend()
+
+
+def use_json_backend(backend):
+    """
+    Set the process-wide JSON backend.
+
+    """
+    global _backend
+    _backend = backend
+
+
+def dumps(obj) -> str:
+    return _backend.dumps(obj)
+
+
+def loads(value):
+    return _backend.loads(value)
+
+
+@defaults(
+    # Class name of the JSON backend to use; defaults to the standard library
+    name=None,
+)
+def configure_json_backend(graph):
+    """
+    Configure the process-wide JSON backend, if one is named.
+
+    """
+    name = graph.config.pubsub_json_backend.name
+    if name:
+        use_json_backend(JSONBackend.choose_json_backend(name)())
+    return _backend
@@ -0,0 +1,59 @@
+"""
+Per-stage latency instrumentation.
+
+When enabled (`sqs_consumer.stage_timings`), the consumer, envelope, and dispatcher record how
+long each stage of receiving and handling a message took, in milliseconds:
+
+ -  receive: the SQS request that returned the message (shared by its batch)
+ -  parse_body, validate_md5, parse_message, parse_content: envelope parsing
+ -  initialize: setting up opaque data and tracing for the message
+ -  validate, find_handler, handle: dispatch
+ -  log, error_reporting, resolve: handling the result
+ -  metrics: sending metrics for the result (sent on its own, once the other metrics were sent)
+
+Timings are exposed as `MessageHandlingResult.stage_timings` and sent as `message_stage`
+histograms. When disabled, a shared no-op timer is used.
+
+"""
+from time import perf_counter
+
+
+class StageTimer:
+    """
+    Record the duration of consecutive stages using a monotonic clock.
+
+    """
+    __slots__ = ("last", "timings")
+
+    def __init__(self, timings=None):
+        self.timings = dict() if timings is None else timings
+        self.last = perf_counter()
+
+    def mark(self, stage):
+        """
+        Record the time since the previous mark (or since creation) as the duration of a stage.
+
+        """
+        now = perf_counter()
+        self.timings[stage] = self.timings.get(stage, 0.0) + (now - self.last) * 1000
+        self.last = now
+
+
+class NullStageTimer:
+    """
+    A stage timer that records nothing.
+
+    """
+    __slots__ = ()
+
+    timings = None
+
+    def mark(self, stage):
+        pass
+
+
+NULL_STAGE_TIMER = NullStageTimer()
+
+
+def create_stage_timer(enabled, timings=None):
+    return StageTimer(timings) if enabled else NULL_STAGE_TIMER
@@ -1,4 +1,16 @@
-from hamcrest import assert_that, equal_to, is_
+from operator import add
+from threading import Barrier, Event
+from time import sleep
+
+from hamcrest import (
+    assert_that,
+    calling,
+    equal_to,
+    is_,
+    less_than,
+    none,
+    raises,
+)
 
 from microcosm_pubsub.chain import Chain
 from microcosm_pubsub.chain.statements import for_each
@@ -43,3 +55,146 @@ def test_for_each_when():
         chain(items=[0, 1, 2, 3, 4, 5]),
         is_(equal_to([0, 2, 4])),
     )
+
+
+def test_for_each_concurrently():
+    barrier = Barrier(3, timeout=5)
+
+    def upper(item):
+        barrier.wait()
+        return item.upper()
+
+    chain = Chain(
+        for_each("item").in_("items").do(upper).concurrently(max_workers=3),
+    )
+
+    assert_that(
+        chain(items=["a", "b", "c"]),
+        is_(equal_to(["A", "B", "C"])),
+    )
+
+
+def test_for_each_concurrently_when():
+    chain = Chain(
+        for_each("item").in_("items").do(
+            lambda item: None if item % 2 else item,
+        ).when_not_none().concurrently(),
+    )
+
+    assert_that(
+        chain(items=[0, 1, 2, 3, 4, 5]),
+        is_(equal_to([0, 2, 4])),
+    )
+
+
+def test_for_each_concurrently_raises_first_error():
+    second_failed = Event()
+
+    def check(item):
+        if item == 1:
+            second_failed.wait(timeout=5)
+            raise ValueError("first")
+        if item == 2:
+            second_failed.set()
+            raise KeyError("second")
+        return item
+
+    chain = Chain(
+        for_each("item").in_("items").do(check).concurrently(max_workers=3),
+    )
+
+    assert_that(
+        calling(chain).with_args(items=[0, 1, 2]),
+        raises(ValueError, "first"),
+    )
+
+
+def test_for_each_concurrently_fails_fast():
+    calls = []
+
+    def check(item):
+        calls.append(item)
+        if item == 0:
+            raise ValueError("failed")
+        sleep(0.05)
+        return item
+
+    chain = Chain(
+        for_each("item").in_("items").do(check).concurrently(max_workers=1),
+    )
+
+    assert_that(
+        calling(chain).with_args(items=list(range(10))),
+        raises(ValueError),
+    )
+    assert_that(len(calls), is_(less_than(10)))
+
+
+def test_for_each_concurrently_without_fail_fast():
+    calls = []
+
+    def check(item):
+        calls.append(item)
+        if item == 0:
+            raise ValueError("failed")
+        return item
+
+    chain = Chain(
+        for_each("item").in_("items").do(check).concurrently(max_workers=1, fail_fast=False),
+    )
+
+    assert_that(
+        calling(chain).with_args(items=list(range(10))),
+        raises(ValueError),
+    )
+    assert_that(calls, is_(equal_to(list(range(10)))))
+
+
+def test_for_each_reduce():
+    chain = Chain(
+        for_each("item").in_("items").do(
+            lambda item: None if item % 2 else item,
+        ).when_not_none().reduce(add, 0).as_("total"),
+        lambda total: total,
+    )
+
+    assert_that(
+        chain(items=iter(range(10))),
+        is_(equal_to(20)),
+    )
+
+
+def test_for_each_reduce_without_initial_value():
+    chain = Chain(
+        for_each("item").in_("items").do(
+            lambda item: item,
+        ).reduce(add).in_chunks(3).as_("total"),
+        lambda total: total,
+    )
+
+    assert_that(chain(items=iter(range(1, 11))), is_(equal_to(55)))
+    assert_that(chain(items=iter([])), is_(none()))
+
+
+def test_for_each_into_sink():
+    chunks = []
+    consumed = []
+
+    def items():
+        for item in range(7):
+            consumed.append(item)
+            yield item
+
+    def sink(values):
+        # items are consumed one chunk at a time
+        assert_that(len(consumed), is_(equal_to(sum(map(len, chunks)) + len(values))))
+        chunks.append(values)
+
+    chain = Chain(
+        for_each("item").in_("items").do(
+            lambda item: item * 10,
+        ).into(sink).in_chunks(3).concurrently(),
+    )
+
+    assert_that(chain(items=items()), is_(equal_to(7)))
+    assert_that(chunks, is_(equal_to([[0, 10, 20], [30, 40, 50], [60]])))
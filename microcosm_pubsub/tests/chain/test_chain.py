@@ -77,3 +77,44 @@ class TestChain:
             chain(),
             is_(equal_to(200)),
         )
+
+    def test_chain_links_are_compiled_once(self):
+        chain = Chain(
+            extracts("arg")(lambda: 20),
+            lambda arg: arg * 10,
+        )
+        plans = chain.compile()
+
+        assert_that(chain(), is_(equal_to(200)))
+        assert_that(chain(), is_(equal_to(200)))
+        assert_that(chain.compile(), is_(plans))
+
+    def test_chain_recompiles_changed_links(self):
+        chain = Chain(
+            lambda: 100,
+        )
+        assert_that(chain(), is_(equal_to(100)))
+
+        chain.links.append(lambda: 200)
+        assert_that(chain(), is_(equal_to(200)))
+
+    def test_chain_with_custom_context_decorators(self):
+        calls = []
+
+        def record(context, func, assigned):
+            calls.append(func)
+            return func
+
+        class RecordingChain(Chain):
+            @property
+            def context_decorators(self):
+                return super().context_decorators + [record]
+
+        link = extracts("arg")(lambda: 20)
+        chain = RecordingChain(
+            link,
+            lambda arg: arg * 10,
+        )
+        assert_that(chain(), is_(equal_to(200)))
+        assert_that(chain(), is_(equal_to(200)))
+        assert_that(len(calls), is_(equal_to(4)))
@@ -1,13 +1,17 @@
+from concurrent.futures import ThreadPoolExecutor
+
 from hamcrest import (
     assert_that,
     calling,
     contains_exactly,
+    equal_to,
     has_length,
     is_,
     raises,
 )
 
-from microcosm_pubsub.chain.context import SafeContext
+from microcosm_pubsub.chain import Chain, call, for_each
+from microcosm_pubsub.chain.context import FlatSafeContext, SafeContext
 
 
 class TestSafeContext:
@@ -71,3 +75,94 @@ class TestScopedSafeContext:
                 "arg",
             ),
         )
+
+
+class TestFlatSafeContext:
+
+    def setup_method(self):
+        self.parent = FlatSafeContext()
+        self.parent["arg"] = 20
+
+        self.context = self.parent.local().local()
+
+    def test_can_read_parent_arg(self):
+        assert_that(self.context["arg"], is_(20))
+        assert_that(self.context.arg, is_(20))
+        assert_that(self.context["context"], is_(self.context))
+
+    def test_cannot_overwrite_parent_arg(self):
+        assert_that(
+            calling(self.context.update).with_args(arg=21),
+            raises(ValueError),
+        )
+
+    def test_cannot_overwrite_own_arg(self):
+        self.context["arg2"] = 42
+        assert_that(self.context.arg2, is_(42))
+        assert_that(
+            calling(self.context.update).with_args(arg2=21),
+            raises(ValueError),
+        )
+
+    def test_writes_do_not_leak_to_parent(self):
+        self.context["arg2"] = 42
+        self.context.assign("arg", 21)
+
+        assert_that(dict(self.context), is_(equal_to(dict(arg=21, arg2=42))))
+        assert_that(dict(self.parent), is_(equal_to(dict(arg=20))))
+
+    def test_local_may_shadow_parent_arg(self):
+        context = self.parent.local(arg=21)
+        assert_that(context.arg, is_(21))
+        assert_that(self.parent.arg, is_(20))
+
+    def test_snapshot(self):
+        snapshot = self.parent.snapshot()
+        self.parent["arg2"] = 42
+        del snapshot["arg"]
+
+        assert_that(snapshot, has_length(0))
+        assert_that(self.parent, has_length(2))
+
+    def test_local_does_not_copy_parent(self):
+        parent = FlatSafeContext({f"arg{index}": index for index in range(100)})
+        scope = parent.local(item=1)
+
+        assert_that(scope.overlay, is_(equal_to(dict(item=1))))
+        assert_that(parent.local().base, is_(parent.base))
+        assert_that(scope, has_length(101))
+        assert_that(scope.arg99, is_(99))
+
+    def test_delete_does_not_leak_to_scopes(self):
+        scope = self.parent.local()
+        del self.parent["arg"]
+
+        assert_that(self.parent, has_length(0))
+        assert_that(scope.arg, is_(20))
+
+    def test_concurrent_writes(self):
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            for index in range(100):
+                executor.submit(self.context.__setitem__, f"arg{index}", index)
+                executor.submit(self.context.local)
+
+        assert_that(self.context, has_length(101))
+
+    def test_chain_context_type(self):
+        class FlatChain(Chain):
+            @property
+            def new_context_type(self):
+                return FlatSafeContext
+
+        chain = FlatChain(
+            for_each("item").in_("items").do(
+                for_each("letter").in_("item").do(
+                    call(lambda letter, prefix: prefix + letter).with_args(prefix="-").as_("res"),
+                ),
+            ),
+        )
+
+        assert_that(
+            chain(items=["ab", "c"]),
+            is_(equal_to([["-a", "-b"], ["-c"]])),
+        )
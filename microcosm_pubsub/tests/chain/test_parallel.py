@@ -0,0 +1,132 @@
+from threading import Barrier, Event
+
+from hamcrest import (
+    assert_that,
+    calling,
+    equal_to,
+    is_,
+    raises,
+)
+
+from microcosm_pubsub.chain import ParallelChain
+from microcosm_pubsub.chain.context_decorators import LinkPlan
+from microcosm_pubsub.chain.decorators import binds, extracts
+from microcosm_pubsub.chain.parallel import compute_dependencies
+
+
+def extract_foo():
+    return "foo"
+
+
+def extract_bar():
+    return "bar"
+
+
+def extract_baz(foo, bar):
+    return foo + bar
+
+
+class TestParallelChain:
+
+    def test_compute_dependencies(self):
+        plans = [
+            LinkPlan(link)
+            for link in (
+                extract_foo,
+                extract_bar,
+                extract_baz,
+                lambda context: None,
+                lambda foo: foo,
+            )
+        ]
+
+        assert_that(
+            compute_dependencies(plans),
+            is_(equal_to([
+                set(),
+                set(),
+                {0, 1},
+                {0, 1, 2},
+                {3},
+            ])),
+        )
+
+    def test_independent_links_run_concurrently(self):
+        barrier = Barrier(2, timeout=5)
+
+        @extracts("foo")
+        def fetch_foo():
+            barrier.wait()
+            return "foo"
+
+        @extracts("bar")
+        def fetch_bar():
+            barrier.wait()
+            return "bar"
+
+        chain = ParallelChain(
+            fetch_foo,
+            fetch_bar,
+            extract_baz,
+        )
+        assert_that(chain(), is_(equal_to("foobar")))
+
+    def test_chain_returns_last_value(self):
+        chain = ParallelChain(
+            extract_foo,
+            lambda foo: foo * 2,
+            extract_bar,
+        )
+        assert_that(chain(), is_(equal_to("bar")))
+
+    def test_chain_with_binds_and_context(self):
+        chain = ParallelChain(
+            extract_foo,
+            binds(foo="value")(extracts("bound")(lambda value: value.upper())),
+            lambda context: context.bound + context.foo,
+        )
+        assert_that(chain(), is_(equal_to("FOOfoo")))
+
+    def test_conflicting_writes_raise(self):
+        chain = ParallelChain(
+            extract_foo,
+            extracts("foo")(lambda: "other"),
+        )
+        assert_that(
+            calling(chain),
+            raises(ValueError, "Key 'foo' already set"),
+        )
+
+    def test_earliest_error_is_raised(self):
+        later_failed = Event()
+
+        def fail_first():
+            later_failed.wait(timeout=5)
+            raise ValueError("first")
+
+        def fail_second():
+            later_failed.set()
+            raise KeyError("second")
+
+        chain = ParallelChain(
+            fail_first,
+            fail_second,
+        )
+        assert_that(
+            calling(chain),
+            raises(ValueError, "first"),
+        )
+
+    def test_links_after_an_error_are_not_started(self):
+        calls = []
+
+        def extract_bar():
+            raise ValueError("failed")
+
+        chain = ParallelChain(
+            extract_foo,
+            extract_bar,
+            lambda foo, bar: calls.append(foo),
+        )
+        assert_that(calling(chain), raises(ValueError))
+        assert_that(calls, is_(equal_to([])))
@@ -0,0 +1,198 @@
+"""
+PublishBatchMessage handler tests.
+
+"""
+from json import loads
+from unittest.mock import patch
+
+from hamcrest import (
+    assert_that,
+    calling,
+    contains_exactly,
+    equal_to,
+    has_entries,
+    has_length,
+    is_,
+    not_,
+    raises,
+)
+from microcosm.api import create_object_graph
+from microcosm.caching import NaiveCache
+from microcosm.loaders import load_from_dict
+
+from microcosm_pubsub.batch import CompactMessageBatchSchema, MessageBatchSchema
+from microcosm_pubsub.constants import PUBLISHED_KEY
+from microcosm_pubsub.errors import PublishBatchError
+from microcosm_pubsub.handlers import PublishBatchMessage
+from microcosm_pubsub.producer import DeferredBatchProducer
+from microcosm_pubsub.tests.fixtures import DerivedSchema
+
+
+MESSAGE_ID = "message-id"
+
+
+class TestPublishBatchMessage:
+
+    def setup_method(self):
+        self.loader = load_from_dict(
+            sns_producer=dict(
+                compact_batches=True,
+            ),
+            sns_topic_arns=dict(
+                default="topic",
+                mappings={
+                    MessageBatchSchema.MEDIA_TYPE: "batch-topic",
+                },
+            ),
+        )
+        self.graph = create_object_graph("example", testing=True, loader=self.loader, cache=NaiveCache())
+        self.graph.use("opaque")
+        self.sns_producer = self.graph.sns_producer
+        self.sns_producer.sns_client.publish.return_value = dict(MessageId=MESSAGE_ID)
+        self.handler = PublishBatchMessage(self.graph)
+
+    def produce_batch(self):
+        with self.graph.opaque.initialize(lambda: {"X-Request-Id": "request-id"}):
+            with DeferredBatchProducer(self.sns_producer) as producer:
+                producer.produce(DerivedSchema.MEDIA_TYPE, data="data1", uri="http://example.com/1")
+                producer.produce(DerivedSchema.MEDIA_TYPE, data="data2", uri="http://example.com/2")
+                messages = list(producer.messages)
+
+        return messages, self.sns_producer.sns_client.publish.call_args[1]
+
+    def decode(self, published):
+        message = loads(published["Message"])
+        return self.graph.pubsub_message_schema_registry.find(message["mediaType"]).decode(message)
+
+    def test_compact_batch_format(self):
+        messages, published = self.produce_batch()
+
+        assert_that(published["TopicArn"], is_(equal_to("batch-topic")))
+        batch = loads(published["Message"])
+        assert_that(batch["mediaType"], is_(equal_to(CompactMessageBatchSchema.MEDIA_TYPE)))
+        assert_that(batch["sharedOpaqueData"], has_entries({"x-request-id": "request-id"}))
+        assert_that(batch["messages"], has_length(2))
+        # inner messages are embedded as JSON objects and only carry unshared opaque data
+        assert_that(batch["messages"][0]["message"], is_(equal_to(loads(messages[0].message))))
+        assert_that(batch["messages"][0].get("opaqueData", {}), not_(has_entries({"x-request-id": "request-id"})))
+        assert_that(batch["messages"][0], not_(has_entries(messageAttributes=messages[0].message_attributes)))
+
+    def test_republish_compact_batch(self):
+        messages, published = self.produce_batch()
+        self.sns_producer.sns_client.publish.reset_mock()
+
+        with patch.object(self.sns_producer, "publish_batch") as mocked_publish_batch:
+            assert_that(self.handler(self.decode(published)), is_(equal_to(True)))
+
+        republished = [
+            pubsub_message
+            for call in mocked_publish_batch.call_args_list
+            for pubsub_message in call[0][0]
+        ]
+        assert_that(republished, has_length(2))
+        for pubsub_message, original in zip(republished, messages):
+            assert_that(loads(pubsub_message.message), is_(equal_to(loads(original.message))))
+            assert_that(pubsub_message.media_type, is_(equal_to(original.media_type)))
+            assert_that(pubsub_message.message_attributes, is_(equal_to(original.message_attributes)))
+            assert_that(pubsub_message.opaque_data, is_(equal_to(dict(original.opaque_data))))
+            assert_that(pubsub_message.topic_arn, is_(equal_to("topic")))
+
+    def test_republish_batch(self):
+        self.sns_producer.compact_batches = False
+        messages, published = self.produce_batch()
+        assert_that(loads(published["Message"])["mediaType"], is_(equal_to(MessageBatchSchema.MEDIA_TYPE)))
+
+        with patch.object(self.sns_producer, "publish_batch") as mocked_publish_batch:
+            assert_that(self.handler(self.decode(published)), is_(equal_to(True)))
+
+        republished = mocked_publish_batch.call_args[0][0]
+        assert_that(
+            [pubsub_message.message for pubsub_message in republished],
+            contains_exactly(*[message.message for message in messages]),
+        )
+        assert_that(republished[1].opaque_data, has_entries({
+            PUBLISHED_KEY: messages[1].opaque_data[PUBLISHED_KEY],
+        }))
+
+    def create_batch(self, count, topic_arns=("topic",)):
+        return dict(
+            media_type=CompactMessageBatchSchema.MEDIA_TYPE,
+            messages=[
+                dict(
+                    mediaType=DerivedSchema.MEDIA_TYPE,
+                    topicArn=topic_arns[index % len(topic_arns)],
+                    message=dict(mediaType=DerivedSchema.MEDIA_TYPE, data=f"{index}"),
+                )
+                for index in range(count)
+            ],
+        )
+
+    def handle(self, message, message_id=MESSAGE_ID):
+        with self.graph.opaque.initialize(lambda: dict(message_id=message_id)):
+            return self.handler(message)
+
+    def test_entries_are_published_in_batches_by_topic(self):
+        self.sns_producer.sns_client.publish_batch.side_effect = lambda TopicArn, PublishBatchRequestEntries: dict(
+            Successful=[
+                dict(Id=entry["Id"], MessageId=f"{TopicArn}-{entry['Id']}")
+                for entry in PublishBatchRequestEntries
+            ],
+        )
+
+        assert_that(self.handle(self.create_batch(30, topic_arns=("topic1", "topic2"))), is_(equal_to(True)))
+
+        assert_that(
+            sorted(
+                (call[1]["TopicArn"], len(call[1]["PublishBatchRequestEntries"]))
+                for call in self.sns_producer.sns_client.publish_batch.call_args_list
+            ),
+            contains_exactly(("topic1", 5), ("topic1", 10), ("topic2", 5), ("topic2", 10)),
+        )
+        assert_that(self.sns_producer.sns_client.publish.call_count, is_(equal_to(0)))
+
+    def test_entries_are_published_within_the_handler_context(self):
+        self.sns_producer.sns_client.publish_batch.side_effect = lambda TopicArn, PublishBatchRequestEntries: dict(
+            Successful=[
+                dict(Id=entry["Id"], MessageId=f"{TopicArn}-{entry['Id']}")
+                for entry in PublishBatchRequestEntries
+            ],
+        )
+        publish_chunk = self.sns_producer.publish_chunk
+        message_ids = []
+
+        def record_message_id(*args):
+            message_ids.append(self.graph.opaque.get("message_id"))
+            return publish_chunk(*args)
+
+        with patch.object(self.sns_producer, "publish_chunk", side_effect=record_message_id):
+            self.handle(self.create_batch(30, topic_arns=("topic1", "topic2")))
+
+        assert_that(message_ids, contains_exactly(*[MESSAGE_ID] * 4))
+
+    def test_redelivered_batch_skips_published_entries(self):
+        def publish_batch(pubsub_messages, executor=None):
+            # fail the odd messages
+            message_ids = [
+                None if int(loads(pubsub_message.message)["data"]) % 2 else MESSAGE_ID
+                for pubsub_message in pubsub_messages
+            ]
+            if None in message_ids:
+                raise PublishBatchError("failed", message_ids=message_ids, failures=[])
+            return message_ids
+
+        batch = self.create_batch(4)
+        with patch.object(self.sns_producer, "publish_batch", side_effect=publish_batch):
+            assert_that(calling(self.handle).with_args(batch), raises(PublishBatchError))
+
+        with patch.object(self.sns_producer, "publish_batch") as mocked_publish_batch:
+            assert_that(self.handle(batch), is_(equal_to(True)))
+            # a different message is not affected
+            assert_that(self.handle(batch, message_id="other-message-id"), is_(equal_to(True)))
+
+        assert_that(
+            [
+                [loads(pubsub_message.message)["data"] for pubsub_message in call[0][0]]
+                for call in mocked_publish_batch.call_args_list
+            ],
+            contains_exactly(["1", "3"], ["0", "1", "2", "3"]),
+        )
@@ -10,11 +10,14 @@ from hamcrest import (
     has_length,
     instance_of,
     is_,
+    none,
 )
 from microcosm.caching import NaiveCache
+from microcosm.loaders import load_from_dict
 
 from microcosm_pubsub.consumer import SQSConsumer
 from microcosm_pubsub.envelope import LambdaSQSEnvelope
+from microcosm_pubsub.message import SQSMessage
 from microcosm_pubsub.reader import SQSJsonReader
 from microcosm_pubsub.tests.fixtures import DerivedSchema, ExampleDaemon, SQSReaderExampleDaemon
 
@@ -27,6 +30,26 @@ def create_daemon():
     return ExampleDaemon.create_for_testing().graph
 
 
+def create_daemon_with_batch_acknowledgements():
+    loader = load_from_dict(
+        sqs_consumer=dict(
+            batch_acknowledgements=True,
+            acknowledgement_flush_seconds=0,
+        ),
+    )
+    return ExampleDaemon.create_for_testing(cache=NaiveCache(), loader=loader).graph
+
+
+def create_message(graph, index):
+    return SQSMessage(
+        consumer=graph.sqs_consumer,
+        content=dict(),
+        media_type=DerivedSchema.MEDIA_TYPE,
+        message_id=f"{MESSAGE_ID}-{index}",
+        receipt_handle=f"{RECEIPT_HANDLE}-{index}",
+    )
+
+
 def create_daemon_with_naive_cache(event):
     # Use NaiveCache here to avoid reusing the graph components between tests,
     # as we're modifying the `sqs_consumer.sqs_client` in some tests
@@ -157,3 +180,125 @@ def test_json_consume():
         data="data",
         media_type=DerivedSchema.MEDIA_TYPE,
     ))))
+
+
+def test_buffered_acknowledgements():
+    """
+    Buffered acknowledgements are deleted in batches of (at most) ten.
+
+    """
+    graph = create_daemon_with_batch_acknowledgements()
+    sqs_client = graph.sqs_consumer.sqs_client
+    sqs_client.delete_message_batch.return_value = dict(Failed=[])
+
+    with graph.sqs_consumer.buffered_acknowledgements():
+        for index in range(12):
+            create_message(graph, index).ack()
+
+        # the first ten messages are flushed as soon as the batch is full
+        assert_that(sqs_client.delete_message_batch.call_count, is_(equal_to(1)))
+
+    assert_that(sqs_client.delete_message.call_count, is_(equal_to(0)))
+    assert_that(sqs_client.delete_message_batch.call_count, is_(equal_to(2)))
+    sqs_client.delete_message_batch.assert_called_with(
+        QueueUrl="queue",
+        Entries=[
+            dict(Id="0", ReceiptHandle=f"{RECEIPT_HANDLE}-10"),
+            dict(Id="1", ReceiptHandle=f"{RECEIPT_HANDLE}-11"),
+        ],
+    )
+
+
+def test_buffered_acknowledgements_retry_failed_entries():
+    """
+    Entries that fail without a sender fault are retried; sender faults are not.
+
+    """
+    graph = create_daemon_with_batch_acknowledgements()
+    sqs_client = graph.sqs_consumer.sqs_client
+    sqs_client.delete_message_batch.side_effect = [
+        dict(Failed=[
+            dict(Id="0", Code="InternalError", SenderFault=False),
+            dict(Id="1", Code="ReceiptHandleIsInvalid", SenderFault=True),
+        ]),
+        dict(Failed=[]),
+    ]
+
+    with graph.sqs_consumer.buffered_acknowledgements():
+        for index in range(3):
+            create_message(graph, index).ack()
+
+    assert_that(sqs_client.delete_message_batch.call_count, is_(equal_to(2)))
+    sqs_client.delete_message_batch.assert_called_with(
+        QueueUrl="queue",
+        Entries=[
+            dict(Id="0", ReceiptHandle=f"{RECEIPT_HANDLE}-0"),
+        ],
+    )
+
+
+def test_acknowledgements_without_buffer():
+    """
+    Acknowledgements outside of a buffered block are sent immediately.
+
+    """
+    graph = create_daemon_with_batch_acknowledgements()
+    sqs_client = graph.sqs_consumer.sqs_client
+
+    create_message(graph, 0).ack()
+
+    assert_that(sqs_client.delete_message_batch.call_count, is_(equal_to(0)))
+    sqs_client.delete_message.assert_called_with(
+        QueueUrl="queue",
+        ReceiptHandle=f"{RECEIPT_HANDLE}-0",
+    )
+
+
+def test_buffered_negative_acknowledgements():
+    """
+    Buffered nacks keep the visibility timeout chosen for each message.
+
+    """
+    graph = create_daemon_with_batch_acknowledgements()
+    sqs_client = graph.sqs_consumer.sqs_client
+    sqs_client.change_message_visibility_batch.return_value = dict(Failed=[])
+
+    with graph.sqs_consumer.buffered_acknowledgements():
+        create_message(graph, 0).nack()
+        create_message(graph, 1).nack(30)
+        create_message(graph, 2).ack()
+
+    assert_that(sqs_client.change_message_visibility.call_count, is_(equal_to(0)))
+    sqs_client.change_message_visibility_batch.assert_called_once_with(
+        QueueUrl="queue",
+        Entries=[
+            dict(Id="0", ReceiptHandle=f"{RECEIPT_HANDLE}-0", VisibilityTimeout=5),
+            dict(Id="1", ReceiptHandle=f"{RECEIPT_HANDLE}-1", VisibilityTimeout=30),
+        ],
+    )
+    sqs_client.delete_message_batch.assert_called_once_with(
+        QueueUrl="queue",
+        Entries=[
+            dict(Id="0", ReceiptHandle=f"{RECEIPT_HANDLE}-2"),
+        ],
+    )
+
+
+def test_buffered_negative_acknowledgements_failures():
+    """
+    Entries that could not be sent are recorded per message.
+
+    """
+    graph = create_daemon_with_batch_acknowledgements()
+    sqs_client = graph.sqs_consumer.sqs_client
+    sqs_client.change_message_visibility_batch.return_value = dict(Failed=[
+        dict(Id="1", Code="ReceiptHandleIsInvalid", SenderFault=True),
+    ])
+    messages = [create_message(graph, index) for index in range(2)]
+
+    with graph.sqs_consumer.buffered_acknowledgements() as acknowledgements:
+        for message in messages:
+            message.nack()
+
+    assert_that(acknowledgements.failure_for(messages[0]), is_(none()))
+    assert_that(acknowledgements.failure_for(messages[1]), is_(equal_to("ReceiptHandleIsInvalid")))
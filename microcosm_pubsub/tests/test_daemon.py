@@ -0,0 +1,184 @@
+"""
+Daemon tests.
+
+"""
+from os import WNOHANG
+from signal import SIGTERM
+from unittest.mock import MagicMock, call, patch
+
+from hamcrest import (
+    assert_that,
+    calling,
+    empty,
+    equal_to,
+    is_,
+    none,
+    raises,
+)
+
+from microcosm_pubsub.daemon import PreforkSupervisor
+from microcosm_pubsub.tests.fixtures import ExampleDaemon
+
+
+class TestPreforkSupervisor:
+
+    def setup_method(self):
+        self.target = MagicMock()
+        self.supervisor = PreforkSupervisor(self.target, workers=2)
+        self.clock = 0
+
+    def run(self, exits):
+        """
+        Run the supervisor with forked pids starting at 100 and a sequence of worker exits.
+
+        Each exit is the result of one `waitpid` call; `(0, 0)` means that no worker has exited
+        (yet). Every sleep advances the clock by a second.
+
+        """
+        pids = iter(range(100, 200))
+
+        def waitpid(pid, options):
+            exit = exits.pop(0)
+            if callable(exit):
+                return exit()
+            return exit
+
+        def sleep(seconds):
+            self.clock += 1
+
+        with patch("microcosm_pubsub.daemon.fork", side_effect=lambda: next(pids)) as mocked_fork, \
+                patch("microcosm_pubsub.daemon.waitpid", side_effect=waitpid) as mocked_waitpid, \
+                patch("microcosm_pubsub.daemon.kill") as mocked_kill, \
+                patch("microcosm_pubsub.daemon.freeze") as mocked_freeze, \
+                patch("microcosm_pubsub.daemon.monotonic", side_effect=lambda: self.clock), \
+                patch("microcosm_pubsub.daemon.sleep", side_effect=sleep), \
+                patch("microcosm_pubsub.daemon.signal"):
+            assert_that(calling(self.supervisor.run), raises(SystemExit))
+
+        assert_that(exits, is_(empty()))
+        self.mocked_waitpid = mocked_waitpid
+        return mocked_fork, mocked_kill, mocked_freeze
+
+    def terminate(self, pid):
+        def exit():
+            self.supervisor.on_terminate(SIGTERM, None)
+            return pid, 0
+        return exit
+
+    def test_graph_is_built_once_and_frozen(self):
+        mocked_fork, _, mocked_freeze = self.run([
+            self.terminate(100),
+            (101, 0),
+        ])
+
+        assert_that(self.target.initialize.call_count, is_(equal_to(1)))
+        assert_that(mocked_freeze.call_count, is_(equal_to(1)))
+        assert_that(mocked_fork.call_count, is_(equal_to(2)))
+        assert_that(self.supervisor.children, is_(empty()))
+
+    def terminate_while_polling(self):
+        def exit():
+            self.supervisor.on_terminate(SIGTERM, None)
+            return 0, 0
+        return exit
+
+    def test_crashed_workers_are_restarted(self):
+        mocked_fork, _, _ = self.run([
+            (100, 256),
+            (0, 0),
+            self.terminate(101),
+            (102, 0),
+        ])
+
+        assert_that(mocked_fork.call_count, is_(equal_to(3)))
+
+    def test_exits_are_reaped_while_a_restart_is_pending(self):
+        mocked_fork, _, _ = self.run([
+            (100, 256),
+            (101, 256),
+            (0, 0),
+            self.terminate(102),
+            (103, 0),
+        ])
+
+        assert_that(mocked_fork.call_count, is_(equal_to(4)))
+        assert_that(self.mocked_waitpid.call_args_list[1], is_(equal_to(call(-1, WNOHANG))))
+
+    def test_terminate_cancels_pending_restarts(self):
+        mocked_fork, _, _ = self.run([
+            (100, 256),
+            self.terminate_while_polling(),
+            (101, 0),
+        ])
+
+        assert_that(mocked_fork.call_count, is_(equal_to(2)))
+        assert_that(self.supervisor.children, is_(empty()))
+
+    def test_no_workers_are_spawned_once_stopping(self):
+        self.supervisor.stopping = True
+
+        with patch("microcosm_pubsub.daemon.fork") as mocked_fork:
+            assert_that(self.supervisor.spawn(), is_(none()))
+
+        assert_that(mocked_fork.call_count, is_(equal_to(0)))
+
+    def test_workers_spawned_while_terminating_are_terminated(self):
+        def fork():
+            self.supervisor.on_terminate(SIGTERM, None)
+            return 100
+
+        with patch("microcosm_pubsub.daemon.fork", side_effect=fork), \
+                patch("microcosm_pubsub.daemon.kill") as mocked_kill:
+            self.supervisor.spawn()
+
+        mocked_kill.assert_called_once_with(100, SIGTERM)
+
+    def test_cleanly_exited_workers_are_not_restarted(self):
+        mocked_fork, _, _ = self.run([
+            (100, 0),
+            (101, 0),
+        ])
+
+        assert_that(mocked_fork.call_count, is_(equal_to(2)))
+        assert_that(self.supervisor.children, is_(empty()))
+
+    def test_terminate_is_forwarded_to_workers(self):
+        _, mocked_kill, _ = self.run([
+            self.terminate(100),
+            (101, 0),
+        ])
+
+        mocked_kill.assert_has_calls([
+            call(100, SIGTERM),
+            call(101, SIGTERM),
+        ], any_order=True)
+
+
+class TestConsumerDaemon:
+
+    def test_prefork_workers_reject_processes(self):
+        daemon = ExampleDaemon()
+
+        with patch("sys.argv", ["daemon", "--prefork-workers", "2", "--processes", "2"]), \
+                patch("microcosm_pubsub.daemon.PreforkSupervisor") as mocked_supervisor:
+            assert_that(calling(daemon.run), raises(SystemExit))
+
+        assert_that(mocked_supervisor.call_count, is_(equal_to(0)))
+
+    def test_prefork_workers_reject_health_checks(self):
+        daemon = ExampleDaemon()
+
+        with patch("sys.argv", ["daemon", "--prefork-workers", "2", "--heartbeat-threshold-seconds", "30"]), \
+                patch("microcosm_pubsub.daemon.PreforkSupervisor") as mocked_supervisor:
+            assert_that(calling(daemon.run), raises(SystemExit))
+
+        assert_that(mocked_supervisor.call_count, is_(equal_to(0)))
+
+    def test_prefork_workers(self):
+        daemon = ExampleDaemon()
+
+        with patch("sys.argv", ["daemon", "--prefork-workers", "2"]), \
+                patch("microcosm_pubsub.daemon.PreforkSupervisor") as mocked_supervisor:
+            daemon.run()
+
+        mocked_supervisor.assert_called_once_with(daemon, 2)
@@ -3,8 +3,21 @@ Dispatcher tests.
 
 """
 from json import dumps
+from threading import Barrier
+from unittest.mock import patch
 
-from hamcrest import assert_that, greater_than, has_properties
+from hamcrest import (
+    assert_that,
+    contains_exactly,
+    equal_to,
+    greater_than,
+    greater_than_or_equal_to,
+    has_properties,
+    is_,
+    none,
+)
+from microcosm.caching import NaiveCache
+from microcosm.loaders import load_from_dict
 
 from microcosm_pubsub.conventions import created
 from microcosm_pubsub.message import SQSMessage
@@ -149,3 +162,166 @@ class TestDispatcher:
                 result=MessageHandlingResultType.SUCCEEDED,
             ),
         )
+
+    def test_handle_batch_with_buffered_acknowledgements(self):
+        """
+        Batch acknowledgement failures are reported on each result.
+
+        """
+        loader = load_from_dict(
+            sqs_consumer=dict(
+                batch_acknowledgements=True,
+            ),
+        )
+        daemon = ExampleDaemon.create_for_testing(cache=NaiveCache(), loader=loader)
+        dispatcher = daemon.graph.sqs_message_dispatcher
+        sqs_client = dispatcher.sqs_consumer.sqs_client
+        sqs_client.receive_message.return_value = dict(Messages=[
+            dict(
+                MessageId=f"{MESSAGE_ID}-{index}",
+                ReceiptHandle=f"receipt-handle-{index}",
+                Body=dumps(dict(
+                    Message=dumps(dict(
+                        mediaType=media_type,
+                        data="data",
+                        uri="http://example.com",
+                    )),
+                )),
+            )
+            for index, media_type in enumerate([
+                DerivedSchema.MEDIA_TYPE,
+                created("IgnoredResource"),
+            ])
+        ])
+        sqs_client.delete_message_batch.return_value = dict(Failed=[
+            dict(Id="1", Code="InternalError", SenderFault=True),
+        ])
+
+        results = dispatcher.handle_batch(bound_handlers=daemon.bound_handlers)
+
+        assert_that(sqs_client.delete_message_batch.call_count, is_(equal_to(1)))
+        assert_that(sqs_client.delete_message.call_count, is_(equal_to(0)))
+        assert_that(
+            results,
+            contains_exactly(
+                has_properties(
+                    result=MessageHandlingResultType.SUCCEEDED,
+                    resolution_failure=None,
+                ),
+                has_properties(
+                    result=MessageHandlingResultType.IGNORED,
+                    resolution_failure="InternalError",
+                ),
+            ),
+        )
+
+    def test_handle_batch_concurrently(self):
+        """
+        Messages within a batch are handled concurrently, each with its own opaque data.
+
+        """
+        loader = load_from_dict(
+            sqs_message_dispatcher=dict(
+                concurrency=3,
+            ),
+        )
+        daemon = ExampleDaemon.create_for_testing(cache=NaiveCache(), loader=loader)
+        dispatcher = daemon.graph.sqs_message_dispatcher
+        dispatcher.sqs_consumer.sqs_client.receive_message.return_value = dict(Messages=[
+            dict(
+                MessageId=f"{MESSAGE_ID}-{index}",
+                ReceiptHandle=f"receipt-handle-{index}",
+                Body=dumps(dict(
+                    Message=dumps(dict(
+                        mediaType=DerivedSchema.MEDIA_TYPE,
+                        data=f"{MESSAGE_ID}-{index}",
+                    )),
+                )),
+            )
+            for index in range(3)
+        ])
+
+        # every handler must be running at the same time to pass the barrier
+        barrier = Barrier(3, timeout=5)
+        seen = []
+
+        def handler(message):
+            barrier.wait()
+            seen.append((message["data"], dispatcher.opaque["message_id"]))
+            return True
+
+        results = dispatcher.handle_batch(
+            bound_handlers={
+                DerivedSchema.MEDIA_TYPE: handler,
+            },
+        )
+
+        assert_that(
+            results,
+            contains_exactly(*[
+                has_properties(result=MessageHandlingResultType.SUCCEEDED)
+                for _ in range(3)
+            ]),
+        )
+        assert_that(len(seen), is_(equal_to(3)))
+        for data, message_id in seen:
+            assert_that(message_id, is_(equal_to(data)))
+
+    def test_handle_batch_records_stage_timings(self):
+        """
+        Stage timings are recorded on results when enabled.
+
+        """
+        loader = load_from_dict(
+            sqs_consumer=dict(
+                stage_timings=True,
+            ),
+        )
+        daemon = ExampleDaemon.create_for_testing(cache=NaiveCache(), loader=loader)
+        dispatcher = daemon.graph.sqs_message_dispatcher
+        dispatcher.sqs_consumer.sqs_client.receive_message.return_value = dict(Messages=[
+            dict(
+                MessageId=MESSAGE_ID,
+                ReceiptHandle="receipt-handle",
+                Body=dumps(dict(
+                    Message=dumps(dict(
+                        mediaType=DerivedSchema.MEDIA_TYPE,
+                        data="data",
+                        uri="http://example.com",
+                    )),
+                )),
+            ),
+        ])
+
+        with patch.object(dispatcher, "send_metrics") as mocked_send_metrics:
+            result, = dispatcher.handle_batch(bound_handlers=daemon.bound_handlers)
+
+        assert_that(result.result, is_(equal_to(MessageHandlingResultType.SUCCEEDED)))
+        assert_that(
+            sorted(result.stage_timings),
+            contains_exactly(
+                "error_reporting",
+                "find_handler",
+                "handle",
+                "initialize",
+                "log",
+                "metrics",
+                "parse_body",
+                "parse_content",
+                "parse_message",
+                "receive",
+                "resolve",
+                "validate",
+            ),
+        )
+        for stage_elapsed_time in result.stage_timings.values():
+            assert_that(stage_elapsed_time, is_(greater_than_or_equal_to(0.0)))
+        # the metrics stage is sent once the other metrics were sent
+        mocked_send_metrics.send_stage_timings.assert_called_once_with(result, ["metrics"])
+
+    def test_stage_timings_are_disabled_by_default(self):
+        result = self.dispatcher.handle_message(
+            message=self.message,
+            bound_handlers=self.daemon.bound_handlers,
+        )
+        assert_that(result.stage_timings, is_(none()))
@@ -2,9 +2,17 @@
 SQS envelope tests.
 
 """
-from json import dumps
+from json import dumps, loads
+from unittest.mock import patch
 
-from hamcrest import assert_that, equal_to, is_
+from hamcrest import (
+    assert_that,
+    calling,
+    equal_to,
+    is_,
+    raises,
+)
+from marshmallow import ValidationError
 from microcosm.api import create_object_graph
 
 from microcosm_pubsub.conventions import created
@@ -62,3 +70,50 @@ def test_codec_sqs_envelope():
     assert_that(sqs_message.media_type, is_(equal_to(media_type)))
     assert_that(sqs_message.message_id, is_(equal_to(message_id)))
     assert_that(sqs_message.receipt_handle, is_(equal_to(receipt_handle)))
+
+
+def test_codec_sqs_envelope_parses_message_once():
+    graph = create_object_graph("example", testing=True)
+    envelope = CodecSQSEnvelope(graph)
+
+    media_type = created("foo")
+    uri = "http://foo/id"
+
+    with patch("microcosm_pubsub.envelope.loads", side_effect=loads) as mocked_loads, \
+            patch("microcosm_pubsub.codecs.loads", side_effect=loads) as mocked_codec_loads:
+        sqs_message = envelope.parse_raw_message(None, dict(
+            MessageId="message_id",
+            ReceiptHandle="receipt_handle",
+            Body=dumps(dict(
+                Message=dumps(dict(
+                    mediaType=media_type,
+                    uri=uri,
+                )),
+            )),
+        ))
+
+    # once for the SQS body and once for the SNS message
+    assert_that(mocked_loads.call_count, is_(equal_to(2)))
+    assert_that(mocked_codec_loads.call_count, is_(equal_to(0)))
+    assert_that(sqs_message.content, is_(equal_to(dict(
+        media_type=media_type,
+        uri=uri,
+    ))))
+
+
+def test_codec_sqs_envelope_requires_media_type():
+    graph = create_object_graph("example", testing=True)
+    envelope = CodecSQSEnvelope(graph)
+
+    assert_that(
+        calling(envelope.parse_raw_message).with_args(None, dict(
+            MessageId="message_id",
+            ReceiptHandle="receipt_handle",
+            Body=dumps(dict(
+                Message=dumps(dict(
+                    uri="http://foo/id",
+                )),
+            )),
+        )),
+        raises(ValidationError),
+    )
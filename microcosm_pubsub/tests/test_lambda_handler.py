@@ -1,9 +1,22 @@
 """
 Testing Lambda handler
 """
-from hamcrest import assert_that, is_
+from argparse import Namespace
+from json import dumps
+from unittest.mock import patch
 
-from microcosm_pubsub.tests.fixtures import ExampleDaemon
+from hamcrest import (
+    assert_that,
+    equal_to,
+    has_length,
+    instance_of,
+    is_,
+)
+from microcosm.caching import NaiveCache
+
+from microcosm_pubsub.reader import SQSJsonReader
+from microcosm_pubsub.result import MessageHandlingResult, MessageHandlingResultType
+from microcosm_pubsub.tests.fixtures import DerivedSchema, ExampleDaemon
 
 
 MESSAGE_ID = "message-id"
@@ -17,3 +30,126 @@ def test_lambda_handler():
     handler = ExampleDaemon.make_lambda_handler()
     evt = {"warm": 1}
     assert_that(handler(evt, {}), is_("warming up"))
+
+
+def make_record(index):
+    return dict(
+        messageId=f"{MESSAGE_ID}-{index}",
+        receiptHandle=f"{RECEIPT_HANDLE}-{index}",
+        body=dumps(dict(
+            data="data",
+            mediaType=DerivedSchema.MEDIA_TYPE,
+        )),
+    )
+
+
+def test_lambda_handler_reuses_graph():
+    """
+    The object graph is built once and reused by warm invocations
+
+    """
+    daemons = []
+
+    def initialize(self):
+        self.args = Namespace(debug=False, testing=True, sqs_queue_url="queue", envelope=None, stdin=False)
+        self.graph = self.create_object_graph(self.args, cache=NaiveCache())
+        daemons.append(self)
+
+    handler = ExampleDaemon.make_lambda_handler()
+    with patch.object(ExampleDaemon, "initialize", initialize):
+        handler(dict(Records=[make_record(0)]), {})
+        response = handler(dict(Records=[make_record(1), make_record(2)]), {})
+
+    assert_that(daemons, has_length(1))
+    sqs_client = daemons[0].graph.sqs_consumer.sqs_client
+    assert_that(sqs_client, is_(instance_of(SQSJsonReader)))
+    assert_that(sqs_client.messages, is_(equal_to([make_record(1), make_record(2)])))
+    assert_that(response, is_(equal_to(dict(batchItemFailures=[]))))
+
+
+def test_batch_item_failures():
+    """
+    Records whose results should be retried are reported as failures
+
+    """
+    records = [make_record(index) for index in range(3)]
+    results = [
+        MessageHandlingResult(
+            media_type=DerivedSchema.MEDIA_TYPE,
+            message_id=f"{MESSAGE_ID}-{index}",
+            result=result_type,
+        )
+        for index, result_type in enumerate((
+            MessageHandlingResultType.SUCCEEDED,
+            MessageHandlingResultType.FAILED,
+            MessageHandlingResultType.RETRIED,
+        ))
+    ]
+
+    assert_that(
+        ExampleDaemon.make_batch_item_failures(records, results),
+        is_(equal_to(dict(batchItemFailures=[
+            dict(itemIdentifier=f"{MESSAGE_ID}-1"),
+            dict(itemIdentifier=f"{MESSAGE_ID}-2"),
+        ]))),
+    )
+
+
+def test_batch_item_failures_for_unhandled_records():
+    """
+    Records without a result are reported as failures
+
+    """
+    records = [make_record(index) for index in range(3)]
+    results = [
+        MessageHandlingResult(
+            media_type=DerivedSchema.MEDIA_TYPE,
+            message_id=f"{MESSAGE_ID}-{index}",
+            result=MessageHandlingResultType.SUCCEEDED,
+        )
+        for index in (2, 0)
+    ]
+
+    assert_that(
+        ExampleDaemon.make_batch_item_failures(records, results),
+        is_(equal_to(dict(batchItemFailures=[
+            dict(itemIdentifier=f"{MESSAGE_ID}-1"),
+        ]))),
+    )
+
+
+def test_lambda_handler_isolates_unparseable_records():
+    """
+    A record that cannot be parsed fails without failing the rest of the event
+
+    """
+    def initialize(self):
+        self.args = Namespace(debug=False, testing=True, sqs_queue_url="queue", envelope=None, stdin=False)
+        self.graph = self.create_object_graph(self.args, cache=NaiveCache())
+        self.use_event(self.sqs_event)
+
+    malformed_record = dict(make_record(1), body="{not json")
+
+    handler = ExampleDaemon.make_lambda_handler()
+    with patch.object(ExampleDaemon, "initialize", initialize):
+        response = handler(dict(Records=[make_record(0), malformed_record]), {})
+
+    assert_that(response, is_(equal_to(dict(batchItemFailures=[
+        dict(itemIdentifier=f"{MESSAGE_ID}-1"),
+    ]))))
+
+
+def test_batch_item_failures_without_results():
+    """
+    All records fail if the batch could not be handled
+
+    """
+    records = [make_record(index) for index in range(2)]
+
+    assert_that(
+        ExampleDaemon.make_batch_item_failures(records, None),
+        is_(equal_to(dict(batchItemFailures=[
+            dict(itemIdentifier=f"{MESSAGE_ID}-0"),
+            dict(itemIdentifier=f"{MESSAGE_ID}-1"),
+        ]))),
+    )
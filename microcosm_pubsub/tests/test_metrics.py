@@ -4,10 +4,26 @@ Test metrics enablement.
 """
 from unittest.mock import Mock, patch
 
-from hamcrest import assert_that, equal_to, is_
+import pytest
+from datadog import DogStatsd
+from hamcrest import (
+    assert_that,
+    contains_exactly,
+    contains_inanyorder,
+    empty,
+    equal_to,
+    has_length,
+    is_,
+)
 from microcosm.api import create_object_graph, load_from_dict
 
-from microcosm_pubsub.metrics import PubSubSendBatchMetrics, PubSubSendMetrics
+from microcosm_pubsub.metrics import (
+    PubSubMetricsAggregator,
+    PubSubProducerMetrics,
+    PubSubSendBatchMetrics,
+    PubSubSendMetrics,
+)
+from microcosm_pubsub.result import MessageHandlingResult, MessageHandlingResultType
 
 
 def test_configure_metrics_default_metrics_not_installed():
@@ -108,3 +124,166 @@ def test_configure_batch_metrics_disable():
     )
     graph = create_object_graph("example", testing=True, loader=loader)
     assert_that(graph.pubsub_send_batch_metrics.enabled, is_(equal_to(False)))
+
+
+class TestPubSubMetricsAggregator:
+
+    def create_graph(self, metrics=None, **kwargs):
+        loader = load_from_dict(
+            pubsub_metrics_aggregator=dict(
+                enabled=True,
+                **kwargs
+            ),
+        )
+        self.metrics = metrics or Mock(host="statsd")
+        with patch.object(PubSubMetricsAggregator, "get_metrics", return_value=self.metrics), \
+                patch.object(PubSubProducerMetrics, "get_metrics", return_value=self.metrics), \
+                patch.object(PubSubSendBatchMetrics, "get_metrics", return_value=self.metrics):
+            self.graph = create_object_graph("example", testing=True, loader=loader)
+            self.graph.use("pubsub_producer_metrics", "pubsub_send_batch_metrics")
+        return self.graph
+
+    def teardown_method(self):
+        if isinstance(self.metrics, DogStatsd):
+            self.metrics.stop()
+
+    def create_statsd(self):
+        statsd = DogStatsd(host="statsd", disable_telemetry=True)
+        statsd.socket = Mock()
+        return statsd
+
+    def sent(self):
+        return [
+            (call[0][0], tuple(call[1]["tags"]))
+            for call in self.metrics.histogram.call_args_list
+        ]
+
+    def sent_lines(self):
+        return [
+            line
+            for call in self.metrics.socket.send.call_args_list
+            for line in call[0][0].decode("utf-8").splitlines()
+        ]
+
+    def test_client_aggregation_is_enabled(self):
+        self.create_graph(flush_interval_seconds=60.0, max_samples_per_tag_set=10)
+
+        self.metrics.enable_aggregation.assert_called_once_with(
+            flush_interval=60.0,
+            max_samples_per_context=10,
+        )
+        assert_that(self.metrics.disable_buffering, is_(equal_to(False)))
+
+    @pytest.mark.parametrize("count", [100, 10000])
+    def test_values_sent_per_flush_are_bounded(self, count):
+        graph = self.create_graph(
+            metrics=self.create_statsd(),
+            flush_interval_seconds=60.0,
+            max_samples_per_tag_set=10,
+        )
+
+        for elapsed_time in range(count):
+            graph.pubsub_producer_metrics(elapsed_time=float(elapsed_time), publish_result="SUCCESS", media_type="foo")
+        graph.pubsub_metrics_aggregator.flush()
+
+        lines = self.sent_lines()
+        assert_that(lines, has_length(10))
+        # values are sent in shared packets, with a sample rate that recovers the count
+        assert_that(self.metrics.socket.send.call_count, is_(equal_to(1)))
+        assert_that(
+            {line.split("|")[2] for line in lines},
+            is_(equal_to({f"@{10 / count}"})),
+        )
+
+        # nothing is sent twice
+        self.metrics.socket.reset_mock()
+        graph.pubsub_metrics_aggregator.flush()
+        assert_that(self.sent_lines(), is_(empty()))
+
+    def test_close_flushes(self):
+        graph = self.create_graph(metrics=self.create_statsd(), flush_interval_seconds=60.0)
+
+        graph.pubsub_producer_metrics(elapsed_time=1.0, publish_result="SUCCESS", media_type="foo")
+        assert_that(self.sent_lines(), is_(empty()))
+        graph.pubsub_metrics_aggregator.close()
+
+        assert_that(self.sent_lines(), has_length(1))
+
+    def test_flush_every_batches(self):
+        graph = self.create_graph(flush_interval_seconds=60.0, flush_every_batches=2)
+
+        graph.pubsub_send_batch_metrics(elapsed_time=1.0, message_batch_size=1)
+        assert_that(self.metrics.flush_aggregated_metrics.call_count, is_(equal_to(0)))
+        graph.pubsub_send_batch_metrics(elapsed_time=1.0, message_batch_size=1)
+
+        assert_that(self.metrics.flush_aggregated_metrics.call_count, is_(equal_to(1)))
+        assert_that(self.metrics.flush.call_count, is_(equal_to(1)))
+
+    def test_tag_cardinality_is_capped(self):
+        self.create_graph(flush_interval_seconds=60.0, max_tag_sets=2)
+
+        for media_type in ("foo", "bar", "baz", "qux", "foo"):
+            self.graph.pubsub_producer_metrics(elapsed_time=1.0, publish_result="SUCCESS", media_type=media_type)
+
+        assert_that(
+            [tags[-1] for _, tags in self.sent()],
+            contains_exactly(
+                "media_type:foo",
+                "media_type:bar",
+                "media_type:other",
+                "media_type:other",
+                "media_type:foo",
+            ),
+        )
+
+
+def test_send_metrics_for_stage_timings():
+    metrics = Mock(host="statsd")
+    with patch.object(PubSubSendMetrics, "get_metrics", return_value=metrics):
+        graph = create_object_graph("example", testing=True)
+        send_metrics = graph.pubsub_send_metrics
+
+    send_metrics(MessageHandlingResult(
+        media_type="foo",
+        result=MessageHandlingResultType.SUCCEEDED,
+        elapsed_time=3.0,
+        stage_timings=dict(parse_message=1.0, handle=2.0),
+    ))
+
+    assert_that(
+        [
+            (call[0][0], call[0][1], call[1]["tags"][-1])
+            for call in metrics.histogram.call_args_list
+        ],
+        contains_inanyorder(
+            ("message", 3.0, "media-type:foo"),
+            ("message_stage", 1.0, "stage:parse_message"),
+            ("message_stage", 2.0, "stage:handle"),
+        ),
+    )
+
+
+def test_send_metrics_for_some_stage_timings():
+    metrics = Mock(host="statsd")
+    with patch.object(PubSubSendMetrics, "get_metrics", return_value=metrics):
+        graph = create_object_graph("example", testing=True)
+        send_metrics = graph.pubsub_send_metrics
+
+    send_metrics.send_stage_timings(
+        MessageHandlingResult(
+            media_type="foo",
+            result=MessageHandlingResultType.SUCCEEDED,
+            stage_timings=dict(handle=2.0, metrics=0.5),
+        ),
+        ["metrics"],
+    )
+
+    assert_that(
+        [
+            (call[0][0], call[0][1], call[1]["tags"][-1])
+            for call in metrics.histogram.call_args_list
+        ],
+        contains_inanyorder(
+            ("message_stage", 0.5, "stage:metrics"),
+        ),
+    )
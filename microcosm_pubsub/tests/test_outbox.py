@@ -0,0 +1,200 @@
+"""
+Outbox tests.
+
+"""
+import sqlite3
+from time import time
+from unittest.mock import patch
+
+from hamcrest import (
+    anything,
+    assert_that,
+    contains_exactly,
+    empty,
+    equal_to,
+    has_length,
+    is_,
+    not_,
+)
+from microcosm.api import create_object_graph
+from microcosm.caching import NaiveCache
+from microcosm.loaders import load_from_dict
+
+from microcosm_pubsub.errors import PublishBatchError
+from microcosm_pubsub.outbox import OutboxProducer, SQLiteOutboxStore, outbox
+from microcosm_pubsub.tests.fixtures import DerivedSchema, ExampleDaemon
+
+
+MESSAGE_ID = "message-id"
+
+
+class TestOutbox:
+
+    def setup_method(self):
+        loader = load_from_dict(
+            pubsub_outbox_relay=dict(
+                batch_size=3,
+                max_attempts=2,
+            ),
+            sns_topic_arns=dict(
+                default="topic",
+            ),
+        )
+        self.graph = create_object_graph("example", testing=True, loader=loader, cache=NaiveCache())
+        self.graph.use("opaque")
+        self.sns_producer = self.graph.sns_producer
+        self.outbox_store = self.graph.pubsub_outbox_store
+        self.relay = self.graph.pubsub_outbox_relay
+
+    def produce(self, count, outbox_store=None, connection=None):
+        outbox_store = outbox_store or self.outbox_store
+        with OutboxProducer(self.sns_producer, outbox_store, connection=connection) as producer:
+            for index in range(count):
+                producer.produce(DerivedSchema.MEDIA_TYPE, data=f"{index}", uri="http://example.com")
+            return producer.messages
+
+    def test_messages_are_appended_on_exit(self):
+        messages = self.produce(2)
+
+        pending = self.outbox_store.claim(limit=10, max_attempts=1, lease_seconds=60)
+        assert_that(
+            [pubsub_message for _, _, pubsub_message in pending],
+            contains_exactly(*messages),
+        )
+        assert_that(self.sns_producer.sns_client.publish.call_count, is_(equal_to(0)))
+
+    def test_messages_are_discarded_on_error(self):
+        try:
+            with OutboxProducer(self.sns_producer, self.outbox_store) as producer:
+                producer.produce(DerivedSchema.MEDIA_TYPE, data="data", uri="http://example.com")
+                raise ValueError()
+        except ValueError:
+            pass
+
+        assert_that(self.outbox_store.claim(limit=10, max_attempts=1, lease_seconds=60), is_(empty()))
+
+    def test_outbox_decorator(self):
+        class Foo:
+            def __init__(self, graph):
+                self.graph = graph
+                self.sns_producer = graph.sns_producer
+
+            def bar(self):
+                assert isinstance(self.sns_producer, OutboxProducer)
+                self.sns_producer.produce(DerivedSchema.MEDIA_TYPE, data="data", uri="http://example.com")
+
+        foo = Foo(self.graph)
+        outbox(foo)(foo.bar)()
+
+        assert_that(self.outbox_store.claim(limit=10, max_attempts=1, lease_seconds=60), has_length(1))
+        assert_that(foo.sns_producer, is_(equal_to(self.sns_producer)))
+
+    def test_relay_publishes_in_batches(self):
+        messages = self.produce(4)
+
+        with patch.object(self.sns_producer, "publish_batch") as mocked_publish_batch:
+            mocked_publish_batch.side_effect = lambda pubsub_messages: [MESSAGE_ID] * len(pubsub_messages)
+            assert_that(self.relay.relay(), is_(equal_to(3)))
+            assert_that(self.relay.relay(), is_(equal_to(1)))
+            assert_that(self.relay.relay(), is_(equal_to(0)))
+
+        assert_that(
+            [call[0][0] for call in mocked_publish_batch.call_args_list],
+            contains_exactly(messages[:3], messages[3:]),
+        )
+        assert_that(self.outbox_store.purge(delivered_before=float("inf")), is_(equal_to(4)))
+
+    def test_relay_retries_failed_messages(self):
+        self.produce(2)
+
+        with patch.object(self.sns_producer, "publish_batch") as mocked_publish_batch:
+            mocked_publish_batch.side_effect = PublishBatchError("failed", [MESSAGE_ID, None], failures=[])
+            self.relay.relay()
+            mocked_publish_batch.side_effect = PublishBatchError("failed", [None], failures=[])
+            self.relay.relay()
+            # the failing message was attempted max_attempts times
+            assert_that(self.relay.relay(), is_(equal_to(0)))
+
+        assert_that(
+            [len(call[0][0]) for call in mocked_publish_batch.call_args_list],
+            contains_exactly(2, 1),
+        )
+
+    def test_relay_logs_messages_that_are_given_up(self):
+        self.produce(1)
+
+        with patch.object(self.sns_producer, "publish_batch") as mocked_publish_batch, \
+                patch.object(self.relay, "logger") as mocked_logger:
+            mocked_publish_batch.side_effect = PublishBatchError("failed", [None], failures=[])
+            self.relay.relay()
+            assert_that(mocked_logger.error.call_count, is_(equal_to(0)))
+            self.relay.relay()
+
+        assert_that(mocked_logger.error.call_count, is_(equal_to(1)))
+        assert_that(mocked_logger.error.call_args[1]["extra"]["attempts"], is_(equal_to(2)))
+
+    def test_claimed_messages_are_not_claimed_again(self):
+        self.produce(2)
+
+        first = self.outbox_store.claim(limit=1, max_attempts=1, lease_seconds=60)
+        second = self.outbox_store.claim(limit=10, max_attempts=1, lease_seconds=60)
+
+        assert_that(first, has_length(1))
+        assert_that(second, has_length(1))
+        assert_that(first[0][0], is_(not_(equal_to(second[0][0]))))
+        assert_that(self.outbox_store.claim(limit=10, max_attempts=1, lease_seconds=60), is_(empty()))
+
+        # expired claims may be taken over
+        with patch("microcosm_pubsub.outbox.time", return_value=time() + 120):
+            assert_that(self.outbox_store.claim(limit=10, max_attempts=1, lease_seconds=60), has_length(2))
+
+    def test_failed_messages_are_released(self):
+        self.produce(1)
+
+        (id, _, _), = self.outbox_store.claim(limit=10, max_attempts=2, lease_seconds=60)
+        self.outbox_store.mark_failed([id])
+
+        assert_that(
+            self.outbox_store.claim(limit=10, max_attempts=2, lease_seconds=60),
+            contains_exactly(is_claim(id, 1)),
+        )
+
+    def test_messages_are_appended_within_a_transaction(self, tmp_path):
+        path = str(tmp_path / "outbox.sqlite3")
+        outbox_store = SQLiteOutboxStore(path)
+        connection = sqlite3.connect(path)
+
+        with connection:
+            messages = self.produce(1, outbox_store=outbox_store, connection=connection)
+        try:
+            with connection:
+                self.produce(1, outbox_store=outbox_store, connection=connection)
+                # the handler's own work fails after the messages were appended
+                raise ValueError()
+        except ValueError:
+            pass
+
+        pending = outbox_store.claim(limit=10, max_attempts=1, lease_seconds=60)
+        assert_that(
+            [pubsub_message for _, _, pubsub_message in pending],
+            contains_exactly(*messages),
+        )
+
+
+def is_claim(id, attempts):
+    return contains_exactly(equal_to(id), equal_to(attempts), anything())
+
+
+def test_consumer_daemon_runs_outbox_relay():
+    daemon = ExampleDaemon.create_for_testing()
+    daemon.graph.unlock()
+    daemon.graph.use("pubsub_outbox_relay")
+    relay = daemon.graph.pubsub_outbox_relay
+
+    with patch.object(relay, "start") as mocked_start, \
+            patch.object(relay, "stop") as mocked_stop, \
+            patch("microcosm_pubsub.daemon.Daemon.run_state_machine"):
+        daemon.run_state_machine()
+
+    assert_that(mocked_start.call_count, is_(equal_to(1)))
+    assert_that(mocked_stop.call_count, is_(equal_to(1)))
@@ -0,0 +1,141 @@
+"""
+Prefetch tests.
+
+"""
+from json import dumps
+from time import sleep
+from unittest.mock import MagicMock
+
+from hamcrest import (
+    assert_that,
+    contains_exactly,
+    empty,
+    equal_to,
+    greater_than_or_equal_to,
+    has_properties,
+    is_,
+    none,
+)
+
+from microcosm_pubsub.consumer import SQSConsumer
+from microcosm_pubsub.tests.fixtures import DerivedSchema, ExampleDaemon
+
+
+def raw_message(index):
+    return dict(
+        MessageId=f"message-id-{index}",
+        ReceiptHandle=f"receipt-handle-{index}",
+        Body=dumps(dict(
+            Message=dumps(dict(
+                data="data",
+                mediaType=DerivedSchema.MEDIA_TYPE,
+            )),
+        )),
+    )
+
+
+class TestPrefetch:
+
+    def setup_method(self):
+        self.graph = ExampleDaemon.create_for_testing().graph
+        self.sqs_client = MagicMock()
+        self.sqs_client.receive_message.side_effect = self.receive_message
+        self.received = 0
+
+        self.consumer = SQSConsumer(
+            sqs_client=self.sqs_client,
+            sqs_envelope=self.graph.sqs_envelope,
+            sqs_queue_url="queue",
+            limit=1,
+            wait_seconds=0,
+            backoff_policy=self.graph.sqs_consumer.backoff_policy,
+            prefetch_batches=2,
+            prefetch_handling_seconds=10,
+            visibility_timeout_seconds=30,
+        )
+
+    def teardown_method(self):
+        self.consumer.close()
+
+    def receive_message(self, **kwargs):
+        index, self.received = self.received, self.received + 1
+        return dict(Messages=[raw_message(index)])
+
+    def wait_for_buffer(self):
+        for _ in range(100):
+            if self.consumer.prefetcher.batches.full():
+                return
+            sleep(0.01)
+
+    def test_consume_prefetched_batches(self):
+        first = self.consumer.consume()
+        second = self.consumer.consume()
+
+        assert_that(first, contains_exactly(has_properties(message_id="message-id-0")))
+        assert_that(second, contains_exactly(has_properties(message_id="message-id-1")))
+
+    def test_stop_returns_unstarted_messages(self):
+        self.consumer.consume()
+        self.wait_for_buffer()
+
+        self.consumer.close()
+
+        released = [
+            entry["ReceiptHandle"]
+            for call in self.sqs_client.change_message_visibility_batch.call_args_list
+            for entry in call[1]["Entries"]
+        ]
+        # the buffered batches (and a batch received while the buffer was full) are released
+        assert_that(len(released), is_(equal_to(self.received - 1)))
+        assert_that(
+            {
+                entry["VisibilityTimeout"]
+                for call in self.sqs_client.change_message_visibility_batch.call_args_list
+                for entry in call[1]["Entries"]
+            },
+            is_(equal_to({0})),
+        )
+
+    def test_return_expired_batches(self):
+        self.consumer.prefetcher.max_age_seconds = 0.01
+        self.consumer.prefetcher.start()
+        self.wait_for_buffer()
+        sleep(0.02)
+
+        # stop receiving new messages so that only expired batches remain
+        self.sqs_client.receive_message.side_effect = None
+        self.sqs_client.receive_message.return_value = dict(Messages=[])
+
+        assert_that(self.consumer.consume(), is_(empty()))
+        assert_that(self.sqs_client.change_message_visibility_batch.call_count, is_(greater_than_or_equal_to(2)))
+
+    def test_max_age_leaves_time_to_handle(self):
+        self.consumer.prefetcher.start()
+
+        assert_that(self.consumer.prefetcher.max_age_seconds, is_(equal_to(20)))
+
+    def test_max_age_uses_queue_visibility_timeout(self):
+        self.consumer.prefetcher.visibility_timeout_seconds = None
+        self.sqs_client.get_queue_attributes.return_value = dict(
+            Attributes=dict(VisibilityTimeout="120"),
+        )
+
+        self.consumer.prefetcher.start()
+
+        assert_that(self.consumer.prefetcher.max_age_seconds, is_(equal_to(110)))
+        self.sqs_client.get_queue_attributes.assert_called_once_with(
+            AttributeNames=["VisibilityTimeout"],
+            QueueUrl="queue",
+        )
+
+    def test_disable_prefetching_without_time_to_handle(self):
+        self.consumer.prefetcher.visibility_timeout_seconds = 10
+
+        first = self.consumer.consume()
+        second = self.consumer.consume()
+
+        assert_that(first, contains_exactly(has_properties(message_id="message-id-0")))
+        assert_that(second, contains_exactly(has_properties(message_id="message-id-1")))
+        assert_that(self.consumer.prefetcher.thread, is_(none()))
+        assert_that(self.sqs_client.receive_message.call_count, is_(equal_to(2)))
+        assert_that(self.sqs_client.change_message_visibility_batch.call_count, is_(equal_to(0)))
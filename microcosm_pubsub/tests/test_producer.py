@@ -11,22 +11,25 @@ import microcosm.opaque  # noqa
 from hamcrest import (
     assert_that,
     calling,
+    contains_exactly,
     equal_to,
+    has_length,
     is_,
     none,
     raises,
 )
 from microcosm.api import create_object_graph
-from microcosm.loaders import load_from_environ
+from microcosm.loaders import load_from_dict, load_from_environ
 
 from microcosm_pubsub.batch import MessageBatchSchema
 from microcosm_pubsub.conventions import created
-from microcosm_pubsub.errors import TopicNotDefinedError
+from microcosm_pubsub.errors import MessageTooLargeError, TopicNotDefinedError
 from microcosm_pubsub.producer import (
     DeferredBatchProducer,
     DeferredProducer,
     deferred,
     deferred_batch,
+    iter_publish_batches,
     iter_topic_mappings,
 )
 from microcosm_pubsub.tests.fixtures import DerivedSchema
@@ -320,6 +323,71 @@ def test_deferred_batch_with_no_message():
     assert_that(graph.sns_producer.sns_client.publish.call_count, is_(equal_to(0)))
 
 
+def test_deferred_batch_production_packs_by_size():
+    """
+    Deferred batch production packs messages into batches that fit the byte budget.
+
+    """
+    graph = create_object_graph("example", testing=True, loader=batch_loader)
+    graph.use("opaque")
+    graph.sns_producer.sns_client.publish.return_value = dict(MessageId=MESSAGE_ID)
+
+    with DeferredBatchProducer(graph.sns_producer) as producer:
+        producer.produce(DerivedSchema.MEDIA_TYPE, data="x" * 100)
+        producer.produce(DerivedSchema.MEDIA_TYPE, data="x" * 100)
+        producer.produce(DerivedSchema.MEDIA_TYPE, data="x" * 1000)
+        small, _, large = producer.messages
+        # room for both small messages, but not for a small and the large one
+        graph.sns_producer.deferred_batch_max_bytes = (
+            producer.measure_batch_entry(small) + producer.measure_batch_entry(large) - 1
+        )
+
+    calls = graph.sns_producer.sns_client.publish.call_args_list
+    assert_that(calls, has_length(2))
+    batch = loads(calls[0][1]["Message"])
+    assert_that(batch["mediaType"], is_(equal_to(MessageBatchSchema.MEDIA_TYPE)))
+    assert_that(batch["messages"], has_length(2))
+    # the large message did not fit with the others and was published directly
+    assert_that(loads(calls[1][1]["Message"])["data"], is_(equal_to("x" * 1000)))
+
+
+def test_deferred_batch_production_preserves_order():
+    """
+    Deferred batch production does not move later messages ahead of earlier ones.
+
+    """
+    graph = create_object_graph("example", testing=True, loader=batch_loader)
+    graph.use("opaque")
+    graph.sns_producer.sns_client.publish.return_value = dict(MessageId=MESSAGE_ID)
+
+    with DeferredBatchProducer(graph.sns_producer) as producer:
+        producer.produce(DerivedSchema.MEDIA_TYPE, data="x" * 100)
+        producer.produce(DerivedSchema.MEDIA_TYPE, data="x" * 1000)
+        producer.produce(DerivedSchema.MEDIA_TYPE, data="y" * 200)
+        small, large, _ = producer.messages
+        graph.sns_producer.deferred_batch_max_bytes = (
+            producer.measure_batch_entry(small) + producer.measure_batch_entry(large) - 1
+        )
+
+    calls = graph.sns_producer.sns_client.publish.call_args_list
+    assert_that(
+        [loads(call[1]["Message"])["data"] for call in calls],
+        contains_exactly("x" * 100, "x" * 1000, "y" * 200),
+    )
+
+
+def test_deferred_batch_rejects_oversized_message():
+    graph = create_object_graph("example", testing=True, loader=batch_loader)
+
+    with DeferredBatchProducer(graph.sns_producer) as producer:
+        assert_that(
+            calling(producer.produce).with_args(DerivedSchema.MEDIA_TYPE, data="x" * 256 * 1024),
+            raises(MessageTooLargeError),
+        )
+
+    assert_that(graph.sns_producer.sns_client.publish.call_count, is_(equal_to(0)))
+
+
 def test_publish_batch_with_no_topic_fails():
     """
     Require explicit configuration of a topic for batch messages.
@@ -381,3 +449,144 @@ def batch_loader(metadata):
             },
         )
     )
+
+
+def publish_batch_loader(metadata):
+    return load_from_dict(
+        sns_producer=dict(
+            batch_publish=True,
+        ),
+        sns_topic_arns=dict(
+            default="topic",
+            mappings={
+                created("foo"): "foo-topic",
+            },
+        ),
+    )(metadata)
+
+
+def publish_batch_response(failures=None):
+    """
+    Respond to a PublishBatch request, failing the given entry ids.
+
+    """
+    failures = failures or dict()
+
+    def publish_batch(TopicArn, PublishBatchRequestEntries):
+        return dict(
+            Successful=[
+                dict(Id=entry["Id"], MessageId=f"{MESSAGE_ID}-{entry['Id']}")
+                for entry in PublishBatchRequestEntries
+                if entry["Id"] not in failures
+            ],
+            Failed=[
+                dict(Id=entry["Id"], Code=code, Message="failed", SenderFault=sender_fault)
+                for entry in PublishBatchRequestEntries
+                for entry_id, (code, sender_fault) in failures.items()
+                if entry["Id"] == entry_id
+            ],
+        )
+    return publish_batch
+
+
+class TestPublishBatch:
+
+    def setup_method(self):
+        self.graph = create_object_graph("example", testing=True, loader=publish_batch_loader)
+        self.graph.use("opaque")
+        self.sns_producer = self.graph.sns_producer
+        self.sns_client = self.sns_producer.sns_client
+        self.sns_client.publish_batch.side_effect = publish_batch_response()
+
+    def create_messages(self, count, media_type=DerivedSchema.MEDIA_TYPE):
+        return [
+            self.sns_producer.create_message(media_type, None, data=f"{index}", uri="http://example.com")
+            for index in range(count)
+        ]
+
+    def test_publish_batch_chunks_by_topic(self):
+        messages = self.create_messages(12) + self.create_messages(1, media_type=created("foo"))
+
+        message_ids = self.sns_producer.publish_batch(messages)
+
+        assert_that(message_ids, is_(equal_to([f"{MESSAGE_ID}-{index}" for index in range(13)])))
+        assert_that(
+            [
+                (call[1]["TopicArn"], len(call[1]["PublishBatchRequestEntries"]))
+                for call in self.sns_client.publish_batch.call_args_list
+            ],
+            contains_exactly(("topic", 10), ("topic", 2), ("foo-topic", 1)),
+        )
+        assert_that(self.sns_client.publish.call_count, is_(equal_to(0)))
+
+    def test_publish_batch_retries_failed_entries(self):
+        self.sns_client.publish_batch.side_effect = [
+            dict(
+                Successful=[dict(Id="0", MessageId="first")],
+                Failed=[dict(Id="1", Code="InternalError", SenderFault=False)],
+            ),
+            dict(
+                Successful=[dict(Id="1", MessageId="retried")],
+            ),
+        ]
+
+        with patch.object(self.sns_producer, "pubsub_producer_metrics") as mocked_metrics:
+            message_ids = self.sns_producer.publish_batch(self.create_messages(2))
+
+        assert_that(message_ids, contains_exactly("first", "retried"))
+        assert_that(
+            [entry["Id"] for entry in self.sns_client.publish_batch.call_args[1]["PublishBatchRequestEntries"]],
+            contains_exactly("1"),
+        )
+        assert_that(
+            [call[1]["publish_result"] for call in mocked_metrics.call_args_list],
+            contains_exactly("SUCCESS", "FAILURE", "SUCCESS"),
+        )
+
+    def test_publish_batch_does_not_retry_sender_faults(self):
+        self.sns_client.publish_batch.side_effect = publish_batch_response(
+            failures={"1": ("InvalidParameter", True)},
+        )
+
+        assert_that(
+            calling(self.sns_producer.publish_batch).with_args(self.create_messages(2)),
+            raises(Exception, "Could not publish 1 of 2 messages"),
+        )
+        assert_that(self.sns_client.publish_batch.call_count, is_(equal_to(1)))
+
+    def test_publish_batch_gives_up_after_max_attempts(self):
+        self.sns_client.publish_batch.side_effect = Exception("unavailable")
+
+        assert_that(
+            calling(self.sns_producer.publish_batch).with_args(self.create_messages(2)),
+            raises(Exception, "Could not publish 2 of 2 messages"),
+        )
+        assert_that(self.sns_client.publish_batch.call_count, is_(equal_to(3)))
+
+    def test_deferred_production_uses_publish_batch(self):
+        with DeferredProducer(self.sns_producer) as producer:
+            producer.produce(DerivedSchema.MEDIA_TYPE, data="data", uri="http://example.com")
+            producer.produce(DerivedSchema.MEDIA_TYPE, data="data2", uri="http://example.com")
+
+        assert_that(self.sns_client.publish_batch.call_count, is_(equal_to(1)))
+        assert_that(self.sns_client.publish.call_count, is_(equal_to(0)))
+
+    def test_deferred_batch_production_uses_publish_batch(self):
+        with DeferredBatchProducer(self.sns_producer) as producer:
+            for index in range(11):
+                producer.produce(DerivedSchema.MEDIA_TYPE, data=f"{index}", uri="http://example.com")
+
+        assert_that(self.sns_client.publish_batch.call_count, is_(equal_to(2)))
+        entries = self.sns_client.publish_batch.call_args[1]["PublishBatchRequestEntries"]
+        assert_that(loads(entries[0]["Message"])["mediaType"], is_(equal_to(DerivedSchema.MEDIA_TYPE)))
+        assert_that(self.sns_client.publish.call_count, is_(equal_to(0)))
+
+
+def test_iter_publish_batches_respects_size_limit():
+    graph = create_object_graph("example", testing=True, loader=publish_batch_loader)
+    message = graph.sns_producer.create_message(DerivedSchema.MEDIA_TYPE, None, data="data", uri="http://example.com")
+    entries = [(str(index), message) for index in range(4)]
+
+    chunks = list(iter_publish_batches(entries, max_bytes=message.size * 3))
+
+    assert_that([list(chunk) for chunk in chunks], contains_exactly(["0", "1", "2"], ["3"]))
@@ -0,0 +1,129 @@
+"""
+Background publisher tests.
+
+"""
+from unittest.mock import MagicMock, patch
+
+from hamcrest import (
+    assert_that,
+    calling,
+    contains_exactly,
+    equal_to,
+    instance_of,
+    is_,
+    raises,
+)
+from microcosm.api import create_object_graph
+from microcosm.caching import NaiveCache
+from microcosm.loaders import load_from_dict
+
+from microcosm_pubsub.errors import PublishBatchError, PublishQueueFullError
+from microcosm_pubsub.publisher import BackgroundPublisher
+from microcosm_pubsub.tests.fixtures import DerivedSchema
+
+
+MESSAGE_ID = "message-id"
+
+
+def create_message(index=0):
+    message = MagicMock()
+    message.media_type = DerivedSchema.MEDIA_TYPE
+    message.index = index
+    return message
+
+
+def test_async_produce():
+    loader = load_from_dict(
+        sns_producer=dict(
+            async_publish=True,
+        ),
+        sns_topic_arns=dict(
+            default="topic",
+        ),
+    )
+    graph = create_object_graph("example", testing=True, loader=loader, cache=NaiveCache())
+    graph.sns_producer.sns_client.publish.return_value = dict(MessageId=MESSAGE_ID)
+
+    future = graph.sns_producer.produce(DerivedSchema.MEDIA_TYPE, data="data", uri="http://example.com")
+    graph.sns_producer.close()
+
+    assert_that(future.result(timeout=1), is_(equal_to(MESSAGE_ID)))
+    assert_that(graph.sns_producer.sns_client.publish.call_count, is_(equal_to(1)))
+
+
+class TestBackgroundPublisher:
+
+    def setup_method(self):
+        self.producer = MagicMock()
+        self.producer.publish_message.return_value = MESSAGE_ID
+        self.producer.publish_batch.side_effect = lambda messages: [
+            f"{MESSAGE_ID}-{message.index}" for message in messages
+        ]
+
+    def create_publisher(self, max_queue_size=100, queue_full_policy="block"):
+        return BackgroundPublisher(self.producer, max_queue_size, queue_full_policy=queue_full_policy)
+
+    def test_queued_messages_are_published_in_batches(self):
+        publisher = self.create_publisher()
+        with patch.object(publisher, "start"):
+            futures = [publisher.submit(create_message(index)) for index in range(12)]
+
+        publisher.start()
+        publisher.close()
+
+        assert_that(
+            [len(call[0][0]) for call in self.producer.publish_batch.call_args_list],
+            contains_exactly(10, 2),
+        )
+        assert_that(
+            [future.result(timeout=1) for future in futures],
+            is_(equal_to([f"{MESSAGE_ID}-{index}" for index in range(12)])),
+        )
+
+    def test_single_messages_are_published_individually(self):
+        publisher = self.create_publisher()
+
+        future = publisher.submit(create_message())
+        publisher.close()
+
+        assert_that(future.result(timeout=1), is_(equal_to(MESSAGE_ID)))
+        assert_that(self.producer.publish_batch.call_count, is_(equal_to(0)))
+
+    def test_partial_batch_failure(self):
+        self.producer.publish_batch.side_effect = PublishBatchError(
+            "failed",
+            message_ids=[MESSAGE_ID, None],
+            failures=[dict(Id="1")],
+        )
+        publisher = self.create_publisher()
+        with patch.object(publisher, "start"):
+            futures = [publisher.submit(create_message(index)) for index in range(2)]
+
+        publisher.start()
+        publisher.close()
+
+        assert_that(futures[0].result(timeout=1), is_(equal_to(MESSAGE_ID)))
+        assert_that(futures[1].exception(timeout=1), is_(instance_of(PublishBatchError)))
+
+    def test_drop_when_full(self):
+        publisher = self.create_publisher(max_queue_size=1, queue_full_policy="drop")
+        with patch.object(publisher, "start"):
+            publisher.submit(create_message())
+            future = publisher.submit(create_message())
+
+        assert_that(future.exception(timeout=0), is_(instance_of(PublishQueueFullError)))
+
+    def test_raise_when_full(self):
+        publisher = self.create_publisher(max_queue_size=1, queue_full_policy="raise")
+        with patch.object(publisher, "start"):
+            publisher.submit(create_message())
+            assert_that(
+                calling(publisher.submit).with_args(create_message()),
+                raises(PublishQueueFullError),
+            )
+
+    def test_unsupported_policy(self):
+        assert_that(
+            calling(self.create_publisher).with_args(queue_full_policy="ignore"),
+            raises(ValueError),
+        )
@@ -2,20 +2,25 @@
 Test registry.
 
 """
+from unittest.mock import patch
+
 from hamcrest import (
     assert_that,
     calling,
     equal_to,
+    has_length,
     instance_of,
     is_,
+    not_,
     raises,
+    same_instance,
 )
 from marshmallow import ValidationError, fields
 from microcosm.api import binding, create_object_graph
 
 from microcosm_pubsub.codecs import DEFAULT_MEDIA_TYPE, PubSubMessageCodec, PubSubMessageSchema
-from microcosm_pubsub.conventions import changed
-from microcosm_pubsub.conventions.messages import ChangedURIMessageSchema
+from microcosm_pubsub.conventions import changed, created
+from microcosm_pubsub.conventions.messages import ChangedURIMessageSchema, URIMessageSchema
 from microcosm_pubsub.decorators import schema
 from microcosm_pubsub.registry import AlreadyRegisteredError
 from microcosm_pubsub.tests.fixtures import DerivedSchema, ExampleDaemon, noop_handler
@@ -58,6 +63,10 @@ class WildcardSchema(PubSubMessageSchema):
     MEDIA_TYPE = "application/vnd.microcosm.wildcard.*"
 
 
+class CachedResourceSchema(PubSubMessageSchema):
+    MEDIA_TYPE = created("CachedResource")
+
+
 class TestDerivedPubSubMessageCodecRegistry:
 
     def setup_method(self):
@@ -117,6 +126,57 @@ class TestDerivedPubSubMessageCodecRegistry:
         assert_that(schema, is_(instance_of(PubSubMessageCodec)))
         assert_that(schema.schema, is_(instance_of(ChangedURIMessageSchema)))
 
+    def test_find_cached(self):
+        """
+        Find returns the same codec for the same media type.
+
+        """
+        assert_that(
+            self.registry.find(DerivedSchema.MEDIA_TYPE),
+            is_(same_instance(self.registry.find(DerivedSchema.MEDIA_TYPE))),
+        )
+
+    def test_find_cache_invalidated_by_register(self):
+        """
+        Registering a schema invalidates cached codecs.
+
+        """
+        media_type = created("CachedResource")
+        assert_that(self.registry.find(media_type).schema, is_(instance_of(URIMessageSchema)))
+
+        self.registry.register(media_type, CachedResourceSchema)
+
+        assert_that(self.registry.find(media_type).schema, is_(instance_of(CachedResourceSchema)))
+
+    def test_find_does_not_cache_codecs_created_before_register(self):
+        """
+        A codec created while a schema is registered is not cached.
+
+        """
+        media_type = created("CachedResource")
+        create_codec = self.registry.create_codec
+
+        def register_while_creating(media_type):
+            codec = create_codec(media_type)
+            self.registry.register(media_type, CachedResourceSchema)
+            return codec
+
+        with patch.object(self.registry, "create_codec", side_effect=register_while_creating):
+            assert_that(self.registry.find(media_type).schema, is_(instance_of(URIMessageSchema)))
+
+        assert_that(self.registry.find(media_type).schema, is_(instance_of(CachedResourceSchema)))
+
+    def test_find_cache_is_bounded(self):
+        codec_cache_size = self.registry.codec_cache_size
+        self.registry.codec_cache_size = 1
+        try:
+            first = self.registry.find(DerivedSchema.MEDIA_TYPE)
+            self.registry.find(BarSchema.MEDIA_TYPE)
+            assert_that(self.registry._codecs, has_length(1))
+            assert_that(self.registry.find(DerivedSchema.MEDIA_TYPE), is_(not_(same_instance(first))))
+        finally:
+            self.registry.codec_cache_size = codec_cache_size
+
     def test_serialize_dump_only_field(self):
         """
         `dump_only` fields are ignored by `schema.validate`, meaning they'll
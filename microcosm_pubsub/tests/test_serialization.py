@@ -0,0 +1,112 @@
+"""
+JSON backend tests.
+
+"""
+from json import dumps as stdlib_dumps, loads as stdlib_loads
+from math import inf, isnan, nan
+
+import pytest
+from hamcrest import (
+    assert_that,
+    calling,
+    equal_to,
+    instance_of,
+    is_,
+    raises,
+)
+from microcosm.api import create_object_graph
+from microcosm.caching import NaiveCache
+from microcosm.loaders import load_from_dict
+
+from microcosm_pubsub import serialization
+from microcosm_pubsub.serialization import (
+    JSONBackend,
+    OrjsonJSONBackend,
+    StdlibJSONBackend,
+    UjsonJSONBackend,
+    dumps,
+    loads,
+)
+
+
+BACKENDS = [
+    backend_cls
+    for backend_cls in (OrjsonJSONBackend, StdlibJSONBackend, UjsonJSONBackend)
+    if backend_cls.is_available()
+]
+
+
+@pytest.mark.parametrize("backend_cls", BACKENDS)
+def test_round_trip(backend_cls):
+    backend = backend_cls()
+    value = dict(
+        mediaType="application/vnd.globality.pubsub._.created.foo",
+        opaqueData={"x-request-id": "request-id"},
+        uri="http://example.com/api/foo/1",
+        values=[1, 2.5, None, True, "é"],
+    )
+
+    encoded = backend.dumps(value)
+
+    assert_that(encoded, is_(instance_of(str)))
+    assert_that(stdlib_loads(encoded), is_(equal_to(value)))
+    assert_that(backend.loads(encoded), is_(equal_to(value)))
+
+
+def test_orjson_falls_back_for_unsupported_values():
+    if not OrjsonJSONBackend.is_available():
+        pytest.skip("orjson is not installed")
+
+    value = dict(big=2 ** 70)
+    assert_that(stdlib_loads(OrjsonJSONBackend().dumps(value)), is_(equal_to(value)))
+
+
+@pytest.mark.parametrize("backend_cls", BACKENDS)
+def test_loads_non_finite_floats(backend_cls):
+    value = backend_cls().loads(stdlib_dumps(dict(nan=nan, inf=inf)))
+
+    assert_that(isnan(value["nan"]), is_(equal_to(True)))
+    assert_that(value["inf"], is_(equal_to(inf)))
+
+
+def test_default_backend_round_trip():
+    assert_that(serialization._backend, is_(instance_of(StdlibJSONBackend)))
+
+    value = loads(dumps(dict(big=2 ** 100, nan=nan)))
+
+    assert_that(value["big"], is_(equal_to(2 ** 100)))
+    assert_that(isnan(value["nan"]), is_(equal_to(True)))
+
+
+def test_choose_unknown_backend():
+    assert_that(
+        calling(JSONBackend.choose_json_backend).with_args("UnknownJSONBackend"),
+        raises(Exception),
+    )
+
+
+def test_configure_json_backend():
+    backend = serialization._backend
+    loader = load_from_dict(
+        pubsub_json_backend=dict(
+            name="StdlibJSONBackend",
+        ),
+    )
+    try:
+        graph = create_object_graph("example", testing=True, loader=loader, cache=NaiveCache())
+        assert_that(graph.pubsub_json_backend, is_(instance_of(StdlibJSONBackend)))
+        assert_that(serialization._backend, is_(instance_of(StdlibJSONBackend)))
+        assert_that(loads(dumps(dict(foo="bar"))), is_(equal_to(dict(foo="bar"))))
+    finally:
+        serialization.use_json_backend(backend)
+
+
+def test_unnamed_json_backend_is_unchanged():
+    backend = serialization._backend
+    try:
+        serialization.use_json_backend(StdlibJSONBackend())
+        graph = create_object_graph("example", testing=True, cache=NaiveCache())
+        assert_that(graph.pubsub_json_backend, is_(instance_of(StdlibJSONBackend)))
+        assert_that(serialization._backend, is_(instance_of(StdlibJSONBackend)))
+    finally:
+        serialization.use_json_backend(backend)
@@ -6,6 +6,7 @@ from microcosm.api import create_object_graph
 
 from microcosm_pubsub import tracing
 from microcosm_pubsub.message import SQSMessage
+from microcosm_pubsub.producer import DeferredProducer
 from microcosm_pubsub.result import MessageHandlingResultType
 from microcosm_pubsub.tests.fixtures import DerivedSchema, ExampleDaemon
 
@@ -24,7 +25,8 @@ def test_trace_message_publish():
     with patch.object(tracing, "oneagent") as oneagent, \
             patch.object(tracing, "ChannelType"), \
             patch.object(tracing, "Channel") as channel, \
-            patch.object(tracing, "MessagingDestinationType") as messagingdestinationtype:
+            patch.object(tracing, "MessagingDestinationType") as messagingdestinationtype, \
+            patch("microcosm_pubsub.producer.add_trace_to_message") as add_trace_to_message:
         sdk = oneagent.get_sdk.return_value
         tracer_manager = sdk.trace_outgoing_message.return_value
         tracer_obj = tracer_manager.__enter__.return_value
@@ -51,6 +53,8 @@ def test_trace_message_publish():
             TopicArn='topic-name'
         )
         message = json.loads(graph.sns_producer.sns_client.publish.call_args[1]['Message'])
+        # the tag was added before encoding; the message was not re-encoded
+        assert_that(add_trace_to_message.call_count, equal_to(0))
         assert_that(message["opaqueData"]["x-request-id"], equal_to("req-id-1234"))
         assert_that(message["opaqueData"]["x-rerquest-service"], equal_to("foo"))
         assert_that(message["opaqueData"]["x-dynatrace"], equal_to("tag-1234"))
@@ -75,6 +79,35 @@ def test_trace_message_publish():
         tracer_manager.__exit__.assert_called_once_with(None, None, None)
 
 
+def test_trace_deferred_message_publish():
+    def loader(metadata):
+        return dict(
+            sns_topic_arns=dict(
+                default="topic-name",
+            )
+        )
+
+    graph = create_object_graph("example", testing=True, loader=loader)
+    graph.sns_producer.sns_client.publish.return_value = dict(MessageId="message-id-1234")
+
+    with patch.object(tracing, "oneagent") as oneagent, \
+            patch.object(tracing, "ChannelType"), \
+            patch.object(tracing, "Channel"), \
+            patch.object(tracing, "MessagingDestinationType"):
+        sdk = oneagent.get_sdk.return_value
+        tracer_obj = sdk.trace_outgoing_message.return_value.__enter__.return_value
+        tracer_obj.outgoing_dynatrace_string_tag = "tag-1234"
+
+        with DeferredProducer(graph.sns_producer) as producer:
+            producer.produce(DerivedSchema.MEDIA_TYPE, data="data")
+
+        message = json.loads(graph.sns_producer.sns_client.publish.call_args[1]['Message'])
+        assert_that(message["opaqueData"]["x-dynatrace"], equal_to("tag-1234"))
+        sdk.trace_outgoing_message.assert_called_once_with(
+            sdk.create_messaging_system_info.return_value
+        )
+
+
 def test_trace_message_dispatch():
     daemon = ExampleDaemon.create_for_testing()
     graph = daemon.graph
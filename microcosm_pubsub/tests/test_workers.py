@@ -0,0 +1,111 @@
+"""
+Worker process tests.
+
+"""
+from concurrent.futures.process import BrokenProcessPool
+from json import dumps
+from os import _exit
+
+from hamcrest import (
+    assert_that,
+    calling,
+    contains_exactly,
+    equal_to,
+    has_properties,
+    is_,
+    none,
+    not_,
+    raises,
+)
+from microcosm.caching import NaiveCache
+from microcosm.loaders import load_from_dict
+
+from microcosm_pubsub.conventions import created
+from microcosm_pubsub.result import MessageHandlingResultType
+from microcosm_pubsub.tests.fixtures import DerivedSchema, ExampleDaemon
+
+
+MESSAGE_ID = "message-id"
+
+
+class TestWorkers:
+
+    def setup_method(self):
+        loader = load_from_dict(
+            sqs_message_dispatcher=dict(
+                processes=1,
+            ),
+        )
+        self.daemon = ExampleDaemon.create_for_testing(cache=NaiveCache(), loader=loader)
+        self.dispatcher = self.daemon.graph.sqs_message_dispatcher
+        self.dispatcher.start_process_pool(self.daemon)
+
+    def teardown_method(self):
+        self.dispatcher.close()
+
+    def receive_messages(self):
+        sqs_client = self.dispatcher.sqs_consumer.sqs_client
+        sqs_client.receive_message.return_value = dict(Messages=[
+            dict(
+                MessageId=f"{MESSAGE_ID}-{index}",
+                ReceiptHandle=f"receipt-handle-{index}",
+                Body=dumps(dict(
+                    Message=dumps(dict(
+                        mediaType=media_type,
+                        data="data",
+                        uri="http://example.com",
+                    )),
+                )),
+            )
+            for index, media_type in enumerate([
+                DerivedSchema.MEDIA_TYPE,
+                created("IgnoredResource"),
+            ])
+        ])
+        return sqs_client
+
+    def test_handle_batch_in_worker_processes(self):
+        """
+        Messages are handled by workers and resolved by the parent.
+
+        """
+        sqs_client = self.receive_messages()
+
+        results = self.dispatcher.handle_batch(bound_handlers=self.daemon.bound_handlers)
+
+        assert_that(
+            results,
+            contains_exactly(
+                has_properties(
+                    exc_info=none(),
+                    media_type=DerivedSchema.MEDIA_TYPE,
+                    result=MessageHandlingResultType.SUCCEEDED,
+                ),
+                has_properties(
+                    media_type=created("IgnoredResource"),
+                    result=MessageHandlingResultType.IGNORED,
+                ),
+            ),
+        )
+        assert_that(sqs_client.delete_message.call_count, is_(equal_to(2)))
+
+    def test_restart_broken_process_pool(self):
+        """
+        A pool that broke because a worker died is replaced for later batches.
+
+        """
+        broken_pool = self.dispatcher.process_pool
+        assert_that(calling(broken_pool.submit(_exit, 1).result), raises(BrokenProcessPool))
+        sqs_client = self.receive_messages()
+
+        results = self.dispatcher.handle_batch(bound_handlers=self.daemon.bound_handlers)
+
+        assert_that(self.dispatcher.process_pool, is_(not_(broken_pool)))
+        assert_that(
+            results,
+            contains_exactly(
+                has_properties(result=MessageHandlingResultType.SUCCEEDED),
+                has_properties(result=MessageHandlingResultType.IGNORED),
+            ),
+        )
+        assert_that(sqs_client.delete_message.call_count, is_(equal_to(2)))
@@ -4,13 +4,13 @@ Support optional tracing using Dynatrace oneagent.
 If the dynatrace SDK is not installed, does nothing.
 
 """
-import json
 from contextlib import contextmanager
 
 from microcosm.opaque import Opaque
 from microcosm_pubsub.constants import AWS_SNS, AWS_SQS, OPAQUE_TAG_KEY, REQUEST_ID_KEY
 
 from microcosm_pubsub.message import SQSMessage
+from microcosm_pubsub.serialization import dumps, loads
 
 
 try:
@@ -38,9 +38,9 @@ def add_trace_to_message(tracer, pubsub_message):
     tag = tracer.outgoing_dynatrace_string_tag
     if tag:
         try:
-            message = json.loads(pubsub_message.message)
+            message = loads(pubsub_message.message)
             message["opaqueData"][OPAQUE_TAG_KEY] = tag
-            pubsub_message.message = json.dumps(message)
+            pubsub_message.message = dumps(message)
         except Exception:
             pass
 
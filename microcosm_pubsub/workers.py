@@ -0,0 +1,80 @@
+"""
+Handle messages in worker processes.
+
+CPU-bound handlers are limited to a single core by the GIL. When the dispatcher is configured
+with worker processes, decoded messages are sent to a process pool instead. Each worker builds
+its own object graph (and bound handlers) from the same daemon class and arguments as the parent,
+handles the message, and returns the `MessageHandlingResult`.
+
+Messages are acked or nacked by the parent: workers never talk to SQS.
+
+"""
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from microcosm_pubsub.message import SQSMessage
+
+
+# The daemon owned by the current worker process (if any)
+_daemon = None
+
+
+def initialize_worker(daemon_cls, args):
+    """
+    Build the worker's object graph.
+
+    """
+    global _daemon
+
+    daemon = daemon_cls()
+    daemon.args = args
+    daemon.graph = daemon.create_object_graph(args)
+    _daemon = daemon
+
+
+def handle_in_worker(message_dict):
+    """
+    Handle a message in a worker process.
+
+    Logging and error reporting happen in the worker; resolving the message does not.
+
+    """
+    message = SQSMessage(consumer=None, **message_dict)
+    instance = _daemon.graph.sqs_message_dispatcher.handle_message(
+        message,
+        _daemon.bound_handlers,
+        resolve=False,
+    )
+    # tracebacks cannot be pickled and have already been logged and reported
+    instance.exc_info = None
+    return instance
+
+
+def to_message_dict(message):
+    """
+    Convert a message to the (picklable) arguments needed to recreate it.
+
+    """
+    return dict(
+        approximate_receive_count=message.approximate_receive_count,
+        content=message.content,
+        media_type=message.media_type,
+        message_id=message.message_id,
+        receipt_handle=message.receipt_handle,
+        topic_arn=message.topic_arn,
+    )
+
+
+def create_process_pool(daemon, processes):
+    """
+    Create a pool of worker processes for a daemon.
+
+    Workers are spawned (not forked) so that they do not inherit the parent's threads.
+
+    """
+    return ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=get_context("spawn"),
+        initializer=initialize_worker,
+        initargs=(type(daemon), daemon.args),
+    )
@@ -27,6 +27,7 @@ setup(
         "requests>=2.31.0"
     ],
     extras_require={
+        "json": "orjson>=3.0.0",
         "metrics": "microcosm-metrics>=2.5.0",
         "sentry": "sentry-sdk>=0.14.4",
         "build": [
@@ -45,10 +46,14 @@ setup(
         ],
         "microcosm.factories": [
             "pubsub_message_schema_registry = microcosm_pubsub.registry:configure_schema_registry",
+            "pubsub_json_backend = microcosm_pubsub.serialization:configure_json_backend",
             "pubsub_lifecycle_change = microcosm_pubsub.conventions:LifecycleChange",
             "pubsub_send_batch_metrics = microcosm_pubsub.metrics:PubSubSendBatchMetrics",
             "pubsub_send_metrics = microcosm_pubsub.metrics:PubSubSendMetrics",
             "pubsub_producer_metrics = microcosm_pubsub.metrics:PubSubProducerMetrics",
+            "pubsub_metrics_aggregator = microcosm_pubsub.metrics:PubSubMetricsAggregator",
+            "pubsub_outbox_relay = microcosm_pubsub.outbox:OutboxRelay",
+            "pubsub_outbox_store = microcosm_pubsub.outbox:configure_outbox_store",
             "sqs_message_context = microcosm_pubsub.context:SQSMessageContext",
             "sqs_consumer = microcosm_pubsub.consumer:configure_sqs_consumer",
             "sqs_envelope = microcosm_pubsub.envelope:configure_sqs_envelope",